@@ -109,3 +109,15 @@ def rcon_server():
     yield server
     server.shutdown()
     thread.join()
+
+
+@pytest.yield_fixture
+def a2s_server():
+    server = valve.testing.TestA2SServer()
+    thread = threading.Thread(
+        target=server.serve_forever, kwargs={"poll_interval": 0.05})
+    thread.start()
+    yield server
+    server.shutdown()
+    thread.join()
+    server.server_close()
@@ -0,0 +1,744 @@
+# -*- coding: utf-8 -*-
+
+from __future__ import (absolute_import,
+                        unicode_literals, print_function, division)
+
+import bz2
+import sys
+import threading
+import time
+import zlib
+
+import pytest
+
+import valve.source
+import valve.source.a2s
+from valve.source import messages
+
+
+NO_SPLIT = messages.Header(split=messages.NO_SPLIT).encode()
+INFO_REQUEST = NO_SPLIT + messages.InfoRequest().encode()
+INFO_RESPONSE = NO_SPLIT + messages.InfoResponse(
+    response_type=0x49,
+    protocol=17,
+    server_name="Test Server",
+    map="ctf_2fort",
+    folder="tf",
+    game="Team Fortress",
+    app_id=440,
+    player_count=1,
+    max_players=24,
+    bot_count=0,
+    server_type=100,
+    platform=108,
+    password_protected=0,
+    vac_enabled=1,
+    version="1.0",
+).encode()
+PLAYERS_RESPONSE = NO_SPLIT + messages.PlayersResponse(
+    response_type=0x44,
+    player_count=1,
+    players=[messages.PlayerEntry(
+        index=0, name="Player", score=5, duration=1.0)],
+).encode()
+RULES_RESPONSE = NO_SPLIT + messages.RulesResponse(
+    response_type=0x45,
+    rule_count=1,
+    rules=[messages.RulesResponse.fields[2].element(
+        key="mp_friendlyfire", value="0")],
+).encode()
+
+
+def challenge_response(challenge):
+    return NO_SPLIT + messages.GetChallengeResponse(
+        response_type=0x41, challenge=challenge).encode()
+
+
+def info_request(challenge):
+    return NO_SPLIT + messages.InfoRequest(challenge=challenge).encode()
+
+
+def players_request(challenge):
+    return NO_SPLIT + messages.PlayersRequest(challenge=challenge).encode()
+
+
+def rules_request(challenge):
+    return NO_SPLIT + messages.RulesRequest(challenge=challenge).encode()
+
+
+def compressed_fragments(payload, size=16, decompressed_size=None, crc32=None):
+    compressed = bz2.compress(payload)
+    compressed = messages.FragmentCompressionData(
+        decompressed_size=len(payload) if decompressed_size is None
+        else decompressed_size,
+        crc32=zlib.crc32(payload) if crc32 is None else crc32,
+    ).encode() + compressed
+    parts = [compressed[offset:offset + size]
+             for offset in range(0, len(compressed), size)]
+    return [messages.Header(split=messages.SPLIT).encode()
+            + messages.Fragment(
+                message_id=-(1 << 31) + 5,
+                fragment_count=len(parts),
+                fragment_id=fragment_id,
+                mtu=1248,
+            ).encode() + part for fragment_id, part in enumerate(parts)]
+
+
+class TestChallengeCache(object):
+
+    def test_get_missing(self):
+        cache = valve.source.a2s.ChallengeCache()
+        assert cache.get(("192.0.2.0", 27015)) is None
+
+    def test_set(self):
+        cache = valve.source.a2s.ChallengeCache()
+        cache.set(("192.0.2.0", 27015), 1234)
+        assert cache.get(("192.0.2.0", 27015)) == 1234
+        assert len(cache) == 1
+
+    def test_expired(self, monkeypatch):
+        cache = valve.source.a2s.ChallengeCache(ttl=10.0)
+        monkeypatch.setattr(valve.source.a2s.monotonic,
+                            "monotonic", lambda: 100.0)
+        cache.set(("192.0.2.0", 27015), 1234)
+        monkeypatch.setattr(valve.source.a2s.monotonic,
+                            "monotonic", lambda: 110.0)
+        assert cache.get(("192.0.2.0", 27015)) is None
+        assert len(cache) == 0
+
+    def test_set_prunes_expired(self, monkeypatch):
+        cache = valve.source.a2s.ChallengeCache(ttl=10.0)
+        monkeypatch.setattr(valve.source.a2s.monotonic,
+                            "monotonic", lambda: 100.0)
+        cache.set(("192.0.2.0", 27015), 1234)
+        cache.set(("192.0.2.1", 27015), 1234)
+        monkeypatch.setattr(valve.source.a2s.monotonic,
+                            "monotonic", lambda: 105.0)
+        cache.set(("192.0.2.0", 27015), 5678)
+        monkeypatch.setattr(valve.source.a2s.monotonic,
+                            "monotonic", lambda: 110.0)
+        cache.set(("192.0.2.2", 27015), 1234)
+        assert len(cache) == 2
+        assert cache.get(("192.0.2.0", 27015)) == 5678
+
+    @pytest.mark.skipif(not hasattr(sys, "setswitchinterval"),
+                        reason="requires sys.setswitchinterval")
+    def test_threads(self):
+        cache = valve.source.a2s.ChallengeCache(ttl=0.0)
+        errors = []
+
+        def set_(host):
+            try:
+                for port in range(10000):
+                    cache.set((host, port), port)
+            except Exception as exc:
+                errors.append(exc)
+
+        threads = [threading.Thread(target=set_,
+                                    args=("192.0.2.{}".format(i),))
+                   for i in range(6)]
+        # Switch threads often so that set() is interrupted whilst pruning.
+        interval = sys.getswitchinterval()
+        sys.setswitchinterval(1e-6)
+        try:
+            for thread in threads:
+                thread.start()
+            for thread in threads:
+                thread.join()
+        finally:
+            sys.setswitchinterval(interval)
+        assert not errors
+
+    def test_discard(self):
+        cache = valve.source.a2s.ChallengeCache()
+        cache.set(("192.0.2.0", 27015), 1234)
+        cache.discard(("192.0.2.0", 27015))
+        cache.discard(("192.0.2.0", 27015))
+        assert cache.get(("192.0.2.0", 27015)) is None
+
+
+class TestRTTEstimator(object):
+
+    def test_initial(self):
+        rtt = valve.source.a2s.RTTEstimator(initial=1.0)
+        assert rtt.timeout(("192.0.2.0", 27015)) == 1.0
+        assert rtt.get(("192.0.2.0", 27015)) is None
+
+    def test_observe(self):
+        rtt = valve.source.a2s.RTTEstimator(minimum=0.2)
+        rtt.observe(("192.0.2.0", 27015), 0.1)
+        assert rtt.get(("192.0.2.0", 27015)) == (0.1, 0.05)
+        assert rtt.timeout(("192.0.2.0", 27015)) == pytest.approx(0.3)
+        rtt.observe(("192.0.2.0", 27015), 0.1)
+        srtt, rttvar = rtt.get(("192.0.2.0", 27015))
+        assert srtt == pytest.approx(0.1)
+        assert rttvar == pytest.approx(0.0375)
+        assert rtt.timeout(("192.0.2.0", 27015)) == pytest.approx(0.25)
+
+    def test_timed_out(self):
+        rtt = valve.source.a2s.RTTEstimator(initial=1.0, maximum=3.0)
+        rtt.timed_out(("192.0.2.0", 27015))
+        assert rtt.timeout(("192.0.2.0", 27015)) == 2.0
+        rtt.timed_out(("192.0.2.0", 27015))
+        rtt.timed_out(("192.0.2.0", 27015))
+        assert rtt.timeout(("192.0.2.0", 27015)) == 3.0
+        rtt.observe(("192.0.2.0", 27015), 0.5)
+        assert rtt.timeout(("192.0.2.0", 27015)) == pytest.approx(1.5)
+
+    def test_retries(self):
+        rtt = valve.source.a2s.RTTEstimator(
+            initial=1.0, minimum=0.2, max_retries=3)
+        assert rtt.retries(("192.0.2.0", 27015), 5.0) == 1
+        assert rtt.retries(("192.0.2.0", 27015), 0.5) == 0
+        rtt.observe(("192.0.2.0", 27015), 0.01)
+        assert rtt.retries(("192.0.2.0", 27015), 5.0) == 3
+
+    def test_invalid(self):
+        with pytest.raises(ValueError):
+            valve.source.a2s.RTTEstimator(initial=10.0, maximum=5.0)
+
+
+class TestUnresponsiveCache(object):
+
+    def test_threshold(self):
+        cache = valve.source.a2s.UnresponsiveCache(threshold=2)
+        cache.failure(("192.0.2.0", 27015))
+        assert not cache.unresponsive(("192.0.2.0", 27015))
+        cache.check(("192.0.2.0", 27015))
+        cache.failure(("192.0.2.0", 27015))
+        assert cache.unresponsive(("192.0.2.0", 27015))
+        with pytest.raises(valve.source.NoResponseError):
+            cache.check(("192.0.2.0", 27015))
+
+    def test_backoff(self, monkeypatch):
+        cache = valve.source.a2s.UnresponsiveCache(
+            base=10.0, maximum=25.0, threshold=1)
+        monkeypatch.setattr(valve.source.a2s.monotonic,
+                            "monotonic", lambda: 100.0)
+        cache.failure(("192.0.2.0", 27015))
+        monkeypatch.setattr(valve.source.a2s.monotonic,
+                            "monotonic", lambda: 110.0)
+        assert not cache.unresponsive(("192.0.2.0", 27015))
+        cache.failure(("192.0.2.0", 27015))
+        monkeypatch.setattr(valve.source.a2s.monotonic,
+                            "monotonic", lambda: 129.0)
+        assert cache.unresponsive(("192.0.2.0", 27015))
+        monkeypatch.setattr(valve.source.a2s.monotonic,
+                            "monotonic", lambda: 130.0)
+        cache.failure(("192.0.2.0", 27015))
+        monkeypatch.setattr(valve.source.a2s.monotonic,
+                            "monotonic", lambda: 155.0)
+        assert not cache.unresponsive(("192.0.2.0", 27015))
+
+    def test_success(self):
+        cache = valve.source.a2s.UnresponsiveCache(threshold=1)
+        cache.failure(("192.0.2.0", 27015))
+        cache.success(("192.0.2.0", 27015))
+        assert not cache.unresponsive(("192.0.2.0", 27015))
+        assert len(cache) == 0
+
+    def test_server_querier(self, a2s_server):
+        cache = valve.source.a2s.UnresponsiveCache(threshold=1)
+        with valve.source.a2s.ServerQuerier(
+                a2s_server.server_address, 0.1,
+                valve.source.a2s.ChallengeCache(),
+                unresponsive=cache) as server:
+            for _ in range(2):
+                with pytest.raises(valve.source.NoResponseError):
+                    server.info()
+        assert len(a2s_server.received) == 1
+        assert cache.unresponsive(a2s_server.server_address)
+
+    def test_server_querier_success(self, a2s_server):
+        a2s_server.respond(INFO_REQUEST, INFO_RESPONSE)
+        cache = valve.source.a2s.UnresponsiveCache(threshold=2)
+        cache.failure(a2s_server.server_address)
+        with valve.source.a2s.ServerQuerier(
+                a2s_server.server_address, 1.0,
+                valve.source.a2s.ChallengeCache(),
+                unresponsive=cache) as server:
+            server.info()
+        assert len(cache) == 0
+
+    def test_scan(self, a2s_server):
+        cache = valve.source.a2s.UnresponsiveCache(threshold=1)
+        for _ in range(2):
+            results = list(valve.source.a2s.scan(
+                [a2s_server.server_address], timeout=0.1,
+                unresponsive=cache))
+            assert isinstance(results[0][1], valve.source.NoResponseError)
+        assert len(a2s_server.received) == 1
+        a2s_server.respond(INFO_REQUEST, INFO_RESPONSE)
+        cache = valve.source.a2s.UnresponsiveCache(threshold=2)
+        cache.failure(a2s_server.server_address)
+        results = list(valve.source.a2s.scan(
+            [a2s_server.server_address], unresponsive=cache))
+        assert results[0][1]["info"]["map"] == "ctf_2fort"
+        assert len(cache) == 0
+
+
+class TestReassembler(object):
+
+    def test_no_split(self):
+        reassembler = valve.source.a2s._Reassembler()
+        assert reassembler.feed(INFO_RESPONSE) == INFO_RESPONSE[4:]
+
+    def test_split_interleaved(self):
+        split = messages.Header(split=messages.SPLIT).encode()
+
+        def fragments(message_id, payload):
+            return [split + messages.Fragment(
+                message_id=message_id,
+                fragment_count=3,
+                fragment_id=fragment_id,
+                mtu=64,
+            ).encode() + payload[offset:offset + 20]
+                for fragment_id, offset in enumerate(range(0, 60, 20))]
+
+        info = fragments(1, INFO_RESPONSE[4:64])
+        rules = fragments(2, RULES_RESPONSE[4:64])
+        reassembler = valve.source.a2s._Reassembler()
+        buffer_ = bytearray(1024)
+        results = []
+        for data in [info[2], rules[1], info[0], info[0],
+                     rules[0], info[1], rules[2]]:
+            # The receive buffer is reused for every datagram
+            buffer_[:len(data)] = data
+            payload = reassembler.feed(memoryview(buffer_)[:len(data)])
+            if payload is not None:
+                results.append(payload)
+        assert results == [INFO_RESPONSE[4:64], RULES_RESPONSE[4:64]]
+
+    def test_split_message_id_bit_16(self):
+        payload = INFO_RESPONSE[4:]
+        parts = [payload[:20], payload[20:]]
+        reassembler = valve.source.a2s._Reassembler()
+        for fragment_id, part in enumerate(parts):
+            result = reassembler.feed(
+                messages.Header(split=messages.SPLIT).encode()
+                + messages.Fragment(
+                    message_id=(1 << 16) | 3,
+                    fragment_count=len(parts),
+                    fragment_id=fragment_id,
+                    mtu=1248,
+                ).encode() + part)
+        assert result == payload
+
+    def test_split_exceeds_mtu(self):
+        data = (messages.Header(split=messages.SPLIT).encode()
+                + messages.Fragment(
+                    message_id=1,
+                    fragment_count=2,
+                    fragment_id=0,
+                    mtu=8,
+                ).encode() + b"123456789")
+        reassembler = valve.source.a2s._Reassembler()
+        with pytest.raises(messages.BrokenMessageError):
+            reassembler.feed(data)
+
+    def test_split_discard_oldest(self, monkeypatch):
+        monkeypatch.setattr(valve.source.a2s, "_MAX_SPLIT_MESSAGES", 2)
+        split = messages.Header(split=messages.SPLIT).encode()
+
+        def fragment(message_id, fragment_id):
+            return split + messages.Fragment(
+                message_id=message_id,
+                fragment_count=2,
+                fragment_id=fragment_id,
+                mtu=8,
+            ).encode() + b"ab"
+
+        reassembler = valve.source.a2s._Reassembler()
+        for message_id in range(3):
+            assert reassembler.feed(fragment(message_id, 0)) is None
+        assert reassembler.feed(fragment(0, 1)) is None
+        assert reassembler.feed(fragment(2, 1)) == b"abab"
+
+    def test_pool(self):
+        pool = valve.source.a2s._BufferPool()
+        buffer_ = pool.acquire(16)
+        assert len(buffer_) == 16
+        pool.release(buffer_)
+        assert pool.acquire(8) is buffer_
+        assert pool.acquire(8) is not buffer_
+
+    def test_pool_large(self):
+        pool = valve.source.a2s._BufferPool()
+        buffer_ = pool.acquire(
+            valve.source.a2s._MAX_POOLED_BUFFER_SIZE + 1)
+        pool.release(buffer_)
+        assert pool.acquire(8) is not buffer_
+
+    def test_split_mtu_too_large(self):
+        data = (messages.Header(split=messages.SPLIT).encode()
+                + messages.Fragment(
+                    message_id=1,
+                    fragment_count=255,
+                    fragment_id=0,
+                    mtu=32767,
+                ).encode() + b"123")
+        reassembler = valve.source.a2s._Reassembler()
+        with pytest.raises(messages.BrokenMessageError):
+            reassembler.feed(data)
+        assert not reassembler._messages
+
+    def test_compressed(self):
+        payload = RULES_RESPONSE[4:] * 20
+        fragments = compressed_fragments(payload)
+        assert len(fragments) > 2
+        reassembler = valve.source.a2s._Reassembler()
+        for fragment in fragments[:-1]:
+            assert reassembler.feed(fragment) is None
+        assert reassembler.feed(fragments[-1]) == payload
+
+    def test_compressed_out_of_order(self):
+        payload = RULES_RESPONSE[4:] * 20
+        fragments = compressed_fragments(payload)
+        reassembler = valve.source.a2s._Reassembler()
+        for fragment in reversed(fragments[1:]):
+            assert reassembler.feed(fragment) is None
+        assert reassembler.feed(fragments[0]) == payload
+
+    def test_compressed_bad_size(self):
+        payload = RULES_RESPONSE[4:]
+        fragments = compressed_fragments(
+            payload, decompressed_size=len(payload) + 1)
+        reassembler = valve.source.a2s._Reassembler()
+        with pytest.raises(messages.BrokenMessageError):
+            for fragment in fragments:
+                reassembler.feed(fragment)
+
+    def test_compressed_bad_crc32(self):
+        payload = RULES_RESPONSE[4:]
+        fragments = compressed_fragments(
+            payload, crc32=zlib.crc32(payload) ^ 1)
+        reassembler = valve.source.a2s._Reassembler()
+        with pytest.raises(messages.BrokenMessageError):
+            for fragment in fragments:
+                reassembler.feed(fragment)
+
+    def test_compressed_corrupt(self):
+        fragments = compressed_fragments(RULES_RESPONSE[4:], size=4096)
+        fragment = bytearray(fragments[0])
+        fragment[-20:] = b"\x00" * 20
+        reassembler = valve.source.a2s._Reassembler()
+        with pytest.raises(messages.BrokenMessageError):
+            reassembler.feed(bytes(fragment))
+
+
+class TestServerQuerierChallenge(object):
+
+    def test_players_then_rules(self, a2s_server):
+        a2s_server.respond(players_request(-1), challenge_response(1234))
+        a2s_server.respond(players_request(1234), PLAYERS_RESPONSE)
+        a2s_server.respond(rules_request(1234), RULES_RESPONSE)
+        cache = valve.source.a2s.ChallengeCache()
+        with valve.source.a2s.ServerQuerier(
+                a2s_server.server_address, 1.0, cache) as server:
+            assert server.players()["player_count"] == 1
+            assert server.rules()["rule_count"] == 1
+        requests = [request for _, request in a2s_server.received]
+        assert requests == [
+            players_request(-1), players_request(1234), rules_request(1234)]
+        assert cache.get(a2s_server.server_address) == 1234
+
+    def test_shared_between_queriers(self, a2s_server):
+        a2s_server.respond(players_request(1234), PLAYERS_RESPONSE)
+        cache = valve.source.a2s.ChallengeCache()
+        cache.set(a2s_server.server_address, 1234)
+        for _ in range(2):
+            with valve.source.a2s.ServerQuerier(
+                    a2s_server.server_address, 1.0, cache) as server:
+                server.players()
+        requests = [request for _, request in a2s_server.received]
+        assert requests == [players_request(1234)] * 2
+
+    def test_keyed_by_resolved_address(self, a2s_server):
+        a2s_server.respond(players_request(1234), PLAYERS_RESPONSE)
+        cache = valve.source.a2s.ChallengeCache()
+        cache.set(a2s_server.server_address, 1234)
+        with valve.source.a2s.ServerQuerier(
+                ("localhost", a2s_server.server_address[1]),
+                1.0, cache) as server:
+            server.players()
+        requests = [request for _, request in a2s_server.received]
+        assert requests == [players_request(1234)]
+
+    def test_stale(self, a2s_server):
+        a2s_server.respond(players_request(1), challenge_response(1234))
+        a2s_server.respond(players_request(1234), PLAYERS_RESPONSE)
+        cache = valve.source.a2s.ChallengeCache()
+        cache.set(a2s_server.server_address, 1)
+        with valve.source.a2s.ServerQuerier(
+                a2s_server.server_address, 1.0, cache) as server:
+            assert server.players()["player_count"] == 1
+        assert cache.get(a2s_server.server_address) == 1234
+
+    def test_too_many_challenges(self, a2s_server):
+        a2s_server.respond(players_request(-1), challenge_response(-1))
+        with valve.source.a2s.ServerQuerier(
+                a2s_server.server_address, 1.0,
+                valve.source.a2s.ChallengeCache()) as server:
+            with pytest.raises(messages.BrokenMessageError):
+                server.players()
+
+
+    def test_compressed_rules(self, a2s_server):
+        a2s_server.respond(rules_request(-1), challenge_response(1234))
+        a2s_server.respond(rules_request(1234),
+                           *compressed_fragments(RULES_RESPONSE[4:]))
+        cache = valve.source.a2s.ChallengeCache()
+        with valve.source.a2s.ServerQuerier(
+                a2s_server.server_address, 1.0, cache) as querier:
+            rules = querier.rules()
+        assert rules["rules"] == {"mp_friendlyfire": "0"}
+
+
+class TestServerQuerierShared(object):
+
+    def test_info(self, a2s_server):
+        a2s_server.respond(INFO_REQUEST, INFO_RESPONSE)
+        with valve.source.SharedSocket() as shared:
+            for _ in range(2):
+                with valve.source.a2s.ServerQuerier(
+                        a2s_server.server_address, 1.0,
+                        valve.source.a2s.ChallengeCache(),
+                        shared=shared) as server:
+                    assert server._buffer is None
+                    assert server.info()["map"] == "ctf_2fort"
+        ports = {address[1] for address, _ in a2s_server.received}
+        assert len(ports) == 1
+
+
+class TestServerQuerierInfoChallenge(object):
+
+    def test_info(self, a2s_server):
+        a2s_server.respond(INFO_REQUEST, challenge_response(1234))
+        a2s_server.respond(info_request(1234), INFO_RESPONSE)
+        cache = valve.source.a2s.ChallengeCache()
+        with valve.source.a2s.ServerQuerier(
+                a2s_server.server_address, 1.0, cache) as server:
+            assert server.info()["server_name"] == "Test Server"
+            assert server.info()["server_name"] == "Test Server"
+        requests = [request for _, request in a2s_server.received]
+        assert requests == [INFO_REQUEST] + [info_request(1234)] * 2
+
+    def test_ping(self, a2s_server):
+        a2s_server.respond(INFO_REQUEST, challenge_response(1234))
+        a2s_server.respond(info_request(1234), INFO_RESPONSE)
+        cache = valve.source.a2s.ChallengeCache()
+        with valve.source.a2s.ServerQuerier(
+                a2s_server.server_address, 1.0, cache) as server:
+            assert server.ping() > 0
+            assert cache.get(a2s_server.server_address) == 1234
+            assert server.ping() > 0
+        requests = [request for _, request in a2s_server.received]
+        assert requests == [INFO_REQUEST, info_request(1234)]
+
+
+class TestSnapshot(object):
+
+    @pytest.fixture
+    def server(self, a2s_server):
+        for request in [INFO_REQUEST, players_request(-1),
+                        rules_request(-1), players_request(1),
+                        rules_request(1), info_request(1)]:
+            a2s_server.respond(request, challenge_response(1234))
+        a2s_server.respond(info_request(1234), INFO_RESPONSE)
+        a2s_server.respond(players_request(1234), PLAYERS_RESPONSE)
+        a2s_server.respond(rules_request(1234), RULES_RESPONSE)
+        return a2s_server
+
+    def check(self, snapshot):
+        assert snapshot["info"]["server_name"] == "Test Server"
+        assert snapshot["players"]["player_count"] == 1
+        assert snapshot["rules"]["rules"] == {"mp_friendlyfire": "0"}
+
+    def test_no_challenge(self, server):
+        cache = valve.source.a2s.ChallengeCache()
+        with valve.source.a2s.ServerQuerier(
+                server.server_address, 1.0, cache) as querier:
+            self.check(querier.snapshot())
+        requests = [request for _, request in server.received]
+        assert len(requests) == 6
+        assert set(requests[3:]) == {info_request(1234),
+                                     players_request(1234),
+                                     rules_request(1234)}
+
+    def test_cached_challenge(self, server):
+        cache = valve.source.a2s.ChallengeCache()
+        cache.set(server.server_address, 1234)
+        with valve.source.a2s.ServerQuerier(
+                server.server_address, 1.0, cache) as querier:
+            self.check(querier.snapshot())
+        assert len(server.received) == 3
+
+    def test_stale_challenge(self, server):
+        cache = valve.source.a2s.ChallengeCache()
+        cache.set(server.server_address, 1)
+        with valve.source.a2s.ServerQuerier(
+                server.server_address, 1.0, cache) as querier:
+            self.check(querier.snapshot())
+        assert len(server.received) == 6
+        assert cache.get(server.server_address) == 1234
+
+    def test_split_responses_interleaved(self, a2s_server):
+        split = messages.Header(split=messages.SPLIT).encode()
+
+        def fragments(message_id, payload):
+            return [split + messages.Fragment(
+                message_id=message_id,
+                fragment_count=2,
+                fragment_id=fragment_id,
+                mtu=1248,
+            ).encode() + part for fragment_id, part
+                in enumerate([payload[:10], payload[10:]])]
+
+        info = fragments(1, INFO_RESPONSE[4:])
+        players = fragments(2, PLAYERS_RESPONSE[4:])
+        a2s_server.respond(info_request(1234), info[0], players[1])
+        a2s_server.respond(players_request(1234), info[1], players[0])
+        a2s_server.respond(rules_request(1234), RULES_RESPONSE)
+        cache = valve.source.a2s.ChallengeCache()
+        cache.set(a2s_server.server_address, 1234)
+        with valve.source.a2s.ServerQuerier(
+                a2s_server.server_address, 1.0, cache) as querier:
+            self.check(querier.snapshot())
+
+
+class TestServerQuerierRTT(object):
+
+    def test_observe(self, a2s_server):
+        a2s_server.respond(INFO_REQUEST, INFO_RESPONSE)
+        rtt = valve.source.a2s.RTTEstimator()
+        with valve.source.a2s.ServerQuerier(
+                a2s_server.server_address, 1.0,
+                valve.source.a2s.ChallengeCache(), rtt) as server:
+            server.ping()
+        assert rtt.get(a2s_server.server_address) is not None
+
+    def test_retransmit(self, a2s_server):
+        rtt = valve.source.a2s.RTTEstimator(
+            initial=0.1, minimum=0.05, maximum=0.4)
+        with valve.source.a2s.ServerQuerier(
+                a2s_server.server_address, 1.0,
+                valve.source.a2s.ChallengeCache(), rtt) as server:
+            with pytest.raises(valve.source.NoResponseError):
+                server.info()
+        requests = [request for _, request in a2s_server.received]
+        assert requests == [INFO_REQUEST] * 3
+        assert rtt.get(a2s_server.server_address) is None
+        assert rtt.timeout(a2s_server.server_address) == 0.4
+
+
+    def test_duplicate_response(self, a2s_server):
+        # The server answers both the original request and its
+        # retransmission, so the second response is received late
+        a2s_server.respond(info_request(1234), INFO_RESPONSE, INFO_RESPONSE)
+        a2s_server.respond(players_request(1234), PLAYERS_RESPONSE)
+        cache = valve.source.a2s.ChallengeCache()
+        cache.set(a2s_server.server_address, 1234)
+        rtt = valve.source.a2s.RTTEstimator()
+        with valve.source.a2s.ServerQuerier(
+                a2s_server.server_address, 1.0, cache, rtt) as server:
+            assert server.info()["server_name"] == "Test Server"
+            time.sleep(0.1)
+            assert server.players()["player_count"] == 1
+
+
+class TestScan(object):
+
+    def test_info(self, a2s_server):
+        a2s_server.respond(INFO_REQUEST, INFO_RESPONSE)
+        results = list(valve.source.a2s.scan([a2s_server.server_address]))
+        assert len(results) == 1
+        address, result = results[0]
+        assert address == a2s_server.server_address
+        assert result["info"]["server_name"] == "Test Server"
+
+    def test_all_queries(self, a2s_server):
+        a2s_server.respond(INFO_REQUEST, INFO_RESPONSE)
+        a2s_server.respond(players_request(-1), challenge_response(1234))
+        a2s_server.respond(players_request(1234), PLAYERS_RESPONSE)
+        a2s_server.respond(rules_request(1234), RULES_RESPONSE)
+        results = list(valve.source.a2s.scan(
+            [a2s_server.server_address],
+            queries=["info", "players", "rules"],
+            challenges=valve.source.a2s.ChallengeCache(),
+        ))
+        result = results[0][1]
+        assert result["info"]["map"] == "ctf_2fort"
+        assert result["players"]["players"][0]["name"] == "Player"
+        assert result["rules"]["rules"] == {"mp_friendlyfire": "0"}
+        # The challenge from A2S_PLAYER is reused for A2S_RULES
+        assert rules_request(-1) not in [
+            request for _, request in a2s_server.received]
+
+    def test_timeout(self, a2s_server):
+        results = list(valve.source.a2s.scan(
+            [a2s_server.server_address], timeout=0.2))
+        assert len(results) == 1
+        assert isinstance(results[0][1], valve.source.NoResponseError)
+
+    def test_rtt(self, a2s_server):
+        a2s_server.respond(INFO_REQUEST, INFO_RESPONSE)
+        rtt = valve.source.a2s.RTTEstimator()
+        results = list(valve.source.a2s.scan(
+            [a2s_server.server_address], rtt=rtt))
+        assert results[0][1]["info"]["server_name"] == "Test Server"
+        assert rtt.get(a2s_server.server_address) is not None
+
+    def test_rtt_from_send(self, a2s_server, monkeypatch):
+        send = valve.source.batch.DatagramBatcher.send
+
+        def slow_send(self, datagrams):
+            time.sleep(0.2)
+            send(self, datagrams)
+
+        monkeypatch.setattr(
+            valve.source.batch.DatagramBatcher, "send", slow_send)
+        a2s_server.respond(INFO_REQUEST, INFO_RESPONSE)
+        rtt = valve.source.a2s.RTTEstimator()
+        list(valve.source.a2s.scan(
+            [a2s_server.server_address], timeout=1.0,
+            challenges=valve.source.a2s.ChallengeCache(), rtt=rtt))
+        assert rtt.get(a2s_server.server_address)[0] < 0.2
+
+    def test_rtt_retransmit(self, a2s_server):
+        rtt = valve.source.a2s.RTTEstimator(
+            initial=0.1, minimum=0.05, maximum=0.4)
+        results = list(valve.source.a2s.scan(
+            [a2s_server.server_address], timeout=1.0, rtt=rtt))
+        assert isinstance(results[0][1], valve.source.NoResponseError)
+        requests = [request for _, request in a2s_server.received]
+        assert requests == [INFO_REQUEST] * 3
+
+    def test_duplicate_response(self, a2s_server):
+        a2s_server.respond(info_request(1234), INFO_RESPONSE, INFO_RESPONSE)
+        a2s_server.respond(players_request(1234), PLAYERS_RESPONSE)
+        cache = valve.source.a2s.ChallengeCache()
+        cache.set(a2s_server.server_address, 1234)
+        results = list(valve.source.a2s.scan(
+            [a2s_server.server_address], queries=["info", "players"],
+            timeout=1.0, challenges=cache))
+        assert results[0][1]["players"]["player_count"] == 1
+
+    def test_invalid_query(self):
+        with pytest.raises(ValueError):
+            list(valve.source.a2s.scan([], queries=["foo"]))
+
+    def test_lazy(self, a2s_server):
+        a2s_server.respond(INFO_REQUEST, INFO_RESPONSE)
+        host, port = a2s_server.server_address
+        taken = []
+
+        def addresses():
+            for host_ in [host, "localhost", host]:
+                taken.append(host_)
+                yield host_, port
+
+        scan = valve.source.a2s.scan(addresses(), concurrency=1)
+        assert next(scan)[0] == (host, port)
+        assert len(taken) == 1
+        assert [address for address, _ in scan] == [
+            ("localhost", port), (host, port)]
@@ -0,0 +1,169 @@
+# -*- coding: utf-8 -*-
+
+from __future__ import (absolute_import,
+                        unicode_literals, print_function, division)
+
+import sys
+
+import pytest
+
+if sys.version_info < (3, 5):
+    pytest.skip("asyncio querier requires Python 3.5+",
+                allow_module_level=True)
+
+import asyncio
+
+import valve.source
+from valve.source import a2s
+from valve.source import a2s_async
+from valve.source import messages
+
+
+NO_SPLIT = messages.Header(split=messages.NO_SPLIT).encode()
+INFO_REQUEST = NO_SPLIT + messages.InfoRequest().encode()
+INFO_RESPONSE = NO_SPLIT + messages.InfoResponse(
+    response_type=0x49,
+    protocol=17,
+    server_name="Test Server",
+    map="ctf_2fort",
+    folder="tf",
+    game="Team Fortress",
+    app_id=440,
+    player_count=1,
+    max_players=24,
+    bot_count=0,
+    server_type=100,
+    platform=108,
+    password_protected=0,
+    vac_enabled=1,
+    version="1.0",
+).encode()
+
+
+def challenge_response(challenge):
+    return NO_SPLIT + messages.GetChallengeResponse(
+        response_type=0x41, challenge=challenge).encode()
+
+
+@pytest.fixture
+def loop():
+    loop = asyncio.new_event_loop()
+    asyncio.set_event_loop(loop)
+    yield loop
+    asyncio.set_event_loop(None)
+    loop.close()
+
+
+def run(loop, function, *args, **kwargs):
+
+    async def wrapper():
+        async with a2s_async.AsyncServerQuerier(*args, **kwargs) as querier:
+            return await function(querier)
+
+    return loop.run_until_complete(wrapper())
+
+
+class TestAsyncServerQuerier(object):
+
+    def test_info(self, loop, a2s_server):
+        a2s_server.respond(INFO_REQUEST, INFO_RESPONSE)
+        info = run(loop, lambda q: q.info(a2s_server.server_address))
+        assert info["server_name"] == "Test Server"
+        assert info["app_id"] == 440
+
+    def test_info_many(self, loop, a2s_server):
+        a2s_server.respond(INFO_REQUEST, INFO_RESPONSE)
+        address = a2s_server.server_address
+        results = run(loop, lambda q: asyncio.gather(
+            q.info(address), q.info(("localhost", address[1]))))
+        assert [info["map"] for info in results] == ["ctf_2fort"] * 2
+        clients = {client for client, _ in a2s_server.received}
+        assert len(clients) == 1
+
+    def test_info_timeout(self, loop, a2s_server):
+        with pytest.raises(valve.source.NoResponseError):
+            run(loop, lambda q: q.info(a2s_server.server_address),
+                timeout=0.2)
+
+    def test_players(self, loop, a2s_server):
+        a2s_server.respond(
+            NO_SPLIT + messages.PlayersRequest(challenge=-1).encode(),
+            challenge_response(1234),
+        )
+        a2s_server.respond(
+            NO_SPLIT + messages.PlayersRequest(challenge=1234).encode(),
+            NO_SPLIT + messages.PlayersResponse(
+                response_type=0x44,
+                player_count=1,
+                players=[messages.PlayerEntry(
+                    index=0, name="Player", score=5, duration=1.0)],
+            ).encode(),
+        )
+        cache = a2s.ChallengeCache()
+        players = run(loop, lambda q: q.players(a2s_server.server_address),
+                      challenges=cache)
+        assert players["player_count"] == 1
+        assert players["players"][0]["name"] == "Player"
+        assert cache.get(a2s_server.server_address) == 1234
+
+    def test_players_late_info(self, loop, a2s_server):
+        request = NO_SPLIT + messages.PlayersRequest(challenge=1234).encode()
+        a2s_server.respond(
+            request,
+            INFO_RESPONSE,
+            NO_SPLIT + messages.PlayersResponse(
+                response_type=0x44,
+                player_count=1,
+                players=[messages.PlayerEntry(
+                    index=0, name="Player", score=5, duration=1.0)],
+            ).encode(),
+        )
+        cache = a2s.ChallengeCache()
+        cache.set(a2s_server.server_address, 1234)
+        players = run(loop, lambda q: q.players(a2s_server.server_address),
+                      challenges=cache)
+        assert players["players"][0]["name"] == "Player"
+
+    def test_split_response(self, loop, a2s_server):
+        payload = INFO_RESPONSE[4:]
+        fragments = [payload[:20], payload[20:]]
+        responses = []
+        for fragment_id, fragment in reversed(list(enumerate(fragments))):
+            responses.append(
+                messages.Header(split=messages.SPLIT).encode()
+                + messages.Fragment(
+                    message_id=1,
+                    fragment_count=len(fragments),
+                    fragment_id=fragment_id,
+                    mtu=1248,
+                ).encode()
+                + fragment
+            )
+        a2s_server.respond(INFO_REQUEST, *responses)
+        info = run(loop, lambda q: q.info(a2s_server.server_address))
+        assert info["version"] == "1.0"
+
+    def test_unresponsive(self, loop, a2s_server):
+        unresponsive = a2s.UnresponsiveCache(threshold=1)
+        with pytest.raises(valve.source.NoResponseError):
+            run(loop, lambda q: q.info(a2s_server.server_address),
+                timeout=0.2, unresponsive=unresponsive)
+        assert unresponsive.unresponsive(a2s_server.server_address)
+        a2s_server.respond(INFO_REQUEST, INFO_RESPONSE)
+        with pytest.raises(valve.source.NoResponseError):
+            run(loop, lambda q: q.info(a2s_server.server_address),
+                unresponsive=unresponsive)
+        assert len(a2s_server.received) == 1
+
+    def test_unresponsive_success(self, loop, a2s_server):
+        a2s_server.respond(INFO_REQUEST, INFO_RESPONSE)
+        unresponsive = a2s.UnresponsiveCache()
+        unresponsive.failure(a2s_server.server_address)
+        run(loop, lambda q: q.info(a2s_server.server_address),
+            unresponsive=unresponsive)
+        assert len(unresponsive) == 0
+
+    def test_closed(self, loop):
+        querier = a2s_async.AsyncServerQuerier()
+        with pytest.raises(valve.source.QuerierClosedError):
+            loop.run_until_complete(querier.info(("127.0.0.1", 27015)))
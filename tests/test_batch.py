@@ -0,0 +1,88 @@
+# -*- coding: utf-8 -*-
+
+from __future__ import (absolute_import,
+                        unicode_literals, print_function, division)
+
+import errno
+import select
+import socket
+
+import pytest
+
+from valve.source import batch
+
+
+@pytest.fixture
+def sockets():
+    sockets = []
+    for _ in range(2):
+        socket_ = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        socket_.bind(("127.0.0.1", 0))
+        socket_.setblocking(False)
+        sockets.append(socket_)
+    yield sockets
+    for socket_ in sockets:
+        socket_.close()
+
+
+def receive_all(batcher, count):
+    received = []
+    while len(received) < count:
+        assert select.select([batcher.socket], [], [], 1.0)[0]
+        received.extend((data.tobytes(), address)
+                        for data, address in batcher.receive())
+    return received
+
+
+@pytest.mark.parametrize("native", [None, False])
+class TestDatagramBatcher(object):
+
+    def test_send_receive(self, sockets, native):
+        sender = batch.DatagramBatcher(sockets[0], size=4, native=native)
+        receiver = batch.DatagramBatcher(sockets[1], size=4, native=native)
+        datagrams = [("{}\x00".format(i).encode(), sockets[1].getsockname())
+                     for i in range(10)]
+        sender.send(datagrams)
+        received = receive_all(receiver, 10)
+        assert received == [(data, sockets[0].getsockname())
+                            for data, _ in datagrams]
+        assert receiver.receive() == []
+
+    def test_receive_limit(self, sockets, native):
+        receiver = batch.DatagramBatcher(sockets[1], size=2, native=native)
+        for i in range(3):
+            sockets[0].sendto(b"datagram", sockets[1].getsockname())
+        assert select.select([sockets[1]], [], [], 1.0)[0]
+        assert len(receiver.receive()) == 2
+
+    def test_large(self, sockets, native):
+        sender = batch.DatagramBatcher(sockets[0], native=native)
+        receiver = batch.DatagramBatcher(sockets[1], native=native)
+        data = b"\xFF" * 60000
+        sender.send([(data, sockets[1].getsockname())])
+        assert receive_all(receiver, 1) == [
+            (data, sockets[0].getsockname())]
+
+    def test_receive_empty(self, sockets, native):
+        receiver = batch.DatagramBatcher(sockets[1], native=native)
+        assert receiver.receive() == []
+
+
+class TestDatagramBatcherFallback(object):
+
+    def test_receive_icmp_error(self):
+        socket_ = pytest.Mock()
+        socket_.recvfrom_into.side_effect = [
+            socket.error(errno.ECONNREFUSED, "ICMP"),
+            socket.error(errno.EAGAIN, "Empty"),
+        ]
+        receiver = batch.DatagramBatcher(socket_, native=False)
+        assert receiver.receive() == []
+
+    def test_receive_error(self):
+        socket_ = pytest.Mock()
+        socket_.recvfrom_into.side_effect = socket.error(errno.EBADF, "Bad")
+        receiver = batch.DatagramBatcher(socket_, native=False)
+        with pytest.raises(socket.error):
+            receiver.receive()
+        assert socket_.recvfrom_into.call_count == 1
@@ -0,0 +1,126 @@
+# -*- coding: utf-8 -*-
+
+from __future__ import (absolute_import,
+                        unicode_literals, print_function, division)
+
+import pytest
+
+from valve.source import index
+from valve.source import util
+
+
+def info(**values):
+    info = {
+        "app_id": 440,
+        "map": "ctf_2fort",
+        "game": "Team Fortress",
+        "folder": "tf",
+        "player_count": 0,
+        "max_players": 24,
+        "bot_count": 0,
+        "server_type": util.ServerType(100),
+        "platform": util.Platform(108),
+        "password_protected": 0,
+        "vac_enabled": 1,
+        "server_name": "Test Server",
+    }
+    info.update(values)
+    return info
+
+
+class TestServerIndex(object):
+
+    @pytest.fixture
+    def servers(self):
+        servers = index.ServerIndex()
+        servers.update(("192.0.2.0", 27015), info())
+        servers.update(("192.0.2.1", 27015), info(
+            map="pl_badwater", player_count=12))
+        servers.update(("192.0.2.2", 27015), info(
+            player_count=24, platform=util.Platform(119),
+            server_type=util.ServerType(108)))
+        servers.update(("192.0.2.3", 27015), info(
+            app_id=730, map="de_dust2", game="Counter-Strike",
+            folder="csgo", server_type=util.ServerType(68),
+            platform=util.Platform(76), password_protected=1))
+        return servers
+
+    def test_discover(self):
+        servers = index.ServerIndex()
+        servers.add(("192.0.2.0", 27015))
+        assert list(servers.discover([
+            ("192.0.2.0", 27015),
+            ("192.0.2.1", 27015),
+            ("192.0.2.1", 27015),
+        ])) == [("192.0.2.1", 27015)]
+        assert len(servers) == 2
+        assert servers.get(("192.0.2.1", 27015)) is None
+        assert servers.find() == set()
+
+    def test_find_scalar(self, servers):
+        assert servers.find(map="ctf_2fort") == {
+            ("192.0.2.0", 27015),
+            ("192.0.2.2", 27015),
+        }
+        assert servers.find(map="ctf_2fort", player_count=24) == {
+            ("192.0.2.2", 27015),
+        }
+        assert servers.find(map="cp_dustbowl") == set()
+
+    def test_find_collection(self, servers):
+        assert servers.find(player_count=range(1, 25)) == {
+            ("192.0.2.1", 27015),
+            ("192.0.2.2", 27015),
+        }
+        assert servers.find(map=["pl_badwater", "de_dust2"]) == {
+            ("192.0.2.1", 27015),
+            ("192.0.2.3", 27015),
+        }
+
+    def test_find_callable(self, servers):
+        assert servers.find(map=lambda map_: map_.startswith("ctf_"),
+                            player_count=lambda count: count < 24) == {
+            ("192.0.2.0", 27015),
+        }
+        assert servers.find(
+            platform=lambda platform: platform.os_name == "nt") == {
+                ("192.0.2.2", 27015),
+            }
+
+    def test_find_normalised(self, servers):
+        assert servers.find(server_type="dedicated", platform="linux") == {
+            ("192.0.2.0", 27015),
+            ("192.0.2.1", 27015),
+            ("192.0.2.3", 27015),
+        }
+        assert servers.find(password_protected=True) == {
+            ("192.0.2.3", 27015),
+        }
+
+    def test_find_all(self, servers):
+        assert len(servers.find()) == 4
+
+    def test_find_invalid_column(self, servers):
+        with pytest.raises(ValueError):
+            servers.find(server_name="Test Server")
+
+    def test_update(self, servers):
+        servers.update(("192.0.2.0", 27015), info(map="pl_upward"))
+        assert servers.find(map="ctf_2fort") == {("192.0.2.2", 27015)}
+        assert servers.find(map="pl_upward") == {("192.0.2.0", 27015)}
+        assert servers.get(("192.0.2.0", 27015))["map"] == "pl_upward"
+        assert "server_name" not in servers.get(("192.0.2.0", 27015))
+
+    def test_discard(self, servers):
+        servers.discard(("192.0.2.3", 27015))
+        servers.discard(("192.0.2.3", 27015))
+        assert ("192.0.2.3", 27015) not in servers
+        assert servers.find(app_id=730) == set()
+        assert 730 not in servers._indexes["app_id"]
+
+    def test_columns(self):
+        servers = index.ServerIndex(columns=["map"])
+        servers.update(("192.0.2.0", 27015), {"map": "ctf_2fort"})
+        assert servers.find(map="ctf_2fort") == {("192.0.2.0", 27015)}
+        with pytest.raises(ValueError):
+            servers.find(app_id=440)
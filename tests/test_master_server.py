@@ -8,6 +8,10 @@ try:
     import mock
 except ImportError:
     import unittest.mock as mock
+import copy
+import pickle
+import time
+
 import pytest
 
 import valve.source
@@ -243,6 +247,78 @@ class TestFind(object):
         assert _query.call_args[0][1] == r"\gametype\tag,tag2\napp\240"
 
 
+class TestFindConcurrently(object):
+
+    @pytest.fixture
+    def _query(self, monkeypatch):
+        calls = []
+
+        def _query(self, region, filter_string, checkpoint=None):
+            calls.append((region, filter_string))
+            time.sleep(0.3)
+            for port in range(3):
+                yield "192.0.2.{}".format(region), port
+            if region == master_server.REGION_REST:
+                raise messages.BrokenMessageError
+
+        monkeypatch.setattr(
+            master_server.MasterServerQuerier, "_query", _query)
+        return calls
+
+    def test_concurrent(self, _query):
+        msq = master_server.MasterServerQuerier()
+        start = time.time()
+        addresses = list(msq.find(region="na", secure=True))
+        assert time.time() - start < 0.55
+        assert sorted(_query) == [
+            (master_server.REGION_US_EAST_COAST, r"\secure\1"),
+            (master_server.REGION_US_WEST_COAST, r"\secure\1"),
+        ]
+        assert sorted(addresses) == sorted(
+            ("192.0.2.{}".format(region), port)
+            for region in [master_server.REGION_US_EAST_COAST,
+                           master_server.REGION_US_WEST_COAST]
+            for port in range(3))
+
+    def test_duplicates_across_regions(self, _query):
+        msq = master_server.MasterServerQuerier()
+        addresses = list(msq.find(
+            region=[master_server.REGION_EUROPE] * 2,
+            duplicates=master_server.Duplicates.SKIP))
+        assert sorted(addresses) == [("192.0.2.3", port)
+                                     for port in range(3)]
+
+    def test_exception(self, _query):
+        msq = master_server.MasterServerQuerier()
+        with pytest.raises(messages.BrokenMessageError):
+            list(msq.find(region=["eu", "rest"]))
+
+    def test_closed(self, _query):
+        msq = master_server.MasterServerQuerier()
+        msq.close()
+        with pytest.raises(valve.source.QuerierClosedError):
+            list(msq.find(region="na"))
+        assert not _query
+
+    def test_checkpoint_consumed(self, monkeypatch):
+
+        def _query(self, region, filter_string, checkpoint=None):
+            for port in range(2):
+                yield "192.0.2.{}".format(region), port
+            checkpoint.set(region, filter_string, "192.0.2.0:1")
+
+        monkeypatch.setattr(
+            master_server.MasterServerQuerier, "_query", _query)
+        checkpoint = master_server.Checkpoint()
+        msq = master_server.MasterServerQuerier()
+        query = msq.find(region="na", checkpoint=checkpoint)
+        next(query)
+        time.sleep(0.2)
+        assert len(checkpoint) == 0
+        list(query)
+        assert len(checkpoint) == 2
+
+
 class TestQuery(object):
 
     @pytest.fixture
@@ -332,6 +408,22 @@ class TestQuery(object):
             ("8.8.4.4", 27015),
         ]
 
+    def test_page(self, msq, request_):
+        msq.get_response.side_effect = [
+            b"\xFF\xFF\xFF\xFF\x66\x0A"
+            b"\x08\x08\x08\x08\x69\x87\x08\x08\x04\x04\x69\x87",
+            b"\xFF\xFF\xFF\xFF\x66\x0A"
+            b"\xC0\x00\x02\x00\x69\x87\x00\x00\x00\x00\x00\x00",
+        ]
+        addresses = list(msq._query(master_server.REGION_REST, ""))
+        assert addresses == [
+            ("8.8.8.8", 27015),
+            ("8.8.4.4", 27015),
+            ("192.0.2.0", 27015),
+        ]
+        assert request_.call_count == 2
+        assert request_.call_args_list[1][1]["address"] == "8.8.4.4:27015"
+
     def test_no_response(self, msq, request_, response):
         msq.get_response.side_effect = valve.source.NoResponseError
         assert list(msq._query(master_server.REGION_REST, "")) == []
@@ -342,6 +434,90 @@ class TestQuery(object):
             "filter": "",
         }
 
+    def test_retry(self, msq, request_, monkeypatch):
+        sleep = mock.Mock()
+        monkeypatch.setattr(master_server.time, "sleep", sleep)
+        msq.retries = 2
+        msq.backoff = 0.5
+        msq.get_response.side_effect = [
+            valve.source.NoResponseError,
+            valve.source.NoResponseError,
+            b"\xFF\xFF\xFF\xFF\x66\x0A"
+            b"\x08\x08\x08\x08\x69\x87\x00\x00\x00\x00\x00\x00",
+        ]
+        addresses = list(msq._query(master_server.REGION_REST, ""))
+        assert addresses == [("8.8.8.8", 27015)]
+        assert [call[0][0] for call in sleep.call_args_list] == [0.5, 1.0]
+        assert request_.call_count == 3
+        assert all(call[1]["address"] == "0.0.0.0:0"
+                   for call in request_.call_args_list)
+
+    def test_retry_drains_late_response(self, msq, request_, monkeypatch):
+        monkeypatch.setattr(master_server.time, "sleep", mock.Mock())
+        monkeypatch.setattr(
+            master_server.MasterServerQuerier, "_drain", mock.Mock())
+        msq.retries = 1
+        msq.get_response.side_effect = [
+            valve.source.NoResponseError,
+            b"\xFF\xFF\xFF\xFF\x66\x0A"
+            b"\x08\x08\x08\x08\x69\x87\x00\x00\x00\x00\x00\x00",
+        ]
+        list(msq._query(master_server.REGION_REST, ""))
+        assert msq._drain.call_count == 1
+
+    def test_drain(self):
+        with master_server.MasterServerQuerier() as msq:
+            msq._socket.bind(("127.0.0.1", 0))
+            for _ in range(3):
+                msq._socket.sendto(b"late", msq._socket.getsockname())
+            time.sleep(0.05)
+            msq._drain()
+            msq.timeout = 0.05
+            with pytest.raises(valve.source.NoResponseError):
+                msq.get_response()
+
+    def test_retry_exhausted(self, msq, request_, monkeypatch):
+        monkeypatch.setattr(master_server.time, "sleep", mock.Mock())
+        msq.retries = 1
+        msq.get_response.side_effect = valve.source.NoResponseError
+        assert list(msq._query(master_server.REGION_REST, "")) == []
+        assert request_.call_count == 2
+
+    def test_checkpoint(self, msq, request_):
+        checkpoint = master_server.Checkpoint()
+        msq.get_response.side_effect = [
+            b"\xFF\xFF\xFF\xFF\x66\x0A"
+            b"\x08\x08\x08\x08\x69\x87\x08\x08\x04\x04\x69\x87",
+            valve.source.NoResponseError,
+        ]
+        assert list(msq._query(master_server.REGION_REST, "",
+                               checkpoint)) == [
+            ("8.8.8.8", 27015),
+            ("8.8.4.4", 27015),
+        ]
+        assert checkpoint.get(master_server.REGION_REST, "") \
+            == "8.8.4.4:27015"
+        msq.get_response.side_effect = [
+            b"\xFF\xFF\xFF\xFF\x66\x0A"
+            b"\xC0\x00\x02\x00\x69\x87\x00\x00\x00\x00\x00\x00",
+        ]
+        assert list(msq._query(master_server.REGION_REST, "",
+                               checkpoint)) == [("192.0.2.0", 27015)]
+        assert request_.call_args_list[-1][1]["address"] == "8.8.4.4:27015"
+        assert checkpoint.get(master_server.REGION_REST, "") is None
+
+    def test_checkpoint_partial_page(self, msq, request_):
+        checkpoint = master_server.Checkpoint()
+        checkpoint.set(master_server.REGION_REST, "", "192.0.2.0:27015")
+        msq.get_response.return_value = (
+            b"\xFF\xFF\xFF\xFF\x66\x0A"
+            b"\x08\x08\x08\x08\x69\x87\x08\x08\x04\x04\x69\x87")
+        query = msq._query(master_server.REGION_REST, "", checkpoint)
+        assert next(query) == ("8.8.8.8", 27015)
+        query.close()
+        assert checkpoint.get(master_server.REGION_REST, "") \
+            == "192.0.2.0:27015"
+
     @pytest.mark.parametrize(("method", "addresses"), [
         (
             master_server.Duplicates.KEEP,
@@ -382,3 +558,333 @@ class TestQuery(object):
         ])
         # `find` invokes `query` once for every region; so only one region
         assert list(msq.find(region="eu", duplicates=method)) == addresses
+
+
+class TestCheckpoint(object):
+
+    def test_get_set(self):
+        checkpoint = master_server.Checkpoint()
+        assert checkpoint.get(master_server.REGION_EUROPE, "") is None
+        checkpoint.set(master_server.REGION_EUROPE, "", "192.0.2.0:27015")
+        assert checkpoint.get(master_server.REGION_EUROPE, "") \
+            == "192.0.2.0:27015"
+        assert checkpoint.get(master_server.REGION_EUROPE, r"\full\1") \
+            is None
+        assert len(checkpoint) == 1
+        checkpoint.discard(master_server.REGION_EUROPE, "")
+        assert len(checkpoint) == 0
+
+    def test_persist(self, tmpdir):
+        path = str(tmpdir.join("checkpoint.json"))
+        checkpoint = master_server.Checkpoint(path)
+        checkpoint.set(master_server.REGION_EUROPE, r"\full\1",
+                       "192.0.2.0:27015")
+        checkpoint.set(master_server.REGION_ASIA, "", "192.0.2.1:27015")
+        checkpoint.discard(master_server.REGION_ASIA, "")
+        loaded = master_server.Checkpoint(path)
+        assert len(loaded) == 1
+        assert loaded.get(master_server.REGION_EUROPE, r"\full\1") \
+            == "192.0.2.0:27015"
+        assert tmpdir.listdir() == [tmpdir.join("checkpoint.json")]
+
+    def test_find(self, monkeypatch):
+        _query = mock.Mock(return_value=[])
+        monkeypatch.setattr(
+            master_server.MasterServerQuerier, "_query", _query)
+        checkpoint = master_server.Checkpoint()
+        msq = master_server.MasterServerQuerier()
+        list(msq.find(region="eu", checkpoint=checkpoint))
+        assert _query.call_args[0] == \
+            (master_server.REGION_EUROPE, "", checkpoint)
+
+
+class TestAddressSet(object):
+
+    def test_contains(self):
+        addresses = master_server.AddressSet([("192.0.2.0", 27015)])
+        assert ("192.0.2.0", 27015) in addresses
+        assert ("192.0.2.0", 27016) not in addresses
+        assert ("192.0.2.1", 27015) not in addresses
+        assert addresses.method is master_server.Duplicates.SKIP
+
+    def test_many(self):
+        addresses = master_server.AddressSet()
+        expected = [("10.{}.{}.1".format(i // 256, i % 256), 27015 + i % 3)
+                    for i in range(5000)]
+        for address in reversed(expected):
+            addresses.add(address)
+            addresses.add(address)
+        assert len(addresses) == 5000
+        assert all(address in addresses for address in expected)
+        assert ("10.0.0.1", 27016) not in addresses
+        assert list(addresses) == sorted(
+            expected, key=master_server._pack_address)
+
+    def test_find(self, monkeypatch):
+        monkeypatch.setattr(
+            master_server.MasterServerQuerier, "_query",
+            mock.Mock(return_value=[("192.0.2.0", 27015),
+                                    ("192.0.2.1", 27015),
+                                    ("192.0.2.0", 27015),
+                                    ("192.0.2.2", 27015)]))
+        msq = master_server.MasterServerQuerier()
+        seen = master_server.AddressSet(
+            [("192.0.2.1", 27015)], master_server.Duplicates.STOP)
+        assert list(msq.find(region="eu", duplicates=seen)) == \
+            [("192.0.2.0", 27015)]
+
+
+class TestAddressBloomFilter(object):
+
+    def test_contains(self):
+        addresses = master_server.AddressBloomFilter(1000, 0.01)
+        added = [("10.0.{}.{}".format(i // 256, i % 256), 27015)
+                 for i in range(1000)]
+        for address in added:
+            addresses.add(address)
+        assert len(addresses) == 1000
+        assert all(address in addresses for address in added)
+        false_positives = sum(
+            ("10.1.{}.{}".format(i // 256, i % 256), 27015) in addresses
+            for i in range(1000))
+        assert false_positives < 50
+
+    def test_invalid(self):
+        with pytest.raises(ValueError):
+            master_server.AddressBloomFilter(0)
+        with pytest.raises(ValueError):
+            master_server.AddressBloomFilter(error_rate=1.0)
+
+    def test_find(self, monkeypatch):
+        monkeypatch.setattr(
+            master_server.MasterServerQuerier, "_query",
+            mock.Mock(return_value=[("192.0.2.0", 27015),
+                                    ("192.0.2.1", 27015),
+                                    ("192.0.2.0", 27015)]))
+        msq = master_server.MasterServerQuerier()
+        seen = master_server.AddressBloomFilter(
+            100, method=master_server.Duplicates.SKIP)
+        assert list(msq.find(region="eu", duplicates=seen)) == \
+            [("192.0.2.0", 27015), ("192.0.2.1", 27015)]
+
+
+class TestSnapshot(object):
+
+    def test_iter(self):
+        snapshot = master_server.Snapshot([
+            ("192.0.2.1", 27015),
+            ("192.0.2.0", 27016),
+            ("192.0.2.0", 27015),
+            ("192.0.2.1", 27015),
+        ])
+        assert len(snapshot) == 3
+        assert list(snapshot) == [
+            ("192.0.2.0", 27015),
+            ("192.0.2.0", 27016),
+            ("192.0.2.1", 27015),
+        ]
+        assert ("192.0.2.0", 27016) in snapshot
+        assert ("192.0.2.2", 27015) not in snapshot
+
+    def test_eq(self):
+        assert master_server.Snapshot([("192.0.2.0", 27015)]) \
+            == master_server.Snapshot([("192.0.2.0", 27015)])
+        assert master_server.Snapshot([("192.0.2.0", 27015)]) \
+            != master_server.Snapshot([("192.0.2.0", 27016)])
+
+    def test_diff(self):
+        previous = master_server.Snapshot([
+            ("192.0.2.0", 27015),
+            ("192.0.2.1", 27015),
+            ("192.0.2.3", 27015),
+            ("192.0.2.5", 27015),
+        ])
+        current = master_server.Snapshot([
+            ("192.0.2.1", 27015),
+            ("192.0.2.2", 27015),
+            ("192.0.2.3", 27015),
+            ("192.0.2.6", 27015),
+            ("192.0.2.7", 27015),
+        ])
+        diff = current.diff(previous)
+        assert list(diff.added) == [
+            ("192.0.2.2", 27015),
+            ("192.0.2.6", 27015),
+            ("192.0.2.7", 27015),
+        ]
+        assert list(diff.removed) == [
+            ("192.0.2.0", 27015),
+            ("192.0.2.5", 27015),
+        ]
+
+    def test_diff_none(self):
+        current = master_server.Snapshot([("192.0.2.0", 27015)])
+        added, removed = current.diff(None)
+        assert list(added) == [("192.0.2.0", 27015)]
+        assert list(removed) == []
+
+    def test_diff_unchanged(self):
+        addresses = [("192.0.2.{}".format(i), 27015) for i in range(100)]
+        added, removed = master_server.Snapshot(addresses).diff(
+            master_server.Snapshot(reversed(addresses)))
+        assert list(added) == []
+        assert list(removed) == []
+
+
+class TestPacer(object):
+
+    @pytest.fixture
+    def clock(self, monkeypatch):
+        clock = [100.0]
+
+        def sleep(seconds):
+            clock[0] += seconds
+            sleep.calls.append(seconds)
+
+        sleep.calls = []
+        monkeypatch.setattr(
+            master_server.monotonic, "monotonic", lambda: clock[0])
+        monkeypatch.setattr(master_server.time, "sleep", sleep)
+        return sleep.calls
+
+    def test_wait(self, clock):
+        pacer = master_server.Pacer(60, burst=2)
+        pacer.wait()
+        pacer.wait()
+        assert clock == []
+        pacer.wait()
+        assert clock == [pytest.approx(1.0)]
+        pacer.wait()
+        assert clock == [pytest.approx(1.0), pytest.approx(1.0)]
+
+    def test_adapt(self, clock):
+        pacer = master_server.Pacer(60, minimum=10, maximum=62, increase=1)
+        pacer.success()
+        assert pacer.rate == 61
+        pacer.success()
+        pacer.success()
+        assert pacer.rate == 62
+        pacer.failure()
+        assert pacer.rate == 31
+        pacer.failure()
+        pacer.failure()
+        assert pacer.rate == 10
+
+    def test_invalid(self):
+        with pytest.raises(ValueError):
+            master_server.Pacer(0)
+
+    def test_query(self, monkeypatch):
+        monkeypatch.setattr(
+            master_server.MasterServerQuerier, "request", mock.Mock())
+        monkeypatch.setattr(
+            master_server.MasterServerQuerier, "get_response", mock.Mock(
+                side_effect=[
+                    valve.source.NoResponseError,
+                    b"\xFF\xFF\xFF\xFF\x66\x0A"
+                    b"\x00\x00\x00\x00\x00\x00",
+                ]))
+        monkeypatch.setattr(master_server.time, "sleep", mock.Mock())
+        pacer = mock.Mock(spec=master_server.Pacer)
+        msq = master_server.MasterServerQuerier(retries=1, rate=pacer)
+        assert list(msq._query(master_server.REGION_REST, "")) == []
+        assert pacer.wait.call_count == 2
+        assert pacer.failure.call_count == 1
+        assert pacer.success.call_count == 1
+
+    def test_rate(self):
+        msq = master_server.MasterServerQuerier(rate=30)
+        assert isinstance(msq.pacer, master_server.Pacer)
+        assert msq.pacer.rate == 30
+        assert master_server.MasterServerQuerier().pacer is None
+
+
+class TestMasterFilter(object):
+
+    def test_filters(self):
+        filter_ = master_server.MasterFilter(
+            napp=240, gametype=["tag", "tag2"], secure=True)
+        assert filter_ == r"\gametype\tag,tag2\napp\240\secure\1"
+        assert filter_.conditions == 3
+
+    def test_empty(self):
+        filter_ = master_server.MasterFilter(gametype=[])
+        assert filter_ == ""
+        assert filter_.conditions == 0
+
+    def test_nor(self):
+        filter_ = master_server.MasterFilter(
+            gamedir="tf", nor={"map": "ctf_2fort", "full": True})
+        assert filter_ == r"\gamedir\tf\nor\2\full\1\map\ctf_2fort"
+        assert filter_.conditions == 2
+
+    def test_nested(self):
+        filter_ = master_server.MasterFilter(
+            nor=master_server.MasterFilter(
+                map="ctf_2fort", nand={"full": True, "secure": False}))
+        assert filter_ == \
+            r"\nor\2\map\ctf_2fort\nand\2\full\1\secure\0"
+
+    def test_nested_empty(self):
+        assert master_server.MasterFilter(nand={}) == ""
+
+    @pytest.mark.parametrize("nested", [r"\gamedir\tf", 1])
+    def test_nested_invalid(self, nested):
+        with pytest.raises(TypeError):
+            master_server.MasterFilter(nested)
+        with pytest.raises(TypeError):
+            master_server.MasterFilter(nand=nested)
+
+    @pytest.mark.parametrize("copy_", [
+        copy.copy,
+        copy.deepcopy,
+        lambda filter_: pickle.loads(pickle.dumps(filter_)),
+    ])
+    def test_copy(self, copy_):
+        filter_ = master_server.MasterFilter(gamedir="tf", nor={"full": 1})
+        copied = copy_(filter_)
+        assert type(copied) is master_server.MasterFilter
+        assert copied == filter_
+        assert copied.conditions == 2
+        assert copied.encode_request(master_server.REGION_EUROPE) == \
+            filter_.encode_request(master_server.REGION_EUROPE)
+
+    def test_encode_request(self):
+        filter_ = master_server.MasterFilter(napp=440)
+        for address in ["0.0.0.0:0", "192.0.2.0:27015"]:
+            assert filter_.encode_request(
+                master_server.REGION_EUROPE, address) == \
+                messages.MasterServerRequest(
+                    region=master_server.REGION_EUROPE,
+                    address=address,
+                    filter=r"\napp\440",
+                ).encode()
+        assert filter_.encode_request(master_server.REGION_EUROPE) is \
+            filter_.encode_request(master_server.REGION_EUROPE)
+
+    def test_find(self, monkeypatch):
+        _query = mock.Mock(return_value=[])
+        monkeypatch.setattr(
+            master_server.MasterServerQuerier, "_query", _query)
+        filter_ = master_server.MasterFilter(gamedir="tf")
+        msq = master_server.MasterServerQuerier()
+        list(msq.find(region="eu", master_filter=filter_))
+        assert _query.call_args[0][1] is filter_
+        with pytest.raises(ValueError):
+            list(msq.find(region="eu", master_filter=filter_, secure=True))
+
+    def test_query(self, monkeypatch):
+        request = mock.Mock()
+        monkeypatch.setattr(
+            master_server.MasterServerQuerier, "request", request)
+        monkeypatch.setattr(
+            master_server.MasterServerQuerier, "get_response", mock.Mock(
+                return_value=b"\xFF\xFF\xFF\xFF\x66\x0A"
+                             b"\x08\x08\x08\x08\x69\x87"
+                             b"\x00\x00\x00\x00\x00\x00"))
+        filter_ = master_server.MasterFilter(gamedir="tf")
+        msq = master_server.MasterServerQuerier()
+        assert list(msq.find(region="eu", master_filter=filter_)) == \
+            [("8.8.8.8", 27015)]
+        assert request.call_args[0][0].encode() == \
+            filter_.encode_request(master_server.REGION_EUROPE)
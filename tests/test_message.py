@@ -14,6 +14,7 @@ import pytest
 import six
 
 from valve.source import messages
+from valve.source import util
 
 
 class TestUseDefault(object):
@@ -140,6 +141,20 @@ class TestMessageField(object):
         assert isinstance(remnants, bytes)
         assert remnants == b"\x01\x02\x03"
 
+    def test_decode_from(self):
+        field = messages.ShortField("")
+        value, offset = field.decode_from(
+            memoryview(b"\xFF\x01\x02\x03"), 1)
+        assert value == 0x0201
+        assert offset == 3
+
+    def test_decode_from_exhausted(self):
+        field = messages.ShortField("")
+        with pytest.raises(messages.BufferExhaustedError):
+            field.decode_from(b"\xFF\x01", 1)
+        with pytest.raises(messages.BufferExhaustedError):
+            field.decode_from(b"\xFF\x01", 2)
+
     def test_decode_junk(self, monkeypatch):
         field = messages.MessageField("")
         field.format = b"B"
@@ -203,6 +218,20 @@ class TestStringField(object):
         with pytest.raises(messages.BufferExhaustedError):
             field.decode(b"\xFF\xFF\xFF")
 
+    def test_decode_from(self):
+        field = messages.StringField("")
+        encoded = b"\x00\x48\x65\x6C\x6C\x6F\x00\x02\x00"
+        decoded, offset = field.decode_from(encoded, 1)
+        assert isinstance(decoded, six.text_type)
+        assert decoded == "Hello"
+        assert offset == 7
+        assert field.decode_from(encoded, offset) == ("\x02", 9)
+
+    def test_decode_from_no_null_terminator(self):
+        field = messages.StringField("")
+        with pytest.raises(messages.BufferExhaustedError):
+            field.decode_from(b"\x00\xFF\xFF", 1)
+
 
 class TestMessageArrayField(object):
 
@@ -420,6 +449,15 @@ class TestMessageDictField(object):
             assert key in set(six.moves.range(5))
             assert values[key] == 255
 
+    def test_decode_from(self):
+        ddict = messages.MessageDictField("",
+                                          messages.StringField("key"),
+                                          messages.StringField("value"), 2)
+        encoded = b"\xFFa\x00b\x00c\x00d\x00\xFF"
+        values, offset = ddict.decode_from(encoded, 1)
+        assert values == {"a": "b", "c": "d"}
+        assert offset == 9
+
 
 class TestMessage(object):
 
@@ -498,11 +536,138 @@ class TestMessage(object):
 
     # TODO: more complex structures, e.g. ArrayField and DictFields
 
+    def test_decode_compiled(self):
+        class Message(messages.Message):
+            fields = (
+                messages.ByteField("byte"),
+                messages.ShortField("short"),
+                messages.StringField("string"),
+                messages.LongField("long"),
+                messages.MSAddressEntryPortField("port"),
+                messages.PlatformField("platform"),
+            )
+        steps = Message._decoder()
+        assert len(steps) == 5
+        assert steps[0].struct.format in ("<Bh", b"<Bh")
+        message = Message.decode(
+            b"\x01\x02\x00foo\x00\x03\x00\x00\x00\x00\x50\x6C\xFF")
+        assert message.values == {
+            "byte": 1,
+            "short": 2,
+            "string": "foo",
+            "long": 3,
+            "port": 80,
+            "platform": 108,
+        }
+        assert isinstance(message["platform"], util.Platform)
+        assert message.payload == b"\xFF"
+
+    def test_decode_compiled_insufficient_buffer(self):
+        class Message(messages.Message):
+            fields = (
+                messages.ByteField("byte"),
+                messages.LongField("long"),
+            )
+        with pytest.raises(messages.BufferExhaustedError):
+            Message.decode(b"\x01\x02\x03")
+
+    def test_decode_compiled_validator(self):
+        class Message(messages.Message):
+            fields = (
+                messages.ByteField("byte", validators=[lambda x: x == 1]),
+                messages.LongField("long"),
+            )
+        assert Message.decode(b"\x01\x02\x00\x00\x00")["long"] == 2
+        with pytest.raises(messages.BrokenMessageError):
+            Message.decode(b"\x02\x02\x00\x00\x00")
+        with pytest.raises(messages.BrokenMessageError):
+            Message.decode(b"\x02")
+
+    def test_decode_from(self):
+        class Element(messages.Message):
+            fields = (
+                messages.ByteField("byte"),
+                messages.StringField("string"),
+            )
+        class Message(messages.Message):
+            fields = (
+                messages.ByteField("count"),
+                messages.MessageArrayField(
+                    "elements", Element,
+                    messages.MessageArrayField.value_of("count")),
+            )
+        encoded = b"\xFF\x02\x01a\x00\x02b\x00\xFF"
+        message, offset = Message.decode_from(memoryview(encoded), 1)
+        assert offset == 8
+        assert message.payload is None
+        assert [dict(element) for element in message["elements"]] == [
+            {"byte": 1, "string": "a"},
+            {"byte": 2, "string": "b"},
+        ]
+        assert Message.decode(encoded[1:]).payload == b"\xFF"
+
+    def test_decode_from_overridden_decode(self):
+        class Field(messages.ByteField):
+            def decode(self, buffer, values={}):
+                value, left_overs = super(Field, self).decode(buffer, values)
+                return value * 2, left_overs
+        class Element(messages.Message):
+            fields = (Field("byte"),)
+            @classmethod
+            def decode(cls, packet):
+                return super(Element, cls).decode(packet[1:])
+        class Message(messages.Message):
+            fields = (
+                Field("byte"),
+                messages.MessageArrayField("elements", Element, 2),
+            )
+        message = Message.decode(b"\x01\xFF\x02\xFF\x03\xFF")
+        assert message["byte"] == 2
+        assert [element["byte"] for element in message["elements"]] \
+            == [4, 6]
+        assert message.payload == b"\xFF"
+
+    def test_decode_compiled_fields_replaced(self):
+        class Message(messages.Message):
+            fields = (messages.ByteField("byte"),)
+        assert Message.decode(b"\x01\x02").values == {"byte": 1}
+        Message.fields = (messages.ShortField("short"),)
+        assert Message.decode(b"\x01\x02").values == {"short": 513}
+
 class TestFragment(object):
 
     def test_is_compressed(self):
-        assert messages.Fragment(message_id=(1 << 31) - 1).is_compressed
-        assert not messages.Fragment(message_id=1 << 30).is_compressed
+        assert messages.Fragment(message_id=-(1 << 31)).is_compressed
+        assert not messages.Fragment(message_id=(1 << 31) - 1).is_compressed
+        assert not messages.Fragment(message_id=1 << 16).is_compressed
+
+
+class TestInfoRequest(object):
+
+    def test_encode(self):
+        assert messages.InfoRequest().encode() == \
+            b"\x54Source Engine Query\x00"
+
+    def test_encode_no_challenge(self):
+        assert messages.InfoRequest(challenge=-1).encode() == \
+            messages.InfoRequest().encode()
+
+    def test_encode_challenge(self):
+        assert messages.InfoRequest(challenge=0x01020304).encode() == \
+            b"\x54Source Engine Query\x00\x04\x03\x02\x01"
+
+
+class TestRulesResponse(object):
+
+    def test_decode_prefixed(self):
+        encoded = b"\x45\x01\x00key\x00value\x00"
+        for packet in [encoded, b"\xFF\xFF\xFF\xFF" + encoded]:
+            assert messages.RulesResponse.decode(packet)["rules"] == \
+                {"key": "value"}
+        message, offset = messages.RulesResponse.decode_from(
+            b"\x00\xFF\xFF\xFF\xFF" + encoded, 1)
+        assert message["rule_count"] == 1
+        assert offset == 5 + len(encoded)
 
 
 class TestMSAddressEntry(object):
@@ -519,8 +684,60 @@ class TestMSAddressEntry(object):
         assert isinstance(remnants, bytes)
         assert remnants == b"\xFF\xFF"
 
+    def test_decode_from_ip(self):
+        ip, offset = messages.MSAddressEntryIPField("").decode_from(
+            b"\xFF\x00\x01\x02\x03\xFF", 1)
+        assert ip == "0.1.2.3"
+        assert offset == 5
+
     def test_is_null(self):
         assert messages.MSAddressEntry.decode(
             b"\x00\x00\x00\x00\x00\x00").is_null
         assert not messages.MSAddressEntry.decode(
             b"\x01\x02\x03\x04\x69\x87").is_null
+
+
+class TestMSAddressPage(object):
+
+    ENCODED = (b"\x01\x02\x03\x04\x69\x87"
+               b"\xC0\x00\x02\x01\x00\x50"
+               b"\x00\x00\x00\x00\x00\x00")
+
+    def test_decode(self):
+        response = messages.MasterServerResponse.decode(
+            b"\xFF\xFF\xFF\xFF\x66\x0A" + self.ENCODED + b"\x01\x02")
+        page = response["addresses"]
+        assert isinstance(page, messages.MSAddressPage)
+        assert len(page) == 3
+        assert list(page.addresses()) == [
+            ("1.2.3.4", 0x6987),
+            ("192.0.2.1", 80),
+            ("0.0.0.0", 0),
+        ]
+        assert response.payload == b"\x01\x02"
+
+    def test_arrays(self):
+        page = messages.MSAddressPage(self.ENCODED)
+        assert list(page.hosts) == [0x01020304, 0xC0000201, 0]
+        assert list(page.ports) == [0x6987, 80, 0]
+
+    def test_entries(self):
+        page = messages.MSAddressPage(self.ENCODED)
+        assert page[1].values == {"host": "192.0.2.1", "port": 80}
+        assert page[-1].is_null
+        assert [entry["port"] for entry in page[:2]] == [0x6987, 80]
+        with pytest.raises(IndexError):
+            page[3]
+
+    def test_from_entries(self):
+        page = messages.MSAddressPage.from_entries(
+            messages.MSAddressPage(self.ENCODED))
+        assert page.data == self.ENCODED
+        assert messages.MSAddressArrayField("").encode(list(page)) == \
+            self.ENCODED
+
+    def test_to_numpy(self):
+        numpy = pytest.importorskip("numpy")
+        records = messages.MSAddressPage(self.ENCODED).to_numpy()
+        assert records["host"].tolist() == [0x01020304, 0xC0000201, 0]
+        assert records["port"].tolist() == [0x6987, 80, 0]
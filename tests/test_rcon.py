@@ -4,6 +4,8 @@ from __future__ import (absolute_import,
                         unicode_literals, print_function, division)
 
 import argparse
+import select
+import struct
 import textwrap
 
 import docopt
@@ -96,6 +98,34 @@ class TestRCONMessage(object):
         with pytest.raises(valve.rcon.RCONMessageError):
             valve.rcon.RCONMessage.decode(b"\xFF\x00\x00\x00")
 
+    def test_decode_from(self):
+        buffer_ = bytearray(
+            b"\xAA\xBB"                  # Preceding
+            b"\x0D\x00\x00\x00"          # Size
+            b"\x05\x00\x00\x00"          # ID
+            b"\x02\x00\x00\x00"          # Type
+            b"foo"                       # Body
+            b"\x00\x00"                  # Terminators
+            b"\xCC\xDD"                  # Remainder
+        )
+        message, offset = valve.rcon.RCONMessage.decode_from(buffer_, 2)
+        assert message.id == 5
+        assert message.type == 2
+        assert message.body == b"foo"
+        assert isinstance(message.body, six.binary_type)
+        assert offset == 19
+
+    def test_decode_from_incomplete(self):
+        with pytest.raises(valve.rcon.RCONMessageError):
+            valve.rcon.RCONMessage.decode_from(
+                bytearray(b"\x00\x0D\x00\x00\x00\x05"), 1)
+
+    @pytest.mark.parametrize("size", [-4, -1, 0, 4, 9])
+    def test_decode_from_invalid_size(self, size):
+        buffer_ = struct.pack("<i", size) + b"\x00" * 16
+        with pytest.raises(valve.rcon.RCONMessageError):
+            valve.rcon.RCONMessage.decode_from(buffer_)
+
 
 class TestResponseBuffer(object):
 
@@ -121,6 +151,13 @@ class TestResponseBuffer(object):
         assert message.body == b""
         assert isinstance(message.body, six.binary_type)
 
+    @pytest.mark.timeout(timeout=3, method="thread")
+    @pytest.mark.parametrize("size", [-4, 0, 9])
+    def test_feed_invalid_size(self, size):
+        buffer_ = valve.rcon._ResponseBuffer()
+        with pytest.raises(valve.rcon.RCONMessageError):
+            buffer_.feed(struct.pack("<i", size) + b"\x00" * 16)
+
     def test_multi_part_response(self):
         part = (
             b"\x0D\x00\x00\x00"  # Size
@@ -154,35 +191,70 @@ class TestResponseBuffer(object):
         assert message.body == b"barbar"  # Black sheep ...
         assert isinstance(message.body, six.binary_type)
 
-    def test_discard_before(self):
-        auth_response = (
-            b"\x0A\x00\x00\x00"  # Size
-            b"\x00\x00\x00\x00"  # ID
-            b"\x02\x00\x00\x00"  # Type
-            b""                  # Body
-            b"\x00\x00"          # Terminators
-        )
+    def test_multi_part_response_large(self):
+        parts = [valve.rcon.RCONMessage(
+            5, valve.rcon.RCONMessage.Type.RESPONSE_VALUE,
+            "{:04}".format(index).encode("ascii") * 100)
+            for index in range(1000)]
+        parts.append(valve.rcon.RCONMessage(
+            5, valve.rcon.RCONMessage.Type.RESPONSE_VALUE, b""))
+        parts.append(valve.rcon.RCONMessage(
+            5, valve.rcon.RCONMessage.Type.RESPONSE_VALUE,
+            b"\x00\x01\x00\x00"))
+        encoded = memoryview(b"".join(part.encode() for part in parts))
         buffer_ = valve.rcon._ResponseBuffer()
-        buffer_.discard()
-        buffer_.feed(auth_response)
+        for offset in range(0, len(encoded), 4096):
+            buffer_.feed(encoded[offset:offset + 4096])
+        message = buffer_.pop()
+        assert message.id == 5
+        assert message.body == b"".join(part.body for part in parts[:-2])
+        assert buffer_._buffer == b""
         with pytest.raises(valve.rcon.RCONError):
             buffer_.pop()
 
-    def test_discard_after(self):
-        auth_response = (
-            b"\x0A\x00\x00\x00"  # Size
-            b"\x00\x00\x00\x00"  # ID
-            b"\x02\x00\x00\x00"  # Type
-            b""                  # Body
-            b"\x00\x00"          # Terminators
-        )
+    def test_stream(self):
+        parts = [valve.rcon.RCONMessage(
+            5, valve.rcon.RCONMessage.Type.RESPONSE_VALUE, body)
+            for body in [b"foo", b"", b"bar", b"", b"\x00\x01\x00\x00"]]
         buffer_ = valve.rcon._ResponseBuffer()
-        buffer_.feed(auth_response)
-        assert len(buffer_._responses) == 1
-        buffer_.discard()
+        chunks = buffer_.stream(5)
+        buffer_.feed(parts[0].encode())
+        assert list(chunks) == [b"foo"]
+        for part in parts[1:]:
+            buffer_.feed(part.encode())
+        assert list(chunks) == [b"foo", b"bar", None]
+        assert buffer_._streams == {}
+        assert buffer_._partial_responses == []
+        with pytest.raises(valve.rcon.RCONError):
+            buffer_.pop()
+
+    def test_stream_abandon(self):
+        parts = [valve.rcon.RCONMessage(
+            5, valve.rcon.RCONMessage.Type.RESPONSE_VALUE, body)
+            for body in [b"foo", b"bar", b"", b"\x00\x01\x00\x00"]]
+        buffer_ = valve.rcon._ResponseBuffer()
+        chunks = buffer_.stream(5)
+        buffer_.feed(parts[0].encode())
+        buffer_.abandon(5)
+        for part in parts[1:]:
+            buffer_.feed(part.encode())
+        assert list(chunks) == [b"foo"]
+        assert buffer_._streams == {}
+        assert buffer_._partial_responses == []
         with pytest.raises(valve.rcon.RCONError):
             buffer_.pop()
 
+    def test_stream_cancel(self):
+        buffer_ = valve.rcon._ResponseBuffer()
+        chunks = buffer_.stream(5)
+        buffer_.feed(valve.rcon.RCONMessage(
+            5, valve.rcon.RCONMessage.Type.RESPONSE_VALUE, b"").encode())
+        buffer_.cancel(5)
+        buffer_.cancel(5)
+        assert buffer_._streams == {}
+        assert buffer_._stream_empty is None
+        assert list(chunks) == []
+
     def test_clear(self):
         part = (
             b"\x0D\x00\x00\x00"  # Size
@@ -207,13 +279,9 @@ class TestResponseBuffer(object):
         assert buffer_._responses
         buffer_.clear()
         assert buffer_._buffer == b""
-        assert isinstance(buffer_._buffer, six.binary_type)
+        assert buffer_._offset == 0
         assert buffer_._partial_responses == []
-        assert buffer_._responses == []
-        buffer_.discard()
-        assert buffer_._discard_count == 1
-        buffer_.clear()
-        assert buffer_._discard_count == 0
+        assert not buffer_._responses
 
 
 class TestRCON(object):
@@ -221,9 +289,9 @@ class TestRCON(object):
     @pytest.mark.timeout(timeout=3, method="thread")
     def test_authenticate(self, rcon_server):
         e_request = rcon_server.expect(
-            0, valve.rcon.RCONMessage.Type.AUTH, b"password")
+            1, valve.rcon.RCONMessage.Type.AUTH, b"password")
         e_request.respond(
-            0, valve.rcon.RCONMessage.Type.AUTH_RESPONSE, b"")
+            1, valve.rcon.RCONMessage.Type.AUTH_RESPONSE, b"")
         rcon = valve.rcon.RCON(rcon_server.server_address, b"password")
         with rcon as rcon:
             assert rcon.authenticated is True
@@ -236,7 +304,7 @@ class TestRCON(object):
     @pytest.mark.timeout(timeout=3, method="thread")
     def test_authenticate_wrong_password(self, rcon_server):
         e_request = rcon_server.expect(
-            0, valve.rcon.RCONMessage.Type.AUTH, b"")
+            1, valve.rcon.RCONMessage.Type.AUTH, b"")
         e_request.respond(
             -1, valve.rcon.RCONMessage.Type.AUTH_RESPONSE, b"")
         rcon = valve.rcon.RCON(rcon_server.server_address, b"")
@@ -249,7 +317,7 @@ class TestRCON(object):
     @pytest.mark.timeout(timeout=3, method="thread")
     def test_authenticate_banned(self, rcon_server):
         e_request = rcon_server.expect(
-            0, valve.rcon.RCONMessage.Type.AUTH, b"password")
+            1, valve.rcon.RCONMessage.Type.AUTH, b"password")
         e_request.respond_close()
         rcon = valve.rcon.RCON(rcon_server.server_address, b"")
         with pytest.raises(valve.rcon.RCONAuthenticationError) as exc:
@@ -261,7 +329,7 @@ class TestRCON(object):
     @pytest.mark.timeout(timeout=3, method="thread")
     def test_authenticate_timeout(self, request, rcon_server):
         rcon_server.expect(
-            0, valve.rcon.RCONMessage.Type.AUTH, b"")
+            1, valve.rcon.RCONMessage.Type.AUTH, b"")
         rcon = valve.rcon.RCON(rcon_server.server_address, b"", 1.5)
         rcon.connect()
         request.addfinalizer(rcon.close)
@@ -271,16 +339,16 @@ class TestRCON(object):
     @pytest.mark.timeout(timeout=3, method="thread")
     def test_execute(self, request, rcon_server):
         e_request = rcon_server.expect(
-            0, valve.rcon.RCONMessage.Type.EXECCOMMAND, b"echo hello")
+            1, valve.rcon.RCONMessage.Type.EXECCOMMAND, b"echo hello")
         e_request.respond(
-            0, valve.rcon.RCONMessage.Type.RESPONSE_VALUE, b"hello")
-        e_request.respond_terminate_multi_part(0)
+            1, valve.rcon.RCONMessage.Type.RESPONSE_VALUE, b"hello")
+        e_request.respond_terminate_multi_part(1)
         rcon = valve.rcon.RCON(rcon_server.server_address, b"")
         rcon.connect()
         rcon._authenticated = True
         request.addfinalizer(rcon.close)
         response = rcon.execute("echo hello")
-        assert response.id == 0
+        assert response.id == 1
         assert response.type is response.Type.RESPONSE_VALUE
         assert response.body == b"hello"
         assert isinstance(response.body, six.binary_type)
@@ -300,19 +368,19 @@ class TestRCON(object):
     @pytest.mark.timeout(timeout=3, method="thread")
     def test_execute_no_block(self, request, rcon_server):
         e1_request = rcon_server.expect(
-            0, valve.rcon.RCONMessage.Type.EXECCOMMAND, b"echo hello")
+            1, valve.rcon.RCONMessage.Type.EXECCOMMAND, b"echo hello")
         e1_request.respond(
-            0, valve.rcon.RCONMessage.Type.RESPONSE_VALUE, b"hello")
-        e1_request.respond_terminate_multi_part(0)
+            1, valve.rcon.RCONMessage.Type.RESPONSE_VALUE, b"hello")
+        e1_request.respond_terminate_multi_part(1)
         rcon_server.expect(
-            0, valve.rcon.RCONMessage.Type.RESPONSE_VALUE, b"")
+            1, valve.rcon.RCONMessage.Type.RESPONSE_VALUE, b"")
         e2_request = rcon_server.expect(
-            0, valve.rcon.RCONMessage.Type.EXECCOMMAND, b"echo hello")
+            2, valve.rcon.RCONMessage.Type.EXECCOMMAND, b"echo hello")
         e2_request.respond(
-            0, valve.rcon.RCONMessage.Type.RESPONSE_VALUE, b"hello")
-        e2_request.respond_terminate_multi_part(0)
+            2, valve.rcon.RCONMessage.Type.RESPONSE_VALUE, b"hello")
+        e2_request.respond_terminate_multi_part(2)
         rcon_server.expect(
-            0, valve.rcon.RCONMessage.Type.RESPONSE_VALUE, b"")
+            2, valve.rcon.RCONMessage.Type.RESPONSE_VALUE, b"")
         rcon = valve.rcon.RCON(rcon_server.server_address, b"")
         rcon.connect()
         rcon._authenticated = True
@@ -320,7 +388,7 @@ class TestRCON(object):
         response_1 = rcon.execute("echo hello", block=False)
         response_2 = rcon.execute("echo hello", block=True)
         assert response_1 is None
-        assert response_2.id == 0
+        assert response_2.id == 2
         assert response_2.type is response_2.Type.RESPONSE_VALUE
         assert response_2.body == b"hello"
         assert isinstance(response_2.body, six.binary_type)
@@ -328,9 +396,9 @@ class TestRCON(object):
     @pytest.mark.timeout(timeout=3, method="thread")
     def test_execute_timeout(self, request, rcon_server):
         rcon_server.expect(
-            0, valve.rcon.RCONMessage.Type.EXECCOMMAND, b"")
+            1, valve.rcon.RCONMessage.Type.EXECCOMMAND, b"")
         rcon_server.expect(
-            0, valve.rcon.RCONMessage.Type.RESPONSE_VALUE, b"")
+            1, valve.rcon.RCONMessage.Type.RESPONSE_VALUE, b"")
         rcon = valve.rcon.RCON(rcon_server.server_address, b"", 1.5)
         rcon.connect()
         rcon._authenticated = True
@@ -338,13 +406,178 @@ class TestRCON(object):
         with pytest.raises(valve.rcon.RCONTimeoutError):
             rcon.execute("")
 
+    @pytest.mark.timeout(timeout=3, method="thread")
+    def test_execute_timeout_blocks(self, monkeypatch, request, rcon_server):
+        rcon_server.expect(
+            1, valve.rcon.RCONMessage.Type.EXECCOMMAND, b"")
+        rcon_server.expect(
+            1, valve.rcon.RCONMessage.Type.RESPONSE_VALUE, b"")
+        rcon = valve.rcon.RCON(rcon_server.server_address, b"", 0.5)
+        rcon.connect()
+        rcon._authenticated = True
+        request.addfinalizer(rcon.close)
+        timeouts = []
+
+        class select_spy(object):
+
+            @staticmethod
+            def select(read, write, error, timeout=None):
+                timeouts.append(timeout)
+                return select.select(read, write, error, timeout)
+
+        monkeypatch.setattr(valve.rcon, "select", select_spy)
+        with pytest.raises(valve.rcon.RCONTimeoutError):
+            rcon.execute("")
+        assert 1 <= len(timeouts) <= 3
+        assert 0 < timeouts[0] <= 0.5
+
+    @pytest.mark.timeout(timeout=3, method="thread")
+    def test_execute_after_timeout(self, request, rcon_server):
+        rcon_server.expect(
+            1, valve.rcon.RCONMessage.Type.EXECCOMMAND, b"")
+        rcon_server.expect(
+            1, valve.rcon.RCONMessage.Type.RESPONSE_VALUE, b"")
+        e_request = rcon_server.expect(
+            2, valve.rcon.RCONMessage.Type.EXECCOMMAND, b"echo hello")
+        e_request.respond(
+            1, valve.rcon.RCONMessage.Type.RESPONSE_VALUE, b"late")
+        e_request.respond_terminate_multi_part(1)
+        e_request.respond(
+            2, valve.rcon.RCONMessage.Type.RESPONSE_VALUE, b"hello")
+        e_request.respond_terminate_multi_part(2)
+        rcon = valve.rcon.RCON(rcon_server.server_address, b"", 0.5)
+        rcon.connect()
+        rcon._authenticated = True
+        request.addfinalizer(rcon.close)
+        with pytest.raises(valve.rcon.RCONTimeoutError):
+            rcon.execute("")
+        response = rcon.execute("echo hello")
+        assert response.id == 2
+        assert response.body == b"hello"
+        assert rcon._pending == {}
+
+    @pytest.mark.timeout(timeout=3, method="thread")
+    def test_execute_many(self, request, rcon_server):
+        for id_, command in enumerate([b"echo a", b"echo b"], 1):
+            e_request = rcon_server.expect(
+                id_, valve.rcon.RCONMessage.Type.EXECCOMMAND, command)
+            e_request.respond(
+                id_, valve.rcon.RCONMessage.Type.RESPONSE_VALUE,
+                command[-1:])
+            e_request.respond_terminate_multi_part(id_)
+            rcon_server.expect(
+                id_, valve.rcon.RCONMessage.Type.RESPONSE_VALUE, b"")
+        rcon = valve.rcon.RCON(rcon_server.server_address, b"")
+        rcon.connect()
+        rcon._authenticated = True
+        request.addfinalizer(rcon.close)
+        responses = rcon.execute_many(["echo a", "echo b"])
+        assert [response.id for response in responses] == [1, 2]
+        assert [response.body for response in responses] == [b"a", b"b"]
+
+    @pytest.mark.timeout(timeout=3, method="thread")
+    def test_execute_stream(self, request, rcon_server):
+        e_request = rcon_server.expect(
+            1, valve.rcon.RCONMessage.Type.EXECCOMMAND, b"find")
+        for body in [b"foo\n", b"bar\n"]:
+            e_request.respond(
+                1, valve.rcon.RCONMessage.Type.RESPONSE_VALUE, body)
+        e_request.respond_terminate_multi_part(1)
+        rcon_server.expect(
+            1, valve.rcon.RCONMessage.Type.RESPONSE_VALUE, b"")
+        rcon = valve.rcon.RCON(rcon_server.server_address, b"")
+        rcon.connect()
+        rcon._authenticated = True
+        request.addfinalizer(rcon.close)
+        assert list(rcon.execute_stream("find")) == [b"foo\n", b"bar\n"]
+
+    @pytest.mark.timeout(timeout=3, method="thread")
+    def test_execute_stream_stop(self, request, rcon_server):
+        e1_request = rcon_server.expect(
+            1, valve.rcon.RCONMessage.Type.EXECCOMMAND, b"find")
+        for body in [b"foo\n", b"bar\n"]:
+            e1_request.respond(
+                1, valve.rcon.RCONMessage.Type.RESPONSE_VALUE, body)
+        e1_request.respond_terminate_multi_part(1)
+        rcon_server.expect(
+            1, valve.rcon.RCONMessage.Type.RESPONSE_VALUE, b"")
+        e2_request = rcon_server.expect(
+            2, valve.rcon.RCONMessage.Type.EXECCOMMAND, b"echo hello")
+        e2_request.respond(
+            2, valve.rcon.RCONMessage.Type.RESPONSE_VALUE, b"hello")
+        e2_request.respond_terminate_multi_part(2)
+        rcon = valve.rcon.RCON(rcon_server.server_address, b"")
+        rcon.connect()
+        rcon._authenticated = True
+        request.addfinalizer(rcon.close)
+        stream = rcon.execute_stream("find")
+        assert next(stream) == b"foo\n"
+        stream.close()
+        response = rcon.execute("echo hello")
+        assert response.id == 2
+        assert response.body == b"hello"
+
+    @pytest.mark.timeout(timeout=3, method="thread")
+    def test_execute_stream_not_started(self, request, rcon_server):
+        e1_request = rcon_server.expect(
+            1, valve.rcon.RCONMessage.Type.EXECCOMMAND, b"find")
+        e1_request.respond(
+            1, valve.rcon.RCONMessage.Type.RESPONSE_VALUE, b"foo\n")
+        e1_request.respond_terminate_multi_part(1)
+        rcon_server.expect(
+            1, valve.rcon.RCONMessage.Type.RESPONSE_VALUE, b"")
+        e2_request = rcon_server.expect(
+            2, valve.rcon.RCONMessage.Type.EXECCOMMAND, b"echo hello")
+        e2_request.respond(
+            2, valve.rcon.RCONMessage.Type.RESPONSE_VALUE, b"hello")
+        e2_request.respond_terminate_multi_part(2)
+        rcon = valve.rcon.RCON(rcon_server.server_address, b"")
+        rcon.connect()
+        rcon._authenticated = True
+        request.addfinalizer(rcon.close)
+        stream = rcon.execute_stream("find")
+        assert rcon._responses._streams == {1: stream._chunks}
+        del stream
+        assert rcon._responses._streams == {1: None}
+        response = rcon.execute("echo hello")
+        assert response.body == b"hello"
+        assert rcon._responses._streams == {}
+
+    @pytest.mark.timeout(timeout=3, method="thread")
+    def test_execute_stream_timeout(self, request, rcon_server):
+        rcon_server.expect(
+            1, valve.rcon.RCONMessage.Type.EXECCOMMAND, b"find")
+        rcon_server.expect(
+            1, valve.rcon.RCONMessage.Type.RESPONSE_VALUE, b"")
+        rcon = valve.rcon.RCON(rcon_server.server_address, b"", 0.5)
+        rcon.connect()
+        rcon._authenticated = True
+        request.addfinalizer(rcon.close)
+        with pytest.raises(valve.rcon.RCONTimeoutError):
+            list(rcon.execute_stream("find"))
+        assert rcon._responses._streams == {}
+
+    def test_execute_stream_not_authenticated(self, request, rcon_server):
+        rcon = valve.rcon.RCON(rcon_server.server_address, b"")
+        rcon.connect()
+        request.addfinalizer(rcon.close)
+        with pytest.raises(valve.rcon.RCONError):
+            rcon.execute_stream("foo")
+
+    def test_execute_many_not_authenticated(self, request, rcon_server):
+        rcon = valve.rcon.RCON(rcon_server.server_address, b"")
+        rcon.connect()
+        request.addfinalizer(rcon.close)
+        with pytest.raises(valve.rcon.RCONError):
+            rcon.execute_many(["foo"])
+
     @pytest.mark.timeout(timeout=3, method="thread")
     def test_call(self, request, rcon_server):
         e_request = rcon_server.expect(
-            0, valve.rcon.RCONMessage.Type.EXECCOMMAND, b"echo hello")
+            1, valve.rcon.RCONMessage.Type.EXECCOMMAND, b"echo hello")
         e_request.respond(
-            0, valve.rcon.RCONMessage.Type.RESPONSE_VALUE, b"hello")
-        e_request.respond_terminate_multi_part(0)
+            1, valve.rcon.RCONMessage.Type.RESPONSE_VALUE, b"hello")
+        e_request.respond_terminate_multi_part(1)
         rcon = valve.rcon.RCON(rcon_server.server_address, b"")
         rcon.connect()
         rcon._authenticated = True
@@ -368,10 +601,10 @@ class TestRCON(object):
     @pytest.mark.timeout(timeout=3, method="thread")
     def test_call_text_bad(self, request, rcon_server):
         e_request = rcon_server.expect(
-            0, valve.rcon.RCONMessage.Type.EXECCOMMAND, b"")
+            1, valve.rcon.RCONMessage.Type.EXECCOMMAND, b"")
         e_request.respond(
-            0, valve.rcon.RCONMessage.Type.RESPONSE_VALUE, b"\xFF")
-        e_request.respond_terminate_multi_part(0)
+            1, valve.rcon.RCONMessage.Type.RESPONSE_VALUE, b"\xFF")
+        e_request.respond_terminate_multi_part(1)
         rcon = valve.rcon.RCON(rcon_server.server_address, b"")
         rcon.connect()
         rcon._authenticated = True
@@ -390,10 +623,10 @@ class TestRCON(object):
         2345 total convars/concommands
         """)
         e_request = rcon_server.expect(
-            0, valve.rcon.RCONMessage.Type.EXECCOMMAND, b"cvarlist")
+            1, valve.rcon.RCONMessage.Type.EXECCOMMAND, b"cvarlist")
         e_request.respond(
-            0, valve.rcon.RCONMessage.Type.RESPONSE_VALUE, cvarlist)
-        e_request.respond_terminate_multi_part(0)
+            1, valve.rcon.RCONMessage.Type.RESPONSE_VALUE, cvarlist)
+        e_request.respond_terminate_multi_part(1)
         rcon = valve.rcon.RCON(rcon_server.server_address, b"")
         rcon.connect()
         rcon._authenticated = True
@@ -414,10 +647,10 @@ class TestRCON(object):
     @pytest.mark.timeout(timeout=3, method="thread")
     def test_cvarlist_text_bad(self, request, rcon_server):
         e_request = rcon_server.expect(
-            0, valve.rcon.RCONMessage.Type.EXECCOMMAND, b"cvarlist")
+            1, valve.rcon.RCONMessage.Type.EXECCOMMAND, b"cvarlist")
         e_request.respond(
-            0, valve.rcon.RCONMessage.Type.RESPONSE_VALUE, b"\xFF")
-        e_request.respond_terminate_multi_part(0)
+            1, valve.rcon.RCONMessage.Type.RESPONSE_VALUE, b"\xFF")
+        e_request.respond_terminate_multi_part(1)
         rcon = valve.rcon.RCON(rcon_server.server_address, b"")
         rcon.connect()
         rcon._authenticated = True
@@ -427,10 +660,10 @@ class TestRCON(object):
     @pytest.mark.timeout(timeout=3, method="thread")
     def test_cvarlist_malformed(self, request, rcon_server):
         e_request = rcon_server.expect(
-            0, valve.rcon.RCONMessage.Type.EXECCOMMAND, b"cvarlist")
+            1, valve.rcon.RCONMessage.Type.EXECCOMMAND, b"cvarlist")
         e_request.respond(
-            0, valve.rcon.RCONMessage.Type.RESPONSE_VALUE, b"asdf")
-        e_request.respond_terminate_multi_part(0)
+            1, valve.rcon.RCONMessage.Type.RESPONSE_VALUE, b"asdf")
+        e_request.respond_terminate_multi_part(1)
         rcon = valve.rcon.RCON(rcon_server.server_address, b"")
         rcon.connect()
         rcon._authenticated = True
@@ -442,14 +675,14 @@ class TestExecute(object):
 
     def test(self, rcon_server):
         e1_request = rcon_server.expect(
-            0, valve.rcon.RCONMessage.Type.AUTH, b"password")
+            1, valve.rcon.RCONMessage.Type.AUTH, b"password")
         e1_request.respond(
-            0, valve.rcon.RCONMessage.Type.AUTH_RESPONSE, b"")
+            1, valve.rcon.RCONMessage.Type.AUTH_RESPONSE, b"")
         e2_request = rcon_server.expect(
-            0, valve.rcon.RCONMessage.Type.EXECCOMMAND, b"echo hello")
+            2, valve.rcon.RCONMessage.Type.EXECCOMMAND, b"echo hello")
         e2_request.respond(
-            0, valve.rcon.RCONMessage.Type.RESPONSE_VALUE, b"hello")
-        e2_request.respond_terminate_multi_part(0)
+            2, valve.rcon.RCONMessage.Type.RESPONSE_VALUE, b"hello")
+        e2_request.respond_terminate_multi_part(2)
         response = valve.rcon.execute(
             rcon_server.server_address, "password", "echo hello")
         assert response == "hello"
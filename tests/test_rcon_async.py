@@ -0,0 +1,141 @@
+# -*- coding: utf-8 -*-
+
+from __future__ import (absolute_import,
+                        unicode_literals, print_function, division)
+
+import sys
+
+import pytest
+
+if sys.version_info < (3, 5):
+    pytest.skip("asyncio RCON requires Python 3.5+",
+                allow_module_level=True)
+
+import asyncio
+
+import valve.rcon
+from valve.rcon import RCONMessage
+from valve import rcon_async
+
+
+@pytest.fixture
+def loop():
+    loop = asyncio.new_event_loop()
+    asyncio.set_event_loop(loop)
+    yield loop
+    asyncio.set_event_loop(None)
+    loop.close()
+
+
+def run(loop, rcon_server, function, password=b"password", **kwargs):
+
+    async def wrapper():
+        async with rcon_async.AsyncRCON(
+                rcon_server.server_address, password, **kwargs) as rcon:
+            return await function(rcon)
+
+    return loop.run_until_complete(wrapper())
+
+
+def expect_auth(rcon_server, id_=1):
+    rcon_server.expect(id_, RCONMessage.Type.AUTH, b"password").respond(
+        id_, RCONMessage.Type.AUTH_RESPONSE, b"")
+
+
+def expect_execute(rcon_server, id_, command, response, response_id=None):
+    if response_id is None:
+        response_id = id_
+    e_request = rcon_server.expect(
+        id_, RCONMessage.Type.EXECCOMMAND, command)
+    e_request.respond(
+        response_id, RCONMessage.Type.RESPONSE_VALUE, response)
+    e_request.respond_terminate_multi_part(response_id)
+    rcon_server.expect(id_, RCONMessage.Type.RESPONSE_VALUE, b"")
+
+
+class TestAsyncRCON(object):
+
+    @pytest.mark.timeout(timeout=3, method="thread")
+    def test_authenticate(self, loop, rcon_server):
+        expect_auth(rcon_server)
+        assert run(loop, rcon_server, lambda rcon: asyncio.sleep(
+            0, rcon.authenticated)) is True
+
+    @pytest.mark.timeout(timeout=3, method="thread")
+    def test_authenticate_wrong_password(self, loop, rcon_server):
+        rcon_server.expect(1, RCONMessage.Type.AUTH, b"").respond(
+            -1, RCONMessage.Type.AUTH_RESPONSE, b"")
+        with pytest.raises(valve.rcon.RCONAuthenticationError) as exc:
+            run(loop, rcon_server, lambda rcon: None, password=b"")
+        assert exc.value.banned is False
+
+    @pytest.mark.timeout(timeout=3, method="thread")
+    def test_authenticate_banned(self, loop, rcon_server):
+        rcon_server.expect(
+            1, RCONMessage.Type.AUTH, b"password").respond_close()
+        with pytest.raises(valve.rcon.RCONAuthenticationError) as exc:
+            run(loop, rcon_server, lambda rcon: None)
+        assert exc.value.banned is True
+
+    @pytest.mark.timeout(timeout=3, method="thread")
+    def test_authenticate_timeout(self, loop, rcon_server):
+        rcon_server.expect(1, RCONMessage.Type.AUTH, b"password")
+        with pytest.raises(valve.rcon.RCONTimeoutError):
+            run(loop, rcon_server, lambda rcon: None, timeout=0.2)
+
+    @pytest.mark.timeout(timeout=3, method="thread")
+    def test_execute(self, loop, rcon_server):
+        expect_auth(rcon_server)
+        expect_execute(rcon_server, 2, b"echo hello", b"hello")
+        response = run(loop, rcon_server,
+                       lambda rcon: rcon.execute("echo hello"))
+        assert response.id == 2
+        assert response.type is RCONMessage.Type.RESPONSE_VALUE
+        assert response.body == b"hello"
+
+    @pytest.mark.timeout(timeout=3, method="thread")
+    def test_execute_many(self, loop, rcon_server):
+        expect_auth(rcon_server)
+        # Responses arrive in the opposite order to the requests
+        expect_execute(rcon_server, 2, b"echo a", b"b", response_id=3)
+        expect_execute(rcon_server, 3, b"echo b", b"a", response_id=2)
+        responses = run(loop, rcon_server, lambda rcon: asyncio.gather(
+            rcon.execute("echo a"), rcon.execute("echo b")))
+        assert [response.body for response in responses] == [b"a", b"b"]
+
+    @pytest.mark.timeout(timeout=3, method="thread")
+    def test_call(self, loop, rcon_server):
+        expect_auth(rcon_server)
+        expect_execute(rcon_server, 2, b"echo hello", b"hello")
+        assert run(loop, rcon_server,
+                   lambda rcon: rcon("echo hello")) == "hello"
+
+    @pytest.mark.timeout(timeout=3, method="thread")
+    def test_execute_timeout(self, loop, rcon_server):
+        expect_auth(rcon_server)
+        rcon_server.expect(2, RCONMessage.Type.EXECCOMMAND, b"echo hello")
+        rcon_server.expect(2, RCONMessage.Type.RESPONSE_VALUE, b"")
+
+        async def execute(rcon):
+            with pytest.raises(valve.rcon.RCONTimeoutError):
+                await rcon.execute("echo hello", timeout=0.2)
+            assert not rcon._pending
+            return rcon.closed
+
+        assert run(loop, rcon_server, execute) is False
+
+    @pytest.mark.timeout(timeout=3, method="thread")
+    def test_execute_closed(self, loop, rcon_server):
+        expect_auth(rcon_server)
+        rcon_server.expect(
+            2, RCONMessage.Type.EXECCOMMAND, b"quit").respond_close()
+        with pytest.raises(valve.rcon.RCONCommunicationError):
+            run(loop, rcon_server, lambda rcon: rcon.execute("quit"))
+
+    def test_execute_not_connected(self, loop):
+        rcon = rcon_async.AsyncRCON(None, b"")
+        with pytest.raises(valve.rcon.RCONError):
+            loop.run_until_complete(rcon.execute("foo"))
+
+    def test_reexported(self):
+        assert valve.rcon.AsyncRCON is rcon_async.AsyncRCON
@@ -4,7 +4,9 @@
 from __future__ import (absolute_import,
                         unicode_literals, print_function, division)
 
+import errno
 import socket
+import threading
 
 import pytest
 
@@ -92,3 +94,141 @@ class TestBaseQuerier:
             querier.request()
         with pytest.raises(valve.source.QuerierClosedError):
             querier.get_response()
+
+
+class TestSharedSocket:
+
+    @pytest.fixture
+    def shared(self):
+        shared = valve.source.SharedSocket(("127.0.0.1", 0))
+        yield shared
+        shared.close()
+
+    @pytest.fixture
+    def peers(self):
+        peers = []
+        for _ in range(3):
+            peer = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+            peer.bind(("127.0.0.1", 0))
+            peers.append(peer)
+        yield peers
+        for peer in peers:
+            peer.close()
+
+    def test_querier(self, shared, peers):
+        querier = valve.source.BaseQuerier(
+            peers[0].getsockname(), shared=shared)
+        assert querier._socket is shared.socket
+        querier.close()
+        assert querier._socket is None
+        assert shared.socket is not None
+        assert not shared._queues
+        with pytest.raises(valve.source.QuerierClosedError):
+            querier.get_response()
+
+    def test_demultiplex(self, shared, peers):
+        first = valve.source.BaseQuerier(
+            peers[0].getsockname(), 1.0, shared)
+        second = valve.source.BaseQuerier(
+            peers[1].getsockname(), 1.0, shared)
+        peers[2].sendto(b"discarded", shared.socket.getsockname())
+        peers[1].sendto(b"second", shared.socket.getsockname())
+        peers[0].sendto(b"first", shared.socket.getsockname())
+        assert first.get_response() == b"first"
+        assert second.get_response() == b"second"
+        buffer_ = bytearray(16)
+        peers[1].sendto(b"again", shared.socket.getsockname())
+        assert second.get_response_into(buffer_) == 5
+        assert buffer_[:5] == b"again"
+        first.close()
+        second.close()
+
+    def test_request(self, shared, peers):
+        with valve.source.BaseQuerier(
+                peers[0].getsockname(), 1.0, shared) as querier:
+            querier.request()
+            peers[0].settimeout(1.0)
+            _, address = peers[0].recvfrom(16)
+        assert address == shared.socket.getsockname()
+
+    def test_request_host_name(self, shared, peers):
+        port = peers[0].getsockname()[1]
+        with valve.source.BaseQuerier(
+                ("localhost", port), 1.0, shared) as querier:
+            querier.request()
+            peers[0].settimeout(1.0)
+            _, address = peers[0].recvfrom(16)
+            peers[0].sendto(b"response", address)
+            assert querier.get_response() == b"response"
+
+    def test_timeout(self, shared, peers):
+        with valve.source.BaseQuerier(
+                peers[0].getsockname(), 0.1, shared) as querier:
+            with pytest.raises(valve.source.NoResponseError):
+                querier.get_response()
+
+    def test_threads(self, shared, peers):
+        queriers = [valve.source.BaseQuerier(peer.getsockname(), 2.0, shared)
+                    for peer in peers]
+        responses = {}
+
+        def receive(querier):
+            responses[querier.port] = querier.get_response()
+
+        threads = [threading.Thread(target=receive, args=(querier,))
+                   for querier in queriers]
+        for thread in threads:
+            thread.start()
+        for peer in reversed(peers):
+            peer.sendto(str(peer.getsockname()[1]).encode(),
+                        shared.socket.getsockname())
+        for thread in threads:
+            thread.join()
+        assert responses == {querier.port: str(querier.port).encode()
+                             for querier in queriers}
+        for querier in queriers:
+            querier.close()
+
+    @pytest.mark.parametrize("error",
+                             [errno.ECONNREFUSED, errno.ECONNRESET])
+    def test_read_icmp_error(self, monkeypatch, shared, error):
+        monkeypatch.setattr(
+            valve.source.select, "select", lambda r, w, x, t: (r, w, x))
+        socket_ = pytest.Mock()
+        socket_.recvfrom_into.side_effect = [
+            (5, ("192.0.2.0", 27015)),
+            socket.error(error, "ICMP"),
+        ]
+        assert shared._read(socket_, 1.0) == \
+            [(("192.0.2.0", 27015), b"\x00" * 5)]
+
+    def test_read_error(self, monkeypatch, shared):
+        monkeypatch.setattr(
+            valve.source.select, "select", lambda r, w, x, t: (r, w, x))
+        socket_ = pytest.Mock()
+        socket_.recvfrom_into.side_effect = socket.error(errno.EBADF, "Bad")
+        with pytest.raises(socket.error):
+            shared._read(socket_, 1.0)
+        assert socket_.recvfrom_into.call_count == 1
+
+    def test_receive_error(self, monkeypatch, shared, peers):
+        peer = shared.attach(peers[0].getsockname())
+        monkeypatch.setattr(
+            shared, "_read", pytest.Mock(
+                side_effect=socket.error(errno.EIO, "I/O error")))
+        with pytest.raises(valve.source.NoResponseError):
+            shared.receive(peer, 1.0)
+        assert shared._read.call_count == 1
+
+    def test_close(self, shared, peers):
+        querier = valve.source.BaseQuerier(
+            peers[0].getsockname(), 1.0, shared)
+        shared.close()
+        shared.close()
+        with pytest.raises(valve.source.QuerierClosedError):
+            querier.request()
+        with pytest.raises(valve.source.QuerierClosedError):
+            querier.get_response()
+        with pytest.raises(valve.source.QuerierClosedError):
+            shared.attach(peers[0].getsockname())
+        querier.close()
@@ -54,6 +54,13 @@ Alternately, if the --execute option is used then the given command will
 be executed and the response printed to stdout.
 """
 
+# Request IDs are signed 32-bit integers. Negative IDs are avoided as
+# servers respond to failed authentication with an ID of -1.
+_MAX_ID = 0x7FFFFFFF
+# Number of bytes read from the socket at a time. Large responses span
+# many packets so reading more at once means fewer system calls.
+_RECEIVE_SIZE = 65536
+
 
 class RCONError(Exception):
     """Base exception for all RCON-related errors."""
@@ -161,25 +168,46 @@ class RCONMessage(object):
             the remnants of the buffer. If the buffer contained exactly one
             message then the remaning buffer will be empty.
         """
+        message, offset = cls.decode_from(buffer_)
+        return message, buffer_[offset:]
+
+    @classmethod
+    def decode_from(cls, buffer_, offset=0):
+        """Decode a message from a buffer at the given offset.
+
+        Unlike :meth:`decode` the rest of the buffer isn't copied, so many
+        messages can be decoded from a large buffer in linear time.
+
+        :param buffer_: a bytestring, :class:`bytearray` or other object
+            supporting the buffer protocol.
+        :param int offset: the position in the buffer the message starts.
+
+        :raises MessageError: if the buffer doesn't contain a valid message
+            at the offset, including if the message's size is too small to
+            hold its ID, type and terminators.
+
+        :returns: a tuple containing the decoded :class:`RCONMessage` and
+            the offset of the end of the message in the buffer.
+        """
         size_field_length = struct.calcsize("<i")
-        if len(buffer_) < size_field_length:
+        available = len(buffer_) - offset
+        if available < size_field_length:
             raise RCONMessageError(
                 "Need at least {} bytes; got "
-                "{}".format(size_field_length, len(buffer_)))
-        size_field, raw_message = \
-            buffer_[:size_field_length], buffer_[size_field_length:]
-        size = struct.unpack("<i", size_field)[0]
-        if len(raw_message) < size:
+                "{}".format(size_field_length, available))
+        size = struct.unpack_from("<i", buffer_, offset)[0]
+        fixed_fields_size = struct.calcsize("<ii")
+        if size < fixed_fields_size + 2:
+            raise RCONMessageError("Invalid message size {}".format(size))
+        offset += size_field_length
+        available -= size_field_length
+        if available < size:
             raise RCONMessageError(
                 "Message is {} bytes long "
-                "but got {}".format(size, len(raw_message)))
-        message, remainder = raw_message[:size], raw_message[size:]
-        fixed_fields_size = struct.calcsize("<ii")
-        fixed_fields, body_and_terminators = \
-            message[:fixed_fields_size], message[fixed_fields_size:]
-        id_, type_ = struct.unpack("<ii", fixed_fields)
-        body = body_and_terminators[:-2]
-        return cls(id_, type_, body), remainder
+                "but got {}".format(size, available))
+        id_, type_ = struct.unpack_from("<ii", buffer_, offset)
+        body = bytes(buffer_[offset + fixed_fields_size:offset + size - 2])
+        return cls(id_, type_, body), offset + size
 
 
 class _ResponseBuffer(object):
@@ -197,20 +225,20 @@ class _ResponseBuffer(object):
     .. note::
         Multi-part responses are only applicable to ``EXECCOMAND`` requests.
 
-    In addition to handling multi-part responses transparently this class
-    provides the ability to :meth:`discard` incoming messages. When a
-    message is discarded it will be parsed from the buffer but then
-    silently dropped, meaning it cannot be retrieved via :meth:`pop`.
-
-    Message discarding works with multi-responses but it only applies to
-    the complete response, not the constituent parts.
+    Alternately, responses with a given ID can be streamed. Rather than
+    being rolled up, the body of each part is made available as soon as
+    it's received; see :meth:`stream`.
     """
 
+    _TERMINATOR = b"\x00\x01\x00\x00"
+
     def __init__(self):
-        self._buffer = b""
-        self._responses = []
+        self._buffer = bytearray()
+        self._offset = 0
+        self._responses = collections.deque()
         self._partial_responses = []
-        self._discard_count = 0
+        self._streams = {}
+        self._stream_empty = None
 
     def pop(self):
         """Pop first received message from the buffer.
@@ -221,89 +249,203 @@ class _ResponseBuffer(object):
         """
         if not self._responses:
             raise RCONError("Response buffer is empty")
-        return self._responses.pop(0)
+        return self._responses.popleft()
 
     def clear(self):
         """Clear the buffer.
 
         This clears the byte buffer, response buffer, partial response
-        buffer and the discard counter.
+        buffer and streams.
         """
         log.debug(
-            "Buffer cleared; %i bytes, %i messages, %i parts, %i discarded",
-            len(self._buffer),
+            "Buffer cleared; %i bytes, %i messages, %i parts",
+            len(self._buffer) - self._offset,
             len(self._responses),
             len(self._partial_responses),
-            self._discard_count,
         )
-        self._buffer = b""
-        del self._responses[:]
+        del self._buffer[:]
+        self._offset = 0
+        self._responses.clear()
         del self._partial_responses[:]
-        self._discard_count = 0
+        self._streams.clear()
+        self._stream_empty = None
+
+    def stream(self, id_):
+        """Stream the parts of the response with the given ID.
 
-    def _enqueue_or_discard(self, message):
-        """Enqueue a message for retrieval or discard it.
+        The non-empty body of each part of the response is appended to the
+        returned deque as it's received. Once the response is terminated
+        ``None`` is appended and the stream ends.
 
-        If the discard counter is zero then the message will be added to
-        the complete responses buffer. Otherwise the message is dropped
-        and the discard counter is decremented.
+        :param int id_: the ID of the response to stream.
+
+        :returns: a :class:`collections.deque` of the response's bodies.
         """
-        if self._discard_count == 0:
-            log.debug("Enqueuing message %r", message)
-            self._responses.append(message)
-        else:
-            log.debug("Discarding message %r", message)
-            self._discard_count -= 1
+        chunks = collections.deque()
+        self._streams[id_] = chunks
+        return chunks
+
+    def abandon(self, id_):
+        """Stop streaming a response.
+
+        Any remaining parts of the response are dropped as they're
+        received rather than being rolled up.
+
+        :param int id_: the ID of the streamed response.
+        """
+        if id_ in self._streams:
+            self._streams[id_] = None
+
+    def cancel(self, id_):
+        """Stop streaming a response straight away.
+
+        Unlike :meth:`abandon` the stream is forgotten immediately rather
+        than once the response is terminated, so it isn't kept should the
+        rest of the response never arrive.
+
+        :param int id_: the ID of the streamed response.
+        """
+        self._streams.pop(id_, None)
+        if self._stream_empty == id_:
+            self._stream_empty = None
+
+    def _stream_part(self, message):
+        """Add a part of a streamed response to its stream."""
+        chunks = self._streams[message.id]
+        if (self._stream_empty == message.id
+                and message.body == self._TERMINATOR):
+            del self._streams[message.id]
+            if chunks is not None:
+                chunks.append(None)
+        elif message.body and chunks is not None:
+            chunks.append(message.body)
+        self._stream_empty = None if message.body else message.id
+
+    def _enqueue(self, message):
+        """Add a message to the complete responses buffer."""
+        log.debug("Enqueuing message %r", message)
+        self._responses.append(message)
 
     def _consume(self):
         """Attempt to parse buffer into responses.
 
         This may or may not consume part or the whole of the buffer.
+        Consumed bytes are only removed from the buffer once no more
+        messages can be decoded from it.
+
+        :raises RCONMessageError: if a message is malformed. As the
+            stream can't be resynchronised the buffer is unusable after.
         """
-        while self._buffer:
-            try:
-                message, self._buffer = RCONMessage.decode(self._buffer)
-            except RCONMessageError:
-                return
+        size_field_length = struct.calcsize("<i")
+        while len(self._buffer) - self._offset >= size_field_length:
+            size = struct.unpack_from("<i", self._buffer, self._offset)[0]
+            if len(self._buffer) - self._offset - size_field_length < size:
+                break
+            message, self._offset = \
+                RCONMessage.decode_from(self._buffer, self._offset)
+            if (message.type is message.Type.RESPONSE_VALUE
+                    and message.id in self._streams):
+                log.debug("Received streamed part %r", message)
+                self._stream_part(message)
+            elif message.type is message.Type.RESPONSE_VALUE:
+                log.debug("Recevied message part %r", message)
+                self._partial_responses.append(message)
+                if len(self._partial_responses) >= 2:
+                    penultimate, last = self._partial_responses[-2:]
+                    if (not penultimate.body
+                            and last.body == self._TERMINATOR):
+                        self._enqueue(RCONMessage(
+                            self._partial_responses[0].id,
+                            RCONMessage.Type.RESPONSE_VALUE,
+                            b"".join(part.body for part
+                                     in self._partial_responses[:-2]),
+                        ))
+                        del self._partial_responses[:]
             else:
-                if message.type is message.Type.RESPONSE_VALUE:
-                    log.debug("Recevied message part %r", message)
-                    self._partial_responses.append(message)
-                    if len(self._partial_responses) >= 2:
-                        penultimate, last = self._partial_responses[-2:]
-                        if (not penultimate.body
-                                and last.body == b"\x00\x01\x00\x00"):
-                            self._enqueue_or_discard(RCONMessage(
-                                self._partial_responses[0].id,
-                                RCONMessage.Type.RESPONSE_VALUE,
-                                b"".join(part.body for part
-                                         in self._partial_responses[:-2]),
-                            ))
-                            del self._partial_responses[:]
-                else:
-                    if self._partial_responses:
-                        log.warning("Unexpected message %r", message)
-                    self._enqueue_or_discard(message)
+                if self._partial_responses:
+                    log.warning("Unexpected message %r", message)
+                self._enqueue(message)
+        del self._buffer[:self._offset]
+        self._offset = 0
 
     def feed(self, bytes_):
-        """Feed bytes into the buffer."""
+        """Feed bytes into the buffer.
+
+        :param bytes_: a bytestring or any other object supporting the
+            buffer protocol, such as a :class:`memoryview`.
+
+        :raises RCONMessageError: if a malformed message is received.
+        """
         self._buffer += bytes_
         self._consume()
 
-    def discard(self):
-        """Discard the next message in the buffer.
 
-        If there are already responses in the buffer then the leftmost
-        one will be dropped from the buffer. However, if there's no
-        responses currently in the buffer, as soon as one is received it
-        will be immediately dropped.
+class _ResponseStream(object):
+    """Iterator over the parts of a streamed response.
+
+    This is returned by :meth:`RCON.execute_stream`. The stream is
+    registered with the connection's response buffer as soon as the
+    command is sent. It's abandoned when the iterator is closed or
+    garbage collected, even if it was never iterated, so the rest of
+    the response isn't accumulated.
+
+    :param rcon: the :class:`RCON` connection the command was sent on.
+    :param int id_: the ID of the streamed response.
+    :param collections.deque chunks: the stream returned by
+        :meth:`_ResponseBuffer.stream`.
+    :param timeout: the number of seconds to wait for each part.
+    """
+
+    def __init__(self, rcon, id_, chunks, timeout):
+        self._rcon = rcon
+        self._id = id_
+        self._chunks = chunks
+        self._timeout = timeout
+
+    def __iter__(self):
+        return self
 
-        This can be called multiple times to discard multiple responses.
+    def __next__(self):
+        if self._chunks is None:
+            raise StopIteration
+        deadline = None if self._timeout is None \
+            else monotonic.monotonic() + self._timeout
+        try:
+            while not self._chunks:
+                if deadline is None:
+                    remaining = None
+                else:
+                    remaining = deadline - monotonic.monotonic()
+                    if remaining <= 0:
+                        raise RCONTimeoutError
+                self._rcon._read(remaining)
+        except RCONTimeoutError:
+            self._rcon._responses.cancel(self._id)
+            self._chunks = None
+            raise
+        except Exception:
+            self.close()
+            raise
+        chunk = self._chunks.popleft()
+        if chunk is None:
+            self._chunks = None
+            raise StopIteration
+        return chunk
+
+    next = __next__  # Python 2
+
+    def __del__(self):
+        self.close()
+
+    def close(self):
+        """Stop streaming the response.
+
+        The rest of the response is dropped as it's received. It's safe
+        to call this multiple times.
         """
-        if self._responses:
-            self._responses.pop(0)
-        else:
-            self._discard_count += 1
+        if self._chunks is not None:
+            self._rcon._responses.abandon(self._id)
+            self._chunks = None
 
 
 class RCON(object):
@@ -320,6 +462,11 @@ class RCON(object):
         self._socket = None
         self._closed = False
         self._responses = _ResponseBuffer()
+        self._pending = {}
+        self._authentication = None
+        self._last_id = 0
+        self._receive_buffer = bytearray(_RECEIVE_SIZE)
+        self._receive_view = memoryview(self._receive_buffer)
 
     def __enter__(self):
         self.connect()
@@ -368,76 +515,115 @@ class RCON(object):
         """Determine if the connection has been closed."""
         return self._closed
 
-    @staticmethod
-    def _timer(timeout):
-        """Iterable timeout timer.
-
-        :param timeout: the number of seconds to wait before timing out.
-            If ``None`` then the timer will never timeout.
-
-        :raises RCONTimeoutError: once the timeout is reached.
+    def _next_id(self):
+        """Get the ID to use for the next request.
 
-        :returns: an iterable that will yield items until the timeout
-            is reached.
+        IDs increment from one, wrapping around before they overflow.
         """
-        time_start = monotonic.monotonic()
-        while (timeout is None
-               or monotonic.monotonic() - time_start < timeout):
-            yield
-        raise RCONTimeoutError
+        self._last_id = self._last_id % _MAX_ID + 1
+        return self._last_id
 
-    def _request(self, type_, body):
-        """Send a request to the server.
+    def _request(self, *messages):
+        """Send requests to the server.
 
-        This sends an encoded message with the given type and body to the
-        server. The sent message will have an ID of zero.
+        All the messages are encoded and sent with a single write.
 
-        :param RCONMessage.Type type_: the type of message to send.
-        :param body: the body of the message to send as either a bytestring
-            or Unicode string.
+        :param messages: the messages to send as tuples containing the
+            message ID, the :class:`RCONMessage.Type` and the body as
+            either a bytestring or Unicode string.
         """
-        request = RCONMessage(0, type_, body)
-        self._socket.sendall(request.encode())
+        self._socket.sendall(b"".join(
+            RCONMessage(*message).encode() for message in messages))
 
-    def _read(self):
+    def _read(self, timeout=0):
         """Read bytes from the socket into the response buffer.
 
+        :param timeout: the number of seconds to wait for the socket to
+            become readable. If ``None`` then this blocks until it does.
+            By default this returns immediately if there's nothing to read.
+
         :raises RCONCommunicationError: if the socket is closed by the
             server or for any other unexpected socket-related error. In
             such cases the connection will also be closed.
+        :raises RCONMessageError: if the server sends a malformed message.
+            The connection is closed as the rest of the stream can't be
+            decoded.
         """
-        ready, _, _ = select.select([self._socket], [], [], 0)
+        ready, _, _ = select.select([self._socket], [], [], timeout)
         if not ready:
             return
         try:
-            i_bytes = self._socket.recv(4096)
+            size = self._socket.recv_into(self._receive_buffer)
         except socket.error:
             self.close()
             raise RCONCommunicationError
-        if not i_bytes:
+        if not size:
             self.close()
             raise RCONCommunicationError
-        self._responses.feed(i_bytes)
+        try:
+            self._responses.feed(self._receive_view[:size])
+        except RCONMessageError:
+            self.close()
+            raise
+        self._collect()
+
+    def _collect(self):
+        """Match complete responses in the buffer to pending requests.
+
+        ``AUTH_RESPONSE`` messages are matched to the pending
+        authentication request as failures are reported with an ID of -1.
+        Responses to requests which aren't pending, such as those which
+        have timed out, are dropped.
+        """
+        while True:
+            try:
+                message = self._responses.pop()
+            except RCONError:
+                return
+            if message.type is RCONMessage.Type.AUTH_RESPONSE:
+                id_ = self._authentication
+            else:
+                id_ = message.id
+            if id_ in self._pending and self._pending[id_] is None:
+                self._pending[id_] = message
+            else:
+                log.debug("Dropping unexpected message %r", message)
+
+    def _receive(self, ids, timeout):
+        """Receive the responses to pending requests.
 
-    def _receive(self, timeout):
-        """Receive messages from the server.
+        This will wait up to the given timeout for all the responses to be
+        received. Whether it succeeds or not, the requests are no longer
+        pending afterwards.
 
-        This will wait up to the configured timeout for a message to be
-        received.
+        :param ids: the IDs of the pending requests.
+        :param timeout: the number of seconds to wait for the responses. If
+            ``None`` then this blocks until they're received.
 
         :raises RCONCommunicationError: if the socket is closed by the
             server or for any other unexpected socket-related error.
-        :raises RCONTimeoutError: if the desired number of messages are
-            not recieved in the configured timeout.
+        :raises RCONTimeoutError: if the responses are not recieved in
+            the given timeout.
 
-        :returns: the :class:`RCONMessage` that was received.
+        :returns: a list of the :class:`RCONMessage` responses in the same
+            order as ``ids``.
         """
-        for _ in self._timer(timeout):
-            self._read()
-            try:
-                return self._responses.pop()
-            except RCONError:
-                continue
+        deadline = None if timeout is None \
+            else monotonic.monotonic() + timeout
+        try:
+            for id_ in ids:
+                while self._pending[id_] is None:
+                    if deadline is None:
+                        remaining = None
+                    else:
+                        remaining = deadline - monotonic.monotonic()
+                        if remaining <= 0:
+                            raise RCONTimeoutError
+                    self._read(remaining)
+            return [self._pending[id_] for id_ in ids]
+        finally:
+            for id_ in ids:
+                self._pending.pop(id_, None)
 
     def _ensure(state, value=True):  # pylint: disable=no-self-argument
         """Decorator to ensure a connection is in a specific state.
@@ -479,7 +665,7 @@ class RCON(object):
         """Create a connection to a server."""
         log.debug("Connecting to %s", self._address)
         self._socket = socket.socket(
-            socket.AF_INET, socket.SOCK_DGRAM)
+            socket.AF_INET, socket.SOCK_STREAM)
         self._socket.connect(self._address)
 
     @_ensure('connected')
@@ -517,9 +703,12 @@ class RCON(object):
         """
         if timeout is None:
             timeout = self._timeout
-        self._request(RCONMessage.Type.AUTH, self._password)
+        id_ = self._next_id()
+        self._request((id_, RCONMessage.Type.AUTH, self._password))
+        self._authentication = id_
+        self._pending[id_] = None
         try:
-            response = self._receive(timeout)
+            response, = self._receive([id_], timeout)
         except RCONCommunicationError:
             raise RCONAuthenticationError(True)
         except RCONTimeoutError:
@@ -534,6 +723,8 @@ class RCON(object):
                 self.close()
                 raise RCONAuthenticationError
             self._authenticated = True
+        finally:
+            self._authentication = None
 
     def close(self):
         """Close connection to a server."""
@@ -541,6 +732,7 @@ class RCON(object):
             self._socket.close()
             self._closed = True
             self._socket = None
+        self._pending.clear()
 
     @_ensure('connected')
     @_ensure('authenticated')
@@ -566,19 +758,103 @@ class RCON(object):
         :returns: the response to the command as a :class:`RCONMessage` or
             ``None`` depending on whether ``block`` was ``True`` or not.
         """
+        if block:
+            return self.execute_many([command], timeout)[0]
+        # The response is dropped when it arrives as it isn't pending
+        self._request(*self._execute_requests(self._next_id(), command))
+        self._read()
+
+    @_ensure('connected')
+    @_ensure('authenticated')
+    def execute_many(self, commands, timeout=None):
+        """Invoke many commands at once.
+
+        All the commands are sent together before waiting for any of the
+        responses, so executing many commands costs about the same as
+        executing one. Each command's response is matched to it by the
+        request ID.
+
+        :param commands: an iterable of the commands to execute as strings.
+        :param timeout: the number of seconds to wait for all of the
+            responses. If not given the connection-global timeout is used.
+
+        :raises RCONCommunicationError: if the socket is closed or in any
+            other erroneous state whilst issuing the requests or receiving
+            the responses.
+        :raises RCONTimeoutError: if the timeout is reached waiting for the
+            responses. This doesn't close the connection but all of the
+            responses are lost.
+
+        :returns: a list of the :class:`RCONMessage` responses in the same
+            order as the commands.
+        """
         if timeout is None:
             timeout = self._timeout
-        self._request(RCONMessage.Type.EXECCOMMAND, command)
-        self._request(RCONMessage.Type.RESPONSE_VALUE, "")
-        if block:
-            try:
-                return self._receive(timeout)
-            except RCONTimeoutError:
-                self._responses.discard()
-                raise
-        else:
-            self._responses.discard()
-            self._read()
+        ids = []
+        requests = []
+        for command in commands:
+            id_ = self._next_id()
+            ids.append(id_)
+            requests.extend(self._execute_requests(id_, command))
+        self._request(*requests)
+        for id_ in ids:
+            self._pending[id_] = None
+        return self._receive(ids, timeout)
+
+    @_ensure('connected')
+    @_ensure('authenticated')
+    def execute_stream(self, command, timeout=None):
+        """Invoke a command, streaming the response as it's received.
+
+        Rather than waiting for the complete response as :meth:`execute`
+        does, this yields each part of the response's body as soon as it's
+        received. Commands with very large or slow output can be processed
+        incrementally without holding the whole response in memory.
+
+        Parts are split wherever the server chooses, so they may end part
+        way through a line or even a multi-byte character.
+
+        .. code:: python
+
+            for chunk in rcon.execute_stream("cvarlist"):
+                sys.stdout.write(chunk.decode("utf-8", "replace"))
+
+        If the iterator is closed, or discarded, before the response ends
+        then the rest of the response is dropped as it's received.
+
+        :param str command: the command to execute.
+        :param timeout: the number of seconds to wait for each part of the
+            response. If not given the connection-global timeout is used.
+
+        :raises RCONCommunicationError: if the socket is closed or in any
+            other erroneous state whilst issuing the request or receiving
+            the response.
+        :raises RCONTimeoutError: if the timeout is reached waiting for a
+            part of the response. This doesn't close the connection but
+            the rest of the response is lost.
+
+        :returns: an iterator of the response's body as bytestrings.
+        """
+        if timeout is None:
+            timeout = self._timeout
+        id_ = self._next_id()
+        stream = _ResponseStream(
+            self, id_, self._responses.stream(id_), timeout)
+        self._request(*self._execute_requests(id_, command))
+        return stream
+
+    @staticmethod
+    def _execute_requests(id_, command):
+        """Get the requests needed to execute a command.
+
+        An empty ``RESPONSE_VALUE`` with the same ID follows the
+        ``EXECCOMMAND`` to prompt the server to terminate its multi-part
+        response; see :class:`_ResponseBuffer`.
+        """
+        return [
+            (id_, RCONMessage.Type.EXECCOMMAND, command),
+            (id_, RCONMessage.Type.RESPONSE_VALUE, ""),
+        ]
 
     def cvarlist(self):
         """Get all ConVars for an RCON connection.
@@ -948,5 +1224,9 @@ def _main(argv=None):
         print(execute(address, password, command))
 
 
+if sys.version_info >= (3, 5):
+    from .rcon_async import AsyncRCON  # pylint: disable=wrong-import-position
+
+
 if __name__ == "__main__":
     _main()
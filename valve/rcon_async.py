@@ -0,0 +1,263 @@
+# -*- coding: utf-8 -*-
+
+"""Asynchronous RCON client built on :mod:`asyncio`.
+
+.. note::
+    This module requires Python 3.5 or newer.
+"""
+
+from __future__ import (absolute_import,
+                        unicode_literals, print_function, division)
+
+import asyncio
+import logging
+
+from .rcon import (RCONAuthenticationError,
+                   RCONCommunicationError,
+                   RCONError,
+                   RCONMessage,
+                   RCONMessageError,
+                   RCONTimeoutError,
+                   _MAX_ID,
+                   _RECEIVE_SIZE,
+                   _ResponseBuffer)
+
+
+log = logging.getLogger(__name__)
+
+
+class AsyncRCON(object):
+    """An RCON connection for use with :mod:`asyncio`.
+
+    This offers the same functionality as :class:`valve.rcon.RCON` but
+    without blocking. Each request is given a unique ID which the server
+    echoes in its response, so any number of commands can be executed at
+    once over the same connection:
+
+    .. code:: python
+
+        async with AsyncRCON(address, password) as rcon:
+            status, users = await asyncio.gather(
+                rcon.execute("status"),
+                rcon.execute("users"),
+            )
+
+    :param address: the address of the server to connect to as a tuple
+        containing the host as a string and the port as an integer.
+    :param str password: the password to use to authenticate the
+        connection.
+    :param timeout: the default number of seconds to wait for responses.
+        If ``None`` then there is no timeout.
+    """
+
+    def __init__(self, address, password, timeout=None):
+        self._address = address
+        self._password = password
+        self._timeout = timeout if timeout else None
+        self._authenticated = False
+        self._closed = False
+        self._reader = None
+        self._writer = None
+        self._receiver = None
+        self._responses = _ResponseBuffer()
+        self._pending = {}
+        self._authentication = None
+        self._last_id = 0
+
+    async def __aenter__(self):
+        await self.connect()
+        await self.authenticate()
+        return self
+
+    async def __aexit__(self, type_, exception, traceback):
+        self.close()
+
+    async def __call__(self, command):
+        """Invoke a command, returning the response as Unicode.
+
+        See :meth:`valve.rcon.RCON.__call__`.
+        """
+        response = await self.execute(command)
+        try:
+            return response.text
+        except UnicodeDecodeError as exc:
+            raise RCONMessageError("Couldn't decode response: {}".format(exc))
+
+    @property
+    def connected(self):
+        """Determine if a connection has been made."""
+        return self._writer is not None
+
+    @property
+    def authenticated(self):
+        """Determine if the connection is authenticated."""
+        return self._authenticated
+
+    @property
+    def closed(self):
+        """Determine if the connection has been closed."""
+        return self._closed
+
+    def _next_id(self):
+        self._last_id = self._last_id % _MAX_ID + 1
+        return self._last_id
+
+    def _fail(self, exception):
+        """Fail every outstanding request with an exception."""
+        futures = list(self._pending.values())
+        if self._authentication is not None:
+            futures.append(self._authentication)
+        for future in futures:
+            if not future.done():
+                future.set_exception(exception)
+        self._pending.clear()
+        self._authentication = None
+
+    def _dispatch(self):
+        """Resolve the futures of every complete response received."""
+        while True:
+            try:
+                message = self._responses.pop()
+            except RCONError:
+                return
+            if message.type is RCONMessage.Type.AUTH_RESPONSE:
+                future, self._authentication = self._authentication, None
+            else:
+                future = self._pending.pop(message.id, None)
+            if future is None:
+                log.debug("Dropping unexpected message %r", message)
+            elif not future.done():
+                future.set_result(message)
+
+    async def _receive(self):
+        """Read responses until the connection is closed."""
+        try:
+            while True:
+                data = await self._reader.read(_RECEIVE_SIZE)
+                if not data:
+                    break
+                self._responses.feed(data)
+                self._dispatch()
+        except OSError:
+            pass
+        except RCONMessageError as exc:
+            self._fail(exc)
+        self._receiver = None
+        self.close()
+
+    def _request(self, id_, type_, body):
+        self._writer.write(RCONMessage(id_, type_, body).encode())
+
+    async def _wait(self, future, timeout):
+        if timeout is None:
+            timeout = self._timeout
+        try:
+            return await asyncio.wait_for(future, timeout)
+        except asyncio.TimeoutError:
+            raise RCONTimeoutError
+
+    def _check(self, connected=True, authenticated=None):
+        if self._closed:
+            raise RCONError("Must not be closed")
+        if self.connected is not connected:
+            raise RCONError("Must {}be connected".format(
+                "" if connected else "not "))
+        if authenticated is not None \
+                and self._authenticated is not authenticated:
+            raise RCONError("Must be authenticated")
+
+    async def connect(self):
+        """Create a connection to the server.
+
+        :raises RCONError: if already connected or closed.
+        """
+        self._check(connected=False)
+        log.debug("Connecting to %s", self._address)
+        self._reader, self._writer = \
+            await asyncio.open_connection(*self._address)
+        self._receiver = asyncio.ensure_future(self._receive())
+
+    async def authenticate(self, timeout=None):
+        """Authenticate with the server.
+
+        See :meth:`valve.rcon.RCON.authenticate`.
+
+        :param timeout: the number of seconds to wait for a response. If
+            not given the connection-global timeout is used.
+
+        :raises RCONError: if not connected or closed.
+        :raises RCONAuthenticationError: if authentication failed, either
+            due to being banned or providing the wrong password.
+        :raises RCONTimeoutError: if the server takes too long to respond.
+            The connection will be closed in this case as well.
+        """
+        self._check()
+        future = asyncio.get_event_loop().create_future()
+        self._authentication = future
+        self._request(self._next_id(),
+                      RCONMessage.Type.AUTH, self._password)
+        try:
+            response = await self._wait(future, timeout)
+        except RCONCommunicationError:
+            raise RCONAuthenticationError(True)
+        except RCONTimeoutError:
+            self.close()
+            raise
+        # Some servers send an empty RESPONSE_VALUE before the
+        # AUTH_RESPONSE which is left in the multi-part buffer.
+        self._responses.clear()
+        if response.id == -1:
+            self.close()
+            raise RCONAuthenticationError
+        self._authenticated = True
+
+    def close(self):
+        """Close the connection to the server.
+
+        Any outstanding requests fail with
+        :exc:`valve.rcon.RCONCommunicationError`. It's safe to call this
+        multiple times.
+        """
+        if self._writer is not None:
+            self._writer.close()
+            self._writer = None
+            self._closed = True
+        if self._receiver is not None:
+            self._receiver.cancel()
+            self._receiver = None
+        self._fail(RCONCommunicationError())
+
+    async def execute(self, command, timeout=None):
+        """Invoke a command.
+
+        Unlike :meth:`valve.rcon.RCON.execute` this always waits for the
+        response. Other commands may be executed whilst waiting.
+
+        :param str command: the command to execute.
+        :param timeout: the number of seconds to wait for a response. If
+            not given the connection-global timeout is used.
+
+        :raises RCONError: if not connected and authenticated or closed.
+        :raises RCONCommunicationError: if the connection is closed whilst
+            waiting for the response.
+        :raises RCONTimeoutError: if the timeout is reached waiting for a
+            response. This doesn't close the connection; the response is
+            dropped if it arrives later.
+
+        :returns: the response to the command as a
+            :class:`valve.rcon.RCONMessage`.
+        """
+        self._check(authenticated=True)
+        id_ = self._next_id()
+        future = asyncio.get_event_loop().create_future()
+        self._pending[id_] = future
+        self._request(id_, RCONMessage.Type.EXECCOMMAND, command)
+        # Prompts the server to terminate the multi-part response; see
+        # valve.rcon._ResponseBuffer.
+        self._request(id_, RCONMessage.Type.RESPONSE_VALUE, "")
+        try:
+            await self._writer.drain()
+            return await self._wait(future, timeout)
+        finally:
+            if self._pending.get(id_) is future:
+                del self._pending[id_]
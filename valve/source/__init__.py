@@ -4,11 +4,15 @@
 from __future__ import (absolute_import,
                         unicode_literals, print_function, division)
 
+import collections
+import errno
 import functools
 import select
 import socket
+import threading
 import warnings
 
+import monotonic
 import six
 
 
@@ -20,6 +24,184 @@ class QuerierClosedError(Exception):
     """Raised when attempting to use a querier after it's closed."""
 
 
+class SharedSocket(object):
+    """A UDP socket shared by many queriers.
+
+    Normally each querier creates, and closes, its own socket. When many
+    short-lived queriers are created this can be wasteful. Instead they
+    can be given a shared socket which they borrow for as long as they're
+    open:
+
+    .. code-block:: python
+
+        with valve.source.SharedSocket() as shared:
+            for address in addresses:
+                with ServerQuerier(address, shared=shared) as querier:
+                    querier.info()
+
+    Responses are routed to the querier which is attached for the address
+    the response was received from; responses from anywhere else are
+    discarded. Therefore queriers attached to the same server at the same
+    time will receive each other's responses.
+
+    Queriers sharing a socket may be used from different threads. Whilst
+    a thread is waiting for a response the others wait for it to receive
+    the next datagram rather than all reading from the socket at once.
+
+    The socket must be closed once it's no longer needed, after which any
+    queriers still using it will raise :exc:`QuerierClosedError`.
+
+    :param address: the local address to bind the socket to. By default
+        an ephemeral port is used.
+    """
+
+    def __init__(self, address=("", 0)):
+        self.socket = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        self.socket.bind(address)
+        self.socket.setblocking(False)
+        self._buffer = bytearray(65536)
+        self._condition = threading.Condition()
+        self._queues = {}
+        self._attached = collections.Counter()
+        self._reading = False
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, type_, exception, traceback):
+        self.close()
+
+    def close(self):
+        """Close the socket.
+
+        It is safe to call this multiple times.
+        """
+        with self._condition:
+            if self.socket is not None:
+                self.socket.close()
+                self.socket = None
+            self._queues.clear()
+            self._attached.clear()
+            self._condition.notify_all()
+
+    def attach(self, address):
+        """Start receiving responses from a server.
+
+        :param address: the ``(host, port)`` address of the server. If
+            the host isn't a numeric IPv4 address then it's resolved.
+
+        :raises QuerierClosedError: if the socket has been closed.
+
+        :returns: the numeric address responses will be received from.
+        """
+        host, port = address
+        try:
+            socket.inet_pton(socket.AF_INET, host)
+        except (socket.error, ValueError):
+            host = socket.gethostbyname(host)
+        peer = (host, port)
+        with self._condition:
+            if self.socket is None:
+                raise QuerierClosedError
+            self._attached[peer] += 1
+            self._queues.setdefault(peer, collections.deque())
+        return peer
+
+    def detach(self, peer):
+        """Stop receiving responses from a server.
+
+        Once every querier attached to the server has been detached, any
+        responses still queued for it are discarded.
+
+        :param peer: the address returned by :meth:`attach`.
+        """
+        with self._condition:
+            if self._attached[peer] > 1:
+                self._attached[peer] -= 1
+            else:
+                del self._attached[peer]
+                self._queues.pop(peer, None)
+
+    def _read(self, socket_, timeout):
+        # Wait for the socket to become readable then return every
+        # datagram available. Called without holding the condition.
+        datagrams = []
+        if select.select([socket_], [], [], timeout)[0]:
+            view = memoryview(self._buffer)
+            while True:
+                try:
+                    size, peer = socket_.recvfrom_into(self._buffer)
+                except socket.error as exc:
+                    # ICMP errors for any of the servers may be reported
+                    # by the socket. Any datagrams after them are read
+                    # the next time around.
+                    if exc.errno in {errno.EAGAIN, errno.EWOULDBLOCK,
+                                     errno.ECONNREFUSED, errno.ECONNRESET}:
+                        break
+                    raise
+                datagrams.append((peer, view[:size].tobytes()))
+        return datagrams
+
+    def receive(self, peer, timeout):
+        """Wait for a datagram from a server.
+
+        :param peer: the address returned by :meth:`attach`.
+        :param float timeout: how long to wait for the datagram.
+
+        :raises NoResponseError: if the timeout is reached before
+            a datagram is received.
+        :raises QuerierClosedError: if the socket has been closed.
+
+        :returns: the datagram as :class:`bytes`.
+        """
+        deadline = monotonic.monotonic() + timeout
+        with self._condition:
+            while True:
+                if self.socket is None:
+                    raise QuerierClosedError
+                queue = self._queues.get(peer)
+                if queue:
+                    return queue.popleft()
+                remaining = deadline - monotonic.monotonic()
+                if remaining <= 0:
+                    raise NoResponseError("Timed out waiting for response")
+                if self._reading:
+                    self._condition.wait(remaining)
+                    continue
+                self._reading = True
+                socket_ = self.socket
+                self._condition.release()
+                datagrams = []
+                error = None
+                try:
+                    datagrams = self._read(socket_, remaining)
+                except (socket.error, select.error, ValueError) as exc:
+                    error = exc
+                finally:
+                    self._condition.acquire()
+                    self._reading = False
+                    for address, data in datagrams:
+                        if address in self._queues:
+                            self._queues[address].append(data)
+                    self._condition.notify_all()
+                # If the socket was closed by another thread then that's
+                # reported on the next pass
+                if error is not None and self.socket is not None:
+                    six.raise_from(NoResponseError(error), error)
+
+    def receive_into(self, peer, buffer_, timeout):
+        """Wait for a datagram from a server and write it into a buffer.
+
+        See :meth:`receive`.
+
+        :returns: the size of the datagram in bytes.
+        """
+        data = self.receive(peer, timeout)
+        size = min(len(data), len(buffer_))
+        buffer_[:size] = data[:size]
+        return size
+
+
 class BaseQuerier(object):
     """Base class for implementing source server queriers.
 
@@ -47,17 +229,26 @@ class BaseQuerier(object):
     Once a querier has been closed, any attempts to make additional requests
     will result in a :exc:`QuerierClosedError` to be raised.
 
+    If a :class:`SharedSocket` is given then the querier borrows it
+    instead of creating its own socket. Closing the querier then leaves
+    the shared socket open for other queriers.
+
     :ivar host: Host requests will be sent to.
     :ivar port: Port number requests will be sent to.
     :ivar timeout: How long to wait for a response to a request.
     """
 
-    def __init__(self, address, timeout=5.0):
+    def __init__(self, address, timeout=5.0, shared=None):
         self.host = address[0]
         self.port = address[1]
         self.timeout = timeout
         self._contextual = False
-        self._socket = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        self._shared = shared
+        if shared is None:
+            self._socket = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        else:
+            self._peer = shared.attach(address)
+            self._socket = shared.socket
 
     def __enter__(self):
         self._contextual = True
@@ -73,7 +264,8 @@ class BaseQuerier(object):
 
         @functools.wraps(function)
         def wrapper(self, *args, **kwargs):
-            if self._socket is None:
+            if self._socket is None or (self._shared is not None
+                                        and self._shared.socket is None):
                 raise QuerierClosedError
             return function(self, *args, **kwargs)
 
@@ -88,7 +280,10 @@ class BaseQuerier(object):
             warnings.warn("{0.__class__.__name__} used as context "
                           "manager but close called before exit".format(self))
         if self._socket is not None:
-            self._socket.close()
+            if self._shared is None:
+                self._socket.close()
+            else:
+                self._shared.detach(self._peer)
             self._socket = None
 
     @_check_open
@@ -104,19 +299,32 @@ class BaseQuerier(object):
         :raises QuerierClosedError: If the querier has been closed.
         """
         request_final = b"".join(segment.encode() for segment in request)
-        self._socket.sendto(request_final, (self.host, self.port))
+        if self._shared is None:
+            address = (self.host, self.port)
+        else:
+            # Responses are routed by the address resolved when attaching
+            # to the shared socket, so requests must go to the same one.
+            address = self._peer
+        self._socket.sendto(request_final, address)
 
     @_check_open
-    def get_response(self):
+    def get_response(self, timeout=None):
         """Wait for a response to a request.
 
-        :raises NoResponseError: If the configured :attr:`timeout` is
-            reached before a response is received.
+        :param timeout: How long to wait for the response. If not given
+            the configured :attr:`timeout` is used.
+
+        :raises NoResponseError: If the timeout is reached before a
+            response is received.
         :raises QuerierClosedError: If the querier has been closed.
 
         :returns: The raw response as a :class:`bytes`.
         """
-        ready = select.select([self._socket], [], [], self.timeout)
+        if timeout is None:
+            timeout = self.timeout
+        if self._shared is not None:
+            return self._shared.receive(self._peer, timeout)
+        ready = select.select([self._socket], [], [], timeout)
         if not ready[0]:
             raise NoResponseError("Timed out waiting for response")
         try:
@@ -125,4 +333,33 @@ class BaseQuerier(object):
             six.raise_from(NoResponseError(exc))
         return data
 
+    @_check_open
+    def get_response_into(self, buffer_, timeout=None):
+        """Wait for a response and receive it into a buffer.
+
+        This is the same as :meth:`get_response` except the response is
+        written into the given writable buffer, such as a
+        :class:`bytearray`, rather than a new :class:`bytes` object.
+
+        :param timeout: How long to wait for the response. If not given
+            the configured :attr:`timeout` is used.
+
+        :raises NoResponseError: If the timeout is reached before a
+            response is received.
+        :raises QuerierClosedError: If the querier has been closed.
+
+        :returns: The size of the response in bytes.
+        """
+        if timeout is None:
+            timeout = self.timeout
+        if self._shared is not None:
+            return self._shared.receive_into(self._peer, buffer_, timeout)
+        ready = select.select([self._socket], [], [], timeout)
+        if not ready[0]:
+            raise NoResponseError("Timed out waiting for response")
+        try:
+            return ready[0][0].recv_into(buffer_)
+        except socket.error as exc:
+            six.raise_from(NoResponseError(exc))
+
     del _check_open
@@ -4,9 +4,21 @@
 from __future__ import (absolute_import,
                         unicode_literals, print_function, division)
 
+import bz2
+import collections
+import functools
+import heapq
+import select
+import socket
+import struct
+import threading
+import zlib
+
 import monotonic
+import six
 
 import valve.source
+from . import batch
 from . import messages
 
 
@@ -14,23 +26,658 @@ from . import messages
 NoResponseError = valve.source.NoResponseError
 
 
+# Maximum number of consecutive challenges a server may respond with
+# before a request is considered broken.
+_MAX_CHALLENGES = 3
+
+# Maximum number of incomplete split messages kept by a reassembler.
+# Older messages are discarded as new ones arrive.
+_MAX_SPLIT_MESSAGES = 8
+
+# Maximum number of buffers kept for reuse by a buffer pool.
+_MAX_POOLED_BUFFERS = 8
+
+# Largest buffer kept for reuse by a buffer pool. Larger buffers are left
+# to be garbage collected.
+_MAX_POOLED_BUFFER_SIZE = 65536
+
+# Largest MTU accepted for split messages. Source servers split responses
+# at no more than net_maxroutable, which is at most 1260 bytes, so this
+# leaves some slack whilst bounding the buffer preallocated per message.
+_MAX_SPLIT_MTU = 1400
+
+# Response type of a challenge, which may be sent in response to any
+# request, and the response types expected for each request otherwise.
+_CHALLENGE = 0x41
+_RESPONSE_TYPES = {
+    messages.InfoRequest: 0x49,
+    messages.PlayersRequest: 0x44,
+    messages.RulesRequest: 0x45,
+}
+
+# Precompiled equivalents of messages.Header and messages.Fragment.
+_HEADER = struct.Struct("<l")
+_FRAGMENT = struct.Struct("<lBBh")
+
+
+def _response_type(payload):
+    """Get the response type byte of a response payload.
+
+    Some servers prefix A2S_RULES responses with an additional
+    ``FF FF FF FF``; see :meth:`messages.RulesResponse.decode`.
+
+    :returns: the response type as an integer or ``None`` if the payload
+        is empty.
+    """
+    if payload.startswith(b"\xFF\xFF\xFF\xFF"):
+        payload = payload[4:]
+    if not payload:
+        return None
+    return six.indexbytes(payload, 0)
+
+
+def _resolve(address):
+    """Resolve a ``(host, port)`` address to a numeric IPv4 address.
+
+    Responses are received from numeric addresses so requests must be
+    tracked against them rather than host names.
+    """
+    host, port = address
+    try:
+        socket.inet_pton(socket.AF_INET, host)
+    except (socket.error, ValueError):
+        host = socket.gethostbyname(host)
+    return host, port
+
+
+class ChallengeCache(object):
+    """Cache of challenge numbers issued by servers.
+
+    A2S_PLAYER and A2S_RULES requests must include a challenge number
+    which is obtained from the server by an additional request. Servers
+    will continue to accept a challenge number for some time after it's
+    issued, so caching it avoids a round trip on subsequent requests.
+    The same challenge number is used for both types of request.
+
+    If a server no longer accepts a cached challenge number then it
+    responds with a new one. The queriers in this module handle this
+    transparently by repeating the request with the new challenge.
+
+    By default all queriers share :data:`CHALLENGE_CACHE`. The cache is
+    safe to use from multiple threads.
+
+    :ivar ttl: the number of seconds a challenge number is cached for.
+    """
+
+    def __init__(self, ttl=30.0):
+        self.ttl = ttl
+        # Ordered by expiry, which is insertion order as the TTL is fixed,
+        # so expired entries can be pruned from the front.
+        self._challenges = collections.OrderedDict()
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        with self._lock:
+            return len(self._challenges)
+
+    def get(self, address):
+        """Get the cached challenge number for a server.
+
+        :param address: the server address as a ``(host, port)`` tuple.
+
+        :returns: the challenge number as an integer or ``None`` if there
+            is no challenge cached for the server.
+        """
+        with self._lock:
+            entry = self._challenges.get(address)
+            if entry is None:
+                return None
+            challenge, expires = entry
+            if monotonic.monotonic() >= expires:
+                del self._challenges[address]
+                return None
+            return challenge
+
+    def set(self, address, challenge):
+        """Cache a challenge number for a server.
+
+        Any expired challenge numbers are removed at the same time so the
+        cache doesn't grow without bound when many servers are queried.
+        """
+        now = monotonic.monotonic()
+        with self._lock:
+            self._challenges.pop(address, None)
+            while self._challenges:
+                oldest = next(iter(self._challenges))
+                if self._challenges[oldest][1] > now:
+                    break
+                del self._challenges[oldest]
+            self._challenges[address] = (challenge, now + self.ttl)
+
+    def discard(self, address):
+        """Remove any cached challenge number for a server."""
+        with self._lock:
+            self._challenges.pop(address, None)
+
+    def clear(self):
+        """Remove all cached challenge numbers."""
+        with self._lock:
+            self._challenges.clear()
+
+
+#: The :class:`ChallengeCache` used by default by all queriers.
+CHALLENGE_CACHE = ChallengeCache()
+
+
+class UnresponsiveCache(object):
+    """Cache of servers which have stopped responding.
+
+    When the same servers are queried repeatedly, those which are down
+    would otherwise cost a full timeout every time. Once a server has
+    failed to respond to ``threshold`` consecutive requests it's
+    considered unresponsive for a period, during which queriers using
+    the cache fail immediately with :exc:`valve.source.NoResponseError`
+    rather than sending it requests.
+
+    Once the period expires the server is queried again. Each further
+    failure doubles the period, up to ``maximum``, so servers which stay
+    down are retried less and less often. A single response resets the
+    server entirely.
+
+    The same cache can be shared by any number of queriers.
+
+    :ivar base: the number of seconds a server is first considered
+        unresponsive for.
+    :ivar maximum: the longest a server is considered unresponsive for
+        in seconds.
+    :ivar threshold: the number of consecutive failures after which a
+        server is considered unresponsive.
+    """
+
+    def __init__(self, base=30.0, maximum=3600.0, threshold=2):
+        if threshold < 1:
+            raise ValueError("Threshold must be at least one")
+        self.base = base
+        self.maximum = maximum
+        self.threshold = threshold
+        self._failures = {}
+
+    def __len__(self):
+        return len(self._failures)
+
+    def unresponsive(self, address):
+        """Determine if a server is currently considered unresponsive.
+
+        :param address: the server address as a ``(host, port)`` tuple.
+        """
+        entry = self._failures.get(address)
+        return (entry is not None and entry[1] is not None
+                and monotonic.monotonic() < entry[1])
+
+    def check(self, address):
+        """Fail if a server is currently considered unresponsive.
+
+        :raises valve.source.NoResponseError: if the server is
+            unresponsive.
+        """
+        if self.unresponsive(address):
+            raise valve.source.NoResponseError(
+                "{0[0]}:{0[1]} is unresponsive".format(address))
+
+    def failure(self, address):
+        """Record that a server failed to respond."""
+        failures = self._failures.get(address, (0, None))[0] + 1
+        if failures >= self.threshold:
+            period = min(self.maximum,
+                         self.base * 2 ** (failures - self.threshold))
+            until = monotonic.monotonic() + period
+        else:
+            until = None
+        self._failures[address] = (failures, until)
+
+    def success(self, address):
+        """Record that a server responded."""
+        self._failures.pop(address, None)
+
+    def discard(self, address):
+        """Forget any failures of a server."""
+        self._failures.pop(address, None)
+
+    def clear(self):
+        """Forget all failures."""
+        self._failures.clear()
+
+
+class RTTEstimator(object):
+    """Estimate round-trip times to servers to derive request timeouts.
+
+    Rather than waiting the same fixed time for every server, queriers
+    given an estimator wait for a timeout derived from the round-trip
+    times previously observed for each server. The estimate follows TCP's
+    retransmission timer (:rfc:`6298`): a smoothed round-trip time and its
+    variance are maintained for each server and the timeout is the
+    smoothed time plus four times the variance.
+
+    Servers which haven't been timed yet are given the ``initial``
+    timeout. Each time a request goes unanswered the server's timeout is
+    doubled until a response is timed again. Round trips for requests
+    which had to be retransmitted aren't timed, as it's ambiguous which
+    request the response was for.
+
+    The querier's own ``timeout`` becomes a budget for the request as a
+    whole, which :meth:`retries` divides into retransmissions. Therefore
+    healthy servers which normally respond quickly are retried several
+    times with short timeouts, whereas servers that haven't responded
+    before are given up on sooner. Servers which are slow to respond get
+    a correspondingly long timeout.
+
+    :ivar initial: the timeout in seconds for servers which haven't been
+        timed.
+    :ivar minimum: the lower bound of any timeout in seconds.
+    :ivar maximum: the upper bound of any timeout in seconds.
+    :ivar max_retries: the upper bound of :meth:`retries`.
+    """
+
+    _ALPHA = 1 / 8
+    _BETA = 1 / 4
+    _K = 4
+
+    def __init__(self, initial=1.0, minimum=0.2, maximum=5.0, max_retries=3):
+        if not 0 < minimum <= initial <= maximum:
+            raise ValueError("Invalid initial, minimum or maximum timeout")
+        self.initial = initial
+        self.minimum = minimum
+        self.maximum = maximum
+        self.max_retries = max_retries
+        self._estimates = {}
+
+    def __len__(self):
+        return len(self._estimates)
+
+    def get(self, address):
+        """Get the round-trip time estimate for a server.
+
+        :param address: the server address as a ``(host, port)`` tuple.
+
+        :returns: a tuple of the smoothed round-trip time and its variance
+            in seconds, or ``None`` if the server hasn't been timed.
+        """
+        estimate = self._estimates.get(address)
+        if estimate is None or estimate[0] is None:
+            return None
+        return estimate[0], estimate[1]
+
+    def observe(self, address, rtt):
+        """Update the estimate for a server with a measured round trip.
+
+        :param address: the server address as a ``(host, port)`` tuple.
+        :param float rtt: the round-trip time in seconds.
+        """
+        estimate = self._estimates.get(address)
+        if estimate is None or estimate[0] is None:
+            self._estimates[address] = [rtt, rtt / 2, 0]
+        else:
+            srtt, rttvar, _ = estimate
+            rttvar = ((1 - self._BETA) * rttvar
+                      + self._BETA * abs(srtt - rtt))
+            srtt = (1 - self._ALPHA) * srtt + self._ALPHA * rtt
+            self._estimates[address] = [srtt, rttvar, 0]
+
+    def timed_out(self, address):
+        """Back off the timeout of a server after a request went unanswered.
+        """
+        estimate = self._estimates.setdefault(address, [None, None, 0])
+        if self.timeout(address) < self.maximum:
+            estimate[2] += 1
+
+    def timeout(self, address):
+        """Get the timeout for the next request to a server in seconds."""
+        estimate = self._estimates.get(address)
+        if estimate is None:
+            return self.initial
+        srtt, rttvar, backoff = estimate
+        if srtt is None:
+            timeout = self.initial
+        else:
+            timeout = max(self.minimum, srtt + self._K * rttvar)
+        return min(self.maximum, timeout * 2 ** backoff)
+
+    def retries(self, address, budget):
+        """Get how many times a request to a server may be retransmitted.
+
+        This is the number of retransmissions, each with a timeout twice
+        that of the last, that fit within the budget.
+
+        :param address: the server address as a ``(host, port)`` tuple.
+        :param float budget: the total time in seconds the request
+            may take.
+        """
+        timeout = self.timeout(address)
+        elapsed = timeout
+        retries = 0
+        while retries < self.max_retries:
+            timeout = min(self.maximum, timeout * 2)
+            elapsed += timeout
+            if elapsed > budget:
+                break
+            retries += 1
+        return retries
+
+    def discard(self, address):
+        """Remove the estimate for a server."""
+        self._estimates.pop(address, None)
+
+    def clear(self):
+        """Remove all estimates."""
+        self._estimates.clear()
+
+
+class _BufferPool(object):
+    """A pool of reusable buffers for reassembling split messages."""
+
+    def __init__(self):
+        self._buffers = []
+
+    def acquire(self, size):
+        """Get a :class:`bytearray` of at least the given size."""
+        for index, buffer_ in enumerate(self._buffers):
+            if len(buffer_) >= size:
+                return self._buffers.pop(index)
+        return bytearray(size)
+
+    def release(self, buffer_):
+        """Return a buffer to the pool.
+
+        Buffers larger than :data:`_MAX_POOLED_BUFFER_SIZE` are dropped
+        rather than kept.
+        """
+        if (len(self._buffers) < _MAX_POOLED_BUFFERS
+                and len(buffer_) <= _MAX_POOLED_BUFFER_SIZE):
+            self._buffers.append(buffer_)
+
+
+class _SplitMessage(object):
+    """A message that has been split into multiple fragments.
+
+    Each fragment's payload is copied straight into a preallocated
+    buffer, in a slot given by its ID and the message's MTU. This means
+    fragments can be received in any order. Once all fragments have been
+    received the slots are compacted to form the complete payload.
+
+    :ivar count: the total number of fragments in the message.
+    :ivar mtu: the maximum size of each fragment.
+    :ivar buffer: the :class:`bytearray` fragments are copied into.
+    """
+
+    def __init__(self, count, mtu, buffer_):
+        self.count = count
+        self.mtu = mtu
+        self.buffer = buffer_
+        self._sizes = [None] * count
+        self._received = 0
+
+    def _store(self, fragment_id, payload):
+        """Copy a fragment's payload into its slot in the buffer.
+
+        :returns: ``False`` if the fragment had already been received.
+        """
+        if fragment_id >= self.count:
+            raise messages.BrokenMessageError(
+                "Fragment {} of message with {} fragments".format(
+                    fragment_id, self.count))
+        if len(payload) > self.mtu:
+            raise messages.BrokenMessageError(
+                "Fragment of {} bytes exceeds MTU of {}".format(
+                    len(payload), self.mtu))
+        if self._sizes[fragment_id] is not None:
+            return False
+        offset = fragment_id * self.mtu
+        self.buffer[offset:offset + len(payload)] = payload
+        self._sizes[fragment_id] = len(payload)
+        self._received += 1
+        return True
+
+    def feed(self, fragment_id, payload):
+        """Add a fragment to the message.
+
+        :param payload: the payload of the fragment. This can be any
+            bytes-like object, such as a :class:`memoryview` of a receive
+            buffer, as it's copied.
+
+        :raises BrokenMessageError: if the fragment is inconsistent with
+            the message.
+
+        :returns: the payload of the whole message if all the fragments
+            have been fed, otherwise ``None``.
+        """
+        self._store(fragment_id, payload)
+        if self._received < self.count:
+            return None
+        view = memoryview(self.buffer)
+        end = 0
+        for fragment_id, size in enumerate(self._sizes):
+            offset = fragment_id * self.mtu
+            if offset != end:
+                view[end:end + size] = view[offset:offset + size]
+            end += size
+        return view[:end].tobytes()
+
+
+class _CompressedMessage(_SplitMessage):
+    """A split message whose payload is compressed with bzip2.
+
+    The first fragment is prefixed with the size and CRC32 checksum of
+    the decompressed payload. Fragments are decompressed in order as
+    soon as they're available, rather than after the compressed payload
+    has been reassembled. Fragments received out of order are held in
+    their slots until their predecessors have been decompressed.
+    """
+
+    def __init__(self, count, mtu, buffer_):
+        super(_CompressedMessage, self).__init__(count, mtu, buffer_)
+        self._decompressor = bz2.BZ2Decompressor()
+        self._next = 0
+        self._chunks = []
+        self._size = 0
+        self._crc32 = 0
+        self._compression = None
+
+    def _decompress(self, payload):
+        if self._next == 0:
+            self._compression = messages.FragmentCompressionData.decode(
+                memoryview(payload).tobytes())
+            payload = self._compression.payload
+        try:
+            chunk = self._decompressor.decompress(payload)
+        except (IOError, OSError, EOFError, ValueError) as exc:
+            raise messages.BrokenMessageError(
+                "Couldn't decompress message: {}".format(exc))
+        self._chunks.append(chunk)
+        self._size += len(chunk)
+        self._crc32 = zlib.crc32(chunk, self._crc32)
+        self._next += 1
+
+    def feed(self, fragment_id, payload):
+        """Add a fragment to the message.
+
+        :raises BrokenMessageError: if the decompressed payload is invalid
+            or doesn't match the size or checksum given in the first
+            fragment.
+
+        :returns: the decompressed payload of the whole message if all
+            the fragments have been fed, otherwise ``None``.
+        """
+        if fragment_id == self._next and fragment_id < self.count:
+            if self._sizes[fragment_id] is None:
+                self._sizes[fragment_id] = len(payload)
+                self._received += 1
+                self._decompress(payload)
+        elif not self._store(fragment_id, payload):
+            return None
+        view = memoryview(self.buffer)
+        while (self._next < self.count
+                and self._sizes[self._next] is not None):
+            offset = self._next * self.mtu
+            self._decompress(
+                view[offset:offset + self._sizes[self._next]].tobytes())
+        if self._next < self.count:
+            return None
+        if self._size != self._compression["decompressed_size"]:
+            raise messages.BrokenMessageError(
+                "Decompressed message is {} bytes; expected {}".format(
+                    self._size, self._compression["decompressed_size"]))
+        if ((self._crc32 & 0xFFFFFFFF)
+                != (self._compression["crc32"] & 0xFFFFFFFF)):
+            raise messages.BrokenMessageError(
+                "Decompressed message failed CRC32 check")
+        return b"".join(self._chunks)
+
+
+class _Reassembler(object):
+    """Reassemble split A2S responses.
+
+    Raw datagrams are fed into the reassembler as they are received. If
+    a datagram holds a complete message then its payload is returned
+    immediately. Otherwise the fragments are collected, keyed against
+    their message ID, until every fragment of the message has arrived.
+    Compressed messages are decompressed transparently.
+
+    The headers are unpacked in place, so datagrams can be given as
+    a :class:`memoryview` of a receive buffer which is reused once
+    :meth:`feed` returns.
+
+    :param pool: the :class:`_BufferPool` to take buffers for split
+        messages from. Reassemblers used from the same thread may share
+        a pool.
+    """
+
+    def __init__(self, pool=None):
+        self._messages = collections.OrderedDict()
+        self._pool = _BufferPool() if pool is None else pool
+
+    def _discard(self, message_id):
+        self._pool.release(self._messages.pop(message_id).buffer)
+
+    def feed(self, data):
+        """Feed a received datagram into the reassembler.
+
+        :raises BrokenMessageError: if the datagram can't be decoded.
+
+        :returns: the payload of the message as a :class:`bytes` if it's
+            now complete, otherwise ``None``.
+        """
+        view = memoryview(data)
+        if len(view) < _HEADER.size:
+            raise messages.BrokenMessageError("Datagram too short")
+        split = _HEADER.unpack_from(view)[0]
+        if split == messages.NO_SPLIT:
+            return view[_HEADER.size:].tobytes()
+        if (split != messages.SPLIT
+                or len(view) < _HEADER.size + _FRAGMENT.size):
+            raise messages.BrokenMessageError("Invalid header")
+        message_id, count, fragment_id, mtu = \
+            _FRAGMENT.unpack_from(view, _HEADER.size)
+        message = self._messages.get(message_id)
+        if message is None:
+            if count < 1 or mtu < 1:
+                raise messages.BrokenMessageError("Invalid fragment")
+            if mtu > _MAX_SPLIT_MTU:
+                raise messages.BrokenMessageError(
+                    "MTU of {} exceeds maximum of {}".format(
+                        mtu, _MAX_SPLIT_MTU))
+            if messages.Fragment(message_id=message_id).is_compressed:
+                class_ = _CompressedMessage
+            else:
+                class_ = _SplitMessage
+            message = self._messages[message_id] = \
+                class_(count, mtu, self._pool.acquire(count * mtu))
+            while len(self._messages) > _MAX_SPLIT_MESSAGES:
+                self._discard(next(iter(self._messages)))
+        try:
+            payload = message.feed(
+                fragment_id, view[_HEADER.size + _FRAGMENT.size:])
+        except messages.BrokenMessageError:
+            self._discard(message_id)
+            raise
+        if payload is not None:
+            self._discard(message_id)
+        return payload
+
+
+def _track_responsiveness(function):
+    """Record whether a server responds to a :class:`ServerQuerier` method.
+
+    If the querier has an :class:`UnresponsiveCache` then the method fails
+    immediately when the server is considered unresponsive. Otherwise the
+    method is called and the cache updated according to whether it raised
+    :exc:`valve.source.NoResponseError`.
+    """
+
+    @functools.wraps(function)
+    def wrapper(self, *args, **kwargs):
+        if self._unresponsive is None:
+            return function(self, *args, **kwargs)
+        address = self._address
+        self._unresponsive.check(address)
+        try:
+            result = function(self, *args, **kwargs)
+        except valve.source.NoResponseError:
+            self._unresponsive.failure(address)
+            raise
+        self._unresponsive.success(address)
+        return result
+
+    return wrapper
+
+
 class ServerQuerier(valve.source.BaseQuerier):
     """Implements the A2S Source server query protocol.
 
     https://developer.valvesoftware.com/wiki/Server_queries
 
+    If an :class:`RTTEstimator` is given then each request is sent with a
+    timeout derived from the server's observed round-trip times and
+    retransmitted if it goes unanswered. The ``timeout`` then limits the
+    total time spent on each request rather than each attempt.
+
+    If an :class:`UnresponsiveCache` is given then requests to a server
+    which has stopped responding fail immediately with
+    :exc:`valve.source.NoResponseError` until the server is due to be
+    retried.
+
     .. note::
-        Instantiating this class creates a socket. Be sure to close the
+        Unless a :class:`valve.source.SharedSocket` is given,
+        instantiating this class creates a socket. Be sure to close the
         querier once finished with it. See :class:`valve.source.BaseQuerier`.
     """
 
+    def __init__(self, address, timeout=5.0, challenges=None,
+                 rtt=None, unresponsive=None, shared=None):
+        super(ServerQuerier, self).__init__(address, timeout, shared)
+        self._resolved = None if shared is None else self._peer
+        self._reassembler = _Reassembler()
+        # Shared sockets already receive each datagram into their own
+        # buffer so the querier doesn't need one.
+        self._buffer = bytearray(65536) if shared is None else None
+        self._challenges = CHALLENGE_CACHE if challenges is None \
+            else challenges
+        self._rtt = rtt
+        self._unresponsive = unresponsive
+
+    @property
+    def _address(self):
+        # Challenges, RTTs and failures are keyed by the numeric address
+        # responses are received from, as with scan and the asynchronous
+        # querier, so that caches shared between them agree.
+        if self._resolved is None:
+            self._resolved = _resolve((self.host, self.port))
+        return self._resolved
+
     def request(self, request):
         super(ServerQuerier, self).request(
             messages.Header(split=messages.NO_SPLIT), request)
 
-    def get_response(self):
-
-        data = valve.source.BaseQuerier.get_response(self)
+    def get_response(self, timeout=None):
 
         # According to https://developer.valvesoftware.com/wiki/Server_queries
         # "TF2 currently does not split replies, expect A2S_PLAYER and
@@ -41,21 +688,108 @@ class ServerQuerier(valve.source.BaseQuerier):
         # warning means that only one fragment of the message is sent
         # or that the warning is no longer valid.
 
-        response = messages.Header().decode(data)
-        if response["split"] == messages.SPLIT:
-            fragments = {}
-            fragment = messages.Fragment.decode(response.payload)
-            if fragment.is_compressed:
-                raise NotImplementedError("Fragments are compressed")
-            fragments[fragment["fragment_id"]] = fragment
-            while len(fragments) < fragment["fragment_count"]:
-                data = valve.source.BaseQuerier.get_response(self)
-                fragment = messages.Fragment.decode(
-                    messages.Header.decode(data).payload)
-                fragments[fragment["fragment_id"]] = fragment
-            return b"".join([frag[1].payload for frag in
-                            sorted(fragments.items(), key=lambda f: f[0])])
-        return response.payload
+        if self._buffer is None:
+            while True:
+                payload = self._reassembler.feed(
+                    super(ServerQuerier, self).get_response(timeout))
+                if payload is not None:
+                    return payload
+        view = memoryview(self._buffer)
+        while True:
+            size = self.get_response_into(self._buffer, timeout)
+            payload = self._reassembler.feed(view[:size])
+            if payload is not None:
+                return payload
+
+    def _get_response_to(self, request, timeout=None):
+        """Wait for the response to a request.
+
+        Responses of the wrong type for the request, such as a late
+        response to an earlier request, are discarded.
+
+        :param timeout: How long to wait for the response. If not given
+            the configured :attr:`timeout` is used.
+
+        :raises valve.source.NoResponseError: if the timeout is reached
+            before a matching response is received.
+
+        :returns: the response payload.
+        """
+        expected = _RESPONSE_TYPES.get(type(request))
+        if timeout is None:
+            timeout = self.timeout
+        deadline = monotonic.monotonic() + timeout
+        while True:
+            payload = self.get_response(
+                max(0.0, deadline - monotonic.monotonic()))
+            if expected is None \
+                    or _response_type(payload) in (expected, _CHALLENGE):
+                return payload
+
+    @_track_responsiveness
+    def _exchange(self, request):
+        """Send a request and wait for the response.
+
+        Without an :class:`RTTEstimator` this is simply :meth:`request`
+        followed by :meth:`get_response`. Otherwise the request is
+        retransmitted, with the server's estimated timeout, as many times
+        as :meth:`RTTEstimator.retries` allows.
+
+        :raises valve.source.NoResponseError: if no response is received.
+
+        :returns: the response payload.
+        """
+        if self._rtt is None:
+            self.request(request)
+            return self._get_response_to(request)
+        address = self._address
+        retries = self._rtt.retries(address, self.timeout)
+        for attempt in six.moves.range(retries + 1):
+            time_sent = monotonic.monotonic()
+            self.request(request)
+            try:
+                payload = self._get_response_to(
+                    request, self._rtt.timeout(address))
+            except valve.source.NoResponseError:
+                self._rtt.timed_out(address)
+                if attempt == retries:
+                    raise
+            else:
+                if not attempt:
+                    self._rtt.observe(
+                        address, monotonic.monotonic() - time_sent)
+                return payload
+
+    def _challenged_request(self, request, response):
+        """Issue a request that requires a challenge number.
+
+        The request is sent using the cached challenge number for the
+        server, if any. If the server responds with a challenge instead
+        then the request is repeated with the new challenge number.
+
+        :param request: the :class:`messages.Message` subclass of the
+            request. It must accept a ``challenge`` field where ``-1``
+            requests a new challenge.
+        :param response: the :class:`messages.Message` subclass to
+            decode the response as.
+
+        :raises BrokenMessageError: if the server keeps responding with
+            challenges.
+
+        :returns: the decoded response.
+        """
+        address = self._address
+        challenge = self._challenges.get(address)
+        for _ in six.moves.range(_MAX_CHALLENGES + 1):
+            payload = self._exchange(request(
+                challenge=-1 if challenge is None else challenge))
+            if _response_type(payload) != _CHALLENGE:
+                return response.decode(payload)
+            challenge = messages.GetChallengeResponse.decode(
+                payload)["challenge"]
+            self._challenges.set(address, challenge)
+        raise messages.BrokenMessageError(
+            "Too many challenges from {0[0]}:{0[1]}".format(address))
 
     def ping(self):
         """Ping the server, returning the round-trip latency in milliseconds
@@ -63,12 +797,28 @@ class ServerQuerier(valve.source.BaseQuerier):
         The A2A_PING request is deprecated so this actually sends a A2S_INFO
         request and times that. The time difference between the two should
         be negligble.
+
+        If the server responds with a challenge rather than its info then
+        the challenge is cached, as with :meth:`info`, and the round trip
+        to obtain it is timed instead.
+
+        The round trip is also recorded by the querier's
+        :class:`RTTEstimator`, if any. Should the request have to be
+        retransmitted then the latency includes the time spent waiting
+        for the unanswered attempts.
         """
 
+        challenge = self._challenges.get(self._address)
         time_sent = monotonic.monotonic()
-        self.request(messages.InfoRequest())
-        messages.InfoResponse.decode(self.get_response())
+        payload = self._exchange(messages.InfoRequest(
+            challenge=-1 if challenge is None else challenge))
         time_received = monotonic.monotonic()
+        if _response_type(payload) == _CHALLENGE:
+            self._challenges.set(
+                self._address,
+                messages.GetChallengeResponse.decode(payload)["challenge"])
+        else:
+            messages.InfoResponse.decode(payload)
         return (time_received - time_sent) * 1000.0
 
     def info(self):
@@ -134,10 +884,14 @@ class ServerQuerier(valve.source.BaseQuerier):
         +--------------------+------------------------------------------------+
 
         Currently the *extra data field* (EDF) is not supported.
+
+        Some servers respond to A2S_INFO requests with a challenge number,
+        in which case the request is repeated with the challenge. See
+        :class:`ChallengeCache`.
         """
 
-        self.request(messages.InfoRequest())
-        return messages.InfoResponse.decode(self.get_response())
+        return self._challenged_request(
+            messages.InfoRequest, messages.InfoResponse)
 
     def players(self):
         """Retrive a list of all players connected to the server
@@ -194,10 +948,8 @@ class ServerQuerier(valve.source.BaseQuerier):
         # TF2 and L4D2's A2S_SERVERQUERY_GETCHALLENGE doesn't work so
         # just use A2S_PLAYER to get challenge number which should work
         # fine for all servers
-        self.request(messages.PlayersRequest(challenge=-1))
-        challenge = messages.GetChallengeResponse.decode(self.get_response())
-        self.request(messages.PlayersRequest(challenge=challenge["challenge"]))
-        return messages.PlayersResponse.decode(self.get_response())
+        return self._challenged_request(
+            messages.PlayersRequest, messages.PlayersResponse)
 
     def rules(self):
         """Retreive the server's game mode configuration
@@ -222,7 +974,347 @@ class ServerQuerier(valve.source.BaseQuerier):
         +--------------------+------------------------------------------------+
         """
 
-        self.request(messages.RulesRequest(challenge=-1))
-        challenge = messages.GetChallengeResponse.decode(self.get_response())
-        self.request(messages.RulesRequest(challenge=challenge["challenge"]))
-        return messages.RulesResponse.decode(self.get_response())
+        return self._challenged_request(
+            messages.RulesRequest, messages.RulesResponse)
+
+    @_track_responsiveness
+    def snapshot(self):
+        """Retrieve the server's info, players and rules all at once
+
+        Rather than issuing each request in turn, the A2S_INFO, A2S_PLAYER
+        and A2S_RULES requests are all sent at once. The responses are
+        then matched up to the requests by their response type. If the
+        server responds with a challenge then all the requests which are
+        yet to be answered are repeated with the new challenge.
+
+        Hence a snapshot takes a single round trip if a valid challenge
+        number is cached, or two otherwise. See :class:`ChallengeCache`.
+
+        :raises BrokenMessageError: if the server keeps responding with
+            challenges.
+
+        :returns: a dictionary with ``info``, ``players`` and ``rules``
+            keys mapped to the same responses as :meth:`info`,
+            :meth:`players` and :meth:`rules` respectively.
+        """
+
+        address = self._address
+        queries = {
+            0x49: ("info", messages.InfoRequest, messages.InfoResponse),
+            0x44: ("players",
+                   messages.PlayersRequest, messages.PlayersResponse),
+            0x45: ("rules", messages.RulesRequest, messages.RulesResponse),
+        }
+        outstanding = set(queries)
+        results = {}
+        challenge = self._challenges.get(address)
+        challenge_count = 0
+        while outstanding:
+            if challenge_count > _MAX_CHALLENGES:
+                raise messages.BrokenMessageError(
+                    "Too many challenges from {0[0]}:{0[1]}".format(address))
+            for response_type in sorted(outstanding, reverse=True):
+                request = queries[response_type][1]
+                self.request(request(
+                    challenge=-1 if challenge is None else challenge))
+            # Responses to the requests sent with a stale challenge may
+            # still be received, so only repeat the requests if the
+            # server hands out a challenge that wasn't just sent.
+            sent_challenge = challenge
+            while outstanding and challenge == sent_challenge:
+                payload = self.get_response()
+                response_type = _response_type(payload)
+                if response_type == _CHALLENGE:
+                    response = messages.GetChallengeResponse.decode(payload)
+                    if response["challenge"] != sent_challenge:
+                        challenge = response["challenge"]
+                        self._challenges.set(address, challenge)
+                        challenge_count += 1
+                elif response_type in outstanding:
+                    name, _, response = queries[response_type]
+                    results[name] = response.decode(payload)
+                    outstanding.discard(response_type)
+        return results
+
+
+class _Probe(object):
+    """State of a single server being queried by :func:`scan`.
+
+    Each probe works through its queries one at a time. Challenge numbers
+    are taken from and stored in a :class:`ChallengeCache`.
+
+    :ivar address: the address of the server as given to :func:`scan`.
+    :ivar results: a dictionary of query names to the decoded responses.
+    :ivar deadline: when the response to the current request is due.
+    :ivar sent: when the current request was last sent.
+    :ivar retransmissions: how many times the current request has been
+        retransmitted.
+    :ivar retries: how many times the current request may be
+        retransmitted.
+    """
+
+    _REQUESTS = {
+        "info": messages.InfoRequest,
+        "players": messages.PlayersRequest,
+        "rules": messages.RulesRequest,
+    }
+    _RESPONSES = {
+        "info": messages.InfoResponse,
+        "players": messages.PlayersResponse,
+        "rules": messages.RulesResponse,
+    }
+
+    def __init__(self, address, resolved, queries, challenges, pool=None):
+        self.address = address
+        self.results = {}
+        self.deadline = None
+        self.sent = None
+        self.retransmissions = 0
+        self.retries = 0
+        self._resolved = resolved
+        self._queries = collections.deque(queries)
+        self._challenges = challenges
+        self._challenge_count = 0
+        self._reassembler = _Reassembler(pool)
+
+    @property
+    def done(self):
+        """Determine if all queries have been answered."""
+        return not self._queries
+
+    def request(self):
+        """Encode the request for the current query."""
+        challenge = self._challenges.get(self._resolved)
+        request = self._REQUESTS[self._queries[0]](
+            challenge=-1 if challenge is None else challenge)
+        return (messages.Header(split=messages.NO_SPLIT).encode()
+                + request.encode())
+
+    def feed(self, data):
+        """Feed a datagram received from the server into the probe.
+
+        Responses of the wrong type for the current query, such as
+        a duplicate response to a previous query, are discarded.
+
+        :raises BrokenMessageError: if the response couldn't be decoded.
+
+        :returns: ``True`` if the response was complete and another
+            request needs sending, unless the probe is :attr:`done`.
+            Otherwise ``False``.
+        """
+        payload = self._reassembler.feed(data)
+        if payload is None:
+            return False
+        query = self._queries[0]
+        response_type = _response_type(payload)
+        if response_type == _CHALLENGE:
+            self._challenge_count += 1
+            if self._challenge_count > _MAX_CHALLENGES:
+                raise messages.BrokenMessageError(
+                    "Too many challenges from {0[0]}:{0[1]}".format(
+                        self.address))
+            self._challenges.set(
+                self._resolved,
+                messages.GetChallengeResponse.decode(payload)["challenge"])
+            return True
+        if response_type != _RESPONSE_TYPES[self._REQUESTS[query]]:
+            return False
+        self.results[query] = self._RESPONSES[query].decode(payload)
+        self._challenge_count = 0
+        self._queries.popleft()
+        return True
+
+
+def scan(addresses, queries=("info",),
+         concurrency=256, timeout=5.0, challenges=None, rtt=None,
+         unresponsive=None):
+    """Query many servers, yielding results as servers respond.
+
+    This sends requests to many servers at once from a single socket.
+    Requests and responses are sent and received in batches, using a
+    single system call per batch where supported; see
+    :class:`valve.source.batch.DatagramBatcher`. Results are yielded as
+    soon as each server has answered all the requested ``queries`` -- not
+    in the order the addresses were given.
+
+    ``addresses`` can be any iterable of ``(host, port)`` tuples,
+    including the iterator returned by
+    :meth:`valve.source.master_server.MasterServerQuerier.find`. It's
+    consumed lazily, only taking another address when there are fewer
+    than ``concurrency`` servers being queried. Therefore servers can be
+    queried whilst the master server is still returning addresses:
+
+    .. code:: python
+
+        with MasterServerQuerier() as msq:
+            for address, result in scan(msq.find(gamedir="tf")):
+                if not isinstance(result, Exception):
+                    print(address, result["info"]["server_name"])
+
+    The valid queries are ``info``, ``players`` and ``rules``; their
+    responses are the same as :meth:`ServerQuerier.info`,
+    :meth:`ServerQuerier.players` and :meth:`ServerQuerier.rules`.
+
+    :param addresses: an iterable of server addresses to query.
+    :param queries: an iterable of queries to issue to each server.
+    :param int concurrency: the maximum number of servers being queried
+        at once.
+    :param float timeout: how long to wait for each response from
+        a server.
+    :param challenges: the :class:`ChallengeCache` to use. By default
+        :data:`CHALLENGE_CACHE` is used.
+    :param rtt: an :class:`RTTEstimator` to derive the timeout for each
+        server from. Unanswered requests are then retransmitted and
+        ``timeout`` limits the total time spent on each request, as with
+        :class:`ServerQuerier`.
+    :param unresponsive: an :class:`UnresponsiveCache` of servers to skip.
+        Servers it considers unresponsive aren't sent any requests; their
+        result is a :exc:`valve.source.NoResponseError` straight away.
+        Servers which are queried are recorded in the cache.
+
+    :raises ValueError: if an unknown query is given.
+
+    :returns: an iterator of ``(address, result)`` tuples. Where a server
+        responded to every query the result is a dictionary mapping each
+        query to its response. Otherwise the result is the exception,
+        such as :exc:`valve.source.NoResponseError`, that caused the
+        server's queries to fail.
+    """
+    queries = tuple(queries)
+    for query in queries:
+        if query not in _Probe._REQUESTS:
+            raise ValueError("Invalid query {!r}".format(query))
+    if challenges is None:
+        challenges = CHALLENGE_CACHE
+    addresses = iter(addresses)
+    exhausted = False
+    deferred = collections.deque()
+    probes = {}
+    deadlines = []
+    finished = []
+    pool = _BufferPool()
+    outgoing = []
+    unsent = []
+    socket_ = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+    socket_.setblocking(False)
+    batcher = batch.DatagramBatcher(socket_)
+
+    def send(resolved, probe, retransmit=False):
+        outgoing.append((probe.request(), resolved))
+        unsent.append((resolved, probe))
+        # Until the request is flushed the probe can't time out
+        probe.deadline = None
+        if not retransmit:
+            probe.retransmissions = 0
+            if rtt is not None:
+                probe.retries = rtt.retries(resolved, timeout)
+
+    def flush():
+        # Requests are timed from when they're actually sent, so that
+        # round trips observed for the RTTEstimator aren't inflated by
+        # the time spent queued.
+        batcher.send(outgoing)
+        sent = monotonic.monotonic()
+        for resolved, probe in unsent:
+            probe.sent = sent
+            if rtt is None:
+                deadline = sent + timeout
+            else:
+                deadline = sent + rtt.timeout(resolved)
+            probe.deadline = deadline
+            heapq.heappush(deadlines, (deadline, resolved))
+        del outgoing[:]
+        del unsent[:]
+
+    def timed_out(resolved, probe):
+        if rtt is not None:
+            rtt.timed_out(resolved)
+            if probe.retransmissions < probe.retries:
+                probe.retransmissions += 1
+                send(resolved, probe, retransmit=True)
+                return
+        if unresponsive is not None:
+            unresponsive.failure(resolved)
+        finish(resolved, valve.source.NoResponseError(
+            "Timed out waiting for response"))
+
+    def finish(resolved, result):
+        probe = probes.pop(resolved)
+        finished.append((probe.address, result))
+        if unresponsive is not None \
+                and not isinstance(result, valve.source.NoResponseError):
+            unresponsive.success(resolved)
+
+    try:
+        while True:
+            while len(probes) < concurrency:
+                for _ in six.moves.range(len(deferred)):
+                    address, resolved = deferred.popleft()
+                    if resolved in probes:
+                        deferred.append((address, resolved))
+                    else:
+                        break
+                else:
+                    if exhausted:
+                        break
+                    try:
+                        address = next(addresses)
+                    except StopIteration:
+                        exhausted = True
+                        continue
+                    try:
+                        resolved = _resolve(address)
+                    except socket.error as exc:
+                        finished.append((address, exc))
+                        continue
+                    if resolved in probes:
+                        deferred.append((address, resolved))
+                        continue
+                if unresponsive is not None:
+                    try:
+                        unresponsive.check(resolved)
+                    except valve.source.NoResponseError as exc:
+                        finished.append((address, exc))
+                        continue
+                probes[resolved] = _Probe(
+                    address, resolved, queries, challenges, pool)
+                send(resolved, probes[resolved])
+            if not probes:
+                break
+            if outgoing:
+                flush()
+            wait = max(0.0, deadlines[0][0] - monotonic.monotonic())
+            if select.select([socket_], [], [], wait)[0]:
+                datagrams = batcher.receive()
+                while datagrams:
+                    for data, resolved in datagrams:
+                        probe = probes.get(resolved)
+                        if probe is None:
+                            continue
+                        try:
+                            if probe.feed(data):
+                                if rtt is not None \
+                                        and not probe.retransmissions:
+                                    rtt.observe(
+                                        resolved,
+                                        monotonic.monotonic() - probe.sent)
+                                if probe.done:
+                                    finish(resolved, probe.results)
+                                else:
+                                    send(resolved, probe)
+                        except messages.BrokenMessageError as exc:
+                            finish(resolved, exc)
+                    datagrams = batcher.receive()
+            now = monotonic.monotonic()
+            while deadlines and deadlines[0][0] <= now:
+                deadline, resolved = heapq.heappop(deadlines)
+                probe = probes.get(resolved)
+                if probe is not None and probe.deadline == deadline:
+                    timed_out(resolved, probe)
+            for result in finished:
+                yield result
+            del finished[:]
+        for result in finished:
+            yield result
+    finally:
+        socket_.close()
@@ -0,0 +1,285 @@
+# -*- coding: utf-8 -*-
+
+"""Asynchronous A2S queries built on :mod:`asyncio`.
+
+.. note::
+    This module requires Python 3.5 or newer.
+"""
+
+from __future__ import (absolute_import,
+                        unicode_literals, print_function, division)
+
+import asyncio
+import socket
+
+import monotonic
+
+import valve.source
+from . import a2s
+from . import messages
+
+
+class _A2SProtocol(asyncio.DatagramProtocol):
+    """Dispatch datagrams to an :class:`AsyncServerQuerier`."""
+
+    def __init__(self, querier):
+        self._querier = querier
+
+    def datagram_received(self, data, address):
+        self._querier._datagram_received(data, address)
+
+    def error_received(self, exc):
+        # Unconnected UDP sockets may be handed ICMP errors for any
+        # of the servers being queried; there's no way to know which
+        # request they relate to so they're left to time out.
+        pass
+
+
+class AsyncServerQuerier(object):
+    """Query many Source servers concurrently over a single socket.
+
+    Where :class:`valve.source.a2s.ServerQuerier` is bound to a single
+    server and blocks for each request, this querier can have requests
+    outstanding to any number of servers at once. All requests are sent
+    from the same UDP socket and responses are routed back to the pending
+    request by the address they were received from.
+
+    The querier must be opened before it's used and closed when done with.
+    It's preferable to use it as an asynchronous context manager:
+
+    .. code:: python
+
+        async with AsyncServerQuerier() as querier:
+            results = await asyncio.gather(
+                *(querier.info(address) for address in addresses),
+                return_exceptions=True,
+            )
+
+    Requests to the same server are serialised as A2S responses can only
+    be correlated with their requests by the server's address. Requests to
+    different servers are entirely independent.
+
+    The responses are the same as those returned by
+    :class:`valve.source.a2s.ServerQuerier`. Challenge numbers are cached
+    in the given :class:`valve.source.a2s.ChallengeCache`, or
+    :data:`valve.source.a2s.CHALLENGE_CACHE` if not given.
+
+    If a :class:`valve.source.a2s.UnresponsiveCache` is given then
+    requests to servers which have stopped responding fail immediately
+    with :exc:`valve.source.NoResponseError`, as with
+    :class:`valve.source.a2s.ServerQuerier`.
+
+    :ivar timeout: How long to wait for each response to a request.
+    """
+
+    def __init__(self, timeout=5.0, challenges=None, unresponsive=None):
+        self.timeout = timeout
+        self._challenges = a2s.CHALLENGE_CACHE if challenges is None \
+            else challenges
+        self._unresponsive = unresponsive
+        self._loop = None
+        self._transport = None
+        self._pending = {}
+        self._reassemblers = {}
+        self._locks = {}
+
+    async def __aenter__(self):
+        await self.open()
+        return self
+
+    async def __aexit__(self, type_, exception, traceback):
+        self.close()
+
+    async def open(self):
+        """Create the socket used for sending requests."""
+        self._loop = asyncio.get_event_loop()
+        socket_ = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        socket_.bind(("", 0))
+        self._transport, _ = await self._loop.create_datagram_endpoint(
+            lambda: _A2SProtocol(self), sock=socket_)
+
+    def close(self):
+        """Close the querier's socket.
+
+        Any outstanding requests will fail with
+        :exc:`valve.source.QuerierClosedError`. It's safe to call this
+        multiple times.
+        """
+        if self._transport is not None:
+            self._transport.close()
+            self._transport = None
+        for future, _ in self._pending.values():
+            if not future.done():
+                future.set_exception(valve.source.QuerierClosedError())
+        self._pending.clear()
+        self._reassemblers.clear()
+
+    def _datagram_received(self, data, address):
+        pending = self._pending.get(address)
+        if pending is None or pending[0].done():
+            return
+        future, expected = pending
+        reassembler = self._reassemblers.setdefault(
+            address, a2s._Reassembler())
+        try:
+            payload = reassembler.feed(data)
+        except messages.BrokenMessageError as exc:
+            future.set_exception(exc)
+        else:
+            # Late responses to earlier requests are discarded, as with
+            # valve.source.a2s.ServerQuerier._get_response_to.
+            if payload is not None and (
+                    expected is None
+                    or a2s._response_type(payload)
+                    in (expected, a2s._CHALLENGE)):
+                future.set_result(payload)
+
+    async def _resolve(self, address):
+        """Resolve a ``(host, port)`` address to a numeric IPv4 address.
+
+        Responses are received from numeric addresses so requests must
+        be tracked against them rather than host names.
+        """
+        host, port = address
+        try:
+            socket.inet_pton(socket.AF_INET, host)
+        except (socket.error, ValueError):
+            addresses = await self._loop.getaddrinfo(
+                host, port, family=socket.AF_INET, type=socket.SOCK_DGRAM)
+            return addresses[0][4]
+        return host, port
+
+    async def _exclusive(self, address, function):
+        """Call a coroutine function whilst no other requests are pending.
+
+        :param address: the address of the server to lock.
+        :param function: a coroutine function which accepts the resolved
+            address of the server as its sole argument.
+        """
+        if self._transport is None:
+            raise valve.source.QuerierClosedError
+        address = await self._resolve(address)
+        lock = self._locks.get(address)
+        if lock is None:
+            lock = self._locks[address] = [asyncio.Lock(), 0]
+        lock[1] += 1
+        try:
+            async with lock[0]:
+                return await function(address)
+        finally:
+            lock[1] -= 1
+            if not lock[1]:
+                del self._locks[address]
+
+    async def _request(self, address, request):
+        """Issue a request and wait for the response.
+
+        Responses which are neither a challenge nor of the type expected
+        for the request are discarded. The server's responsiveness is checked and recorded in the
+        querier's :class:`valve.source.a2s.UnresponsiveCache`, if any.
+
+        :raises valve.source.NoResponseError: if the configured
+            :attr:`timeout` is reached before a response is received, or
+            the server is considered unresponsive.
+        :raises valve.source.QuerierClosedError: if the querier has been
+            closed.
+
+        :returns: the payload of the response as :class:`bytes`.
+        """
+        if self._transport is None:
+            raise valve.source.QuerierClosedError
+        if self._unresponsive is not None:
+            self._unresponsive.check(address)
+        future = self._loop.create_future()
+        self._pending[address] = (
+            future, a2s._RESPONSE_TYPES.get(type(request)))
+        self._transport.sendto(
+            messages.Header(split=messages.NO_SPLIT).encode()
+            + request.encode(), address)
+        try:
+            payload = await asyncio.wait_for(future, self.timeout)
+        except asyncio.TimeoutError:
+            if self._unresponsive is not None:
+                self._unresponsive.failure(address)
+            raise valve.source.NoResponseError(
+                "Timed out waiting for response")
+        else:
+            if self._unresponsive is not None:
+                self._unresponsive.success(address)
+            return payload
+        finally:
+            if self._pending.get(address, (None,))[0] is future:
+                del self._pending[address]
+            self._reassemblers.pop(address, None)
+
+    async def _challenged_request(self, address, request, response):
+        """Issue a request that requires a challenge number.
+
+        See :meth:`valve.source.a2s.ServerQuerier._challenged_request`.
+        """
+        challenge = self._challenges.get(address)
+        for _ in range(a2s._MAX_CHALLENGES + 1):
+            payload = await self._request(address, request(
+                challenge=-1 if challenge is None else challenge))
+            if a2s._response_type(payload) != a2s._CHALLENGE:
+                return response.decode(payload)
+            challenge = messages.GetChallengeResponse.decode(
+                payload)["challenge"]
+            self._challenges.set(address, challenge)
+        raise messages.BrokenMessageError(
+            "Too many challenges from {0[0]}:{0[1]}".format(address))
+
+    async def _info(self, address):
+        return await self._challenged_request(
+            address, messages.InfoRequest, messages.InfoResponse)
+
+    async def _players(self, address):
+        return await self._challenged_request(
+            address, messages.PlayersRequest, messages.PlayersResponse)
+
+    async def _rules(self, address):
+        return await self._challenged_request(
+            address, messages.RulesRequest, messages.RulesResponse)
+
+    async def ping(self, address):
+        """Ping a server, returning the round-trip latency in milliseconds.
+
+        See :meth:`valve.source.a2s.ServerQuerier.ping`.
+        """
+        async def ping(address):
+            challenge = self._challenges.get(address)
+            time_sent = monotonic.monotonic()
+            payload = await self._request(address, messages.InfoRequest(
+                challenge=-1 if challenge is None else challenge))
+            time_received = monotonic.monotonic()
+            if a2s._response_type(payload) == a2s._CHALLENGE:
+                self._challenges.set(
+                    address,
+                    messages.GetChallengeResponse.decode(
+                        payload)["challenge"])
+            else:
+                messages.InfoResponse.decode(payload)
+            return (time_received - time_sent) * 1000.0
+
+        return await self._exclusive(address, ping)
+
+    async def info(self, address):
+        """Retrieve information about a server's state.
+
+        See :meth:`valve.source.a2s.ServerQuerier.info`.
+        """
+        return await self._exclusive(address, self._info)
+
+    async def players(self, address):
+        """Retrieve a list of all players connected to a server.
+
+        See :meth:`valve.source.a2s.ServerQuerier.players`.
+        """
+        return await self._exclusive(address, self._players)
+
+    async def rules(self, address):
+        """Retrieve a server's game mode configuration.
+
+        See :meth:`valve.source.a2s.ServerQuerier.rules`.
+        """
+        return await self._exclusive(address, self._rules)
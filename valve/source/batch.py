@@ -0,0 +1,257 @@
+# -*- coding: utf-8 -*-
+
+"""Batched sending and receiving of UDP datagrams.
+
+On Linux, :manpage:`sendmmsg(2)` and :manpage:`recvmmsg(2)` are called via
+:mod:`ctypes` to send or receive many datagrams with a single system call.
+Elsewhere, or if they're unavailable, datagrams are sent and received one
+at a time instead.
+"""
+
+from __future__ import (absolute_import,
+                        unicode_literals, print_function, division)
+
+import ctypes
+import ctypes.util
+import errno
+import os
+import select
+import socket
+import struct
+import sys
+
+import six
+
+
+# Size of each receive buffer. Large enough that no UDP datagram is ever
+# truncated.
+_MTU = 65536
+
+_MSG_DONTWAIT = getattr(socket, "MSG_DONTWAIT", 0x40)
+_SOCKADDR_IN = struct.Struct(b"=H")
+
+
+class _IOVec(ctypes.Structure):
+    _fields_ = [
+        ("base", ctypes.c_void_p),
+        ("length", ctypes.c_size_t),
+    ]
+
+
+class _MsgHdr(ctypes.Structure):
+    _fields_ = [
+        ("name", ctypes.c_void_p),
+        ("name_length", ctypes.c_uint32),
+        ("iov", ctypes.POINTER(_IOVec)),
+        ("iov_length", ctypes.c_size_t),
+        ("control", ctypes.c_void_p),
+        ("control_length", ctypes.c_size_t),
+        ("flags", ctypes.c_int),
+    ]
+
+
+class _MMsgHdr(ctypes.Structure):
+    _fields_ = [
+        ("header", _MsgHdr),
+        ("length", ctypes.c_uint),
+    ]
+
+
+# struct sockaddr_in
+_SockAddr = ctypes.c_char * 16
+
+
+def _load_libc():
+    """Load the C library functions used for batching, if available."""
+    if not sys.platform.startswith("linux"):
+        return None
+    try:
+        libc = ctypes.CDLL(
+            ctypes.util.find_library("c") or "libc.so.6", use_errno=True)
+        sendmmsg = libc.sendmmsg
+        recvmmsg = libc.recvmmsg
+    except (OSError, AttributeError):
+        return None
+    sendmmsg.argtypes = [ctypes.c_int, ctypes.POINTER(_MMsgHdr),
+                         ctypes.c_uint, ctypes.c_int]
+    sendmmsg.restype = ctypes.c_int
+    recvmmsg.argtypes = [ctypes.c_int, ctypes.POINTER(_MMsgHdr),
+                         ctypes.c_uint, ctypes.c_int, ctypes.c_void_p]
+    recvmmsg.restype = ctypes.c_int
+    return libc
+
+
+_LIBC = _load_libc()
+
+
+def _encode_address(address):
+    host, port = address
+    return (_SOCKADDR_IN.pack(socket.AF_INET) + struct.pack(b"!H", port)
+            + socket.inet_aton(host) + b"\x00" * 8)
+
+
+def _decode_address(raw):
+    return (socket.inet_ntoa(raw[4:8]),
+            struct.unpack(b"!H", raw[2:4])[0])
+
+
+def _wait_writable(socket_):
+    select.select([], [socket_], [])
+
+
+class DatagramBatcher(object):
+    """Send and receive UDP datagrams in batches.
+
+    Rather than a system call for every datagram, datagrams are sent and
+    received up to ``size`` at a time. Received datagrams are written into
+    buffers which are allocated once and reused, so no memory is allocated
+    per datagram either.
+
+    The socket must be an IPv4 UDP socket in non-blocking mode.
+
+    :param socket_: the socket to send and receive datagrams with.
+    :param int size: the maximum number of datagrams per system call.
+    :param native: whether to use batched system calls. By default they're
+        used when available. If ``False`` then datagrams are always sent
+        and received one at a time.
+
+    :ivar native: whether batched system calls are being used.
+    """
+
+    def __init__(self, socket_, size=32, native=None):
+        self.socket = socket_
+        self.size = size
+        self.native = _LIBC is not None and native is not False
+        self._buffer = bytearray(size * _MTU)
+        self._view = memoryview(self._buffer)
+        if self.native:
+            self._send_iovecs = (_IOVec * size)()
+            self._send_names = (_SockAddr * size)()
+            self._send_headers = (_MMsgHdr * size)()
+            self._receive_iovecs = (_IOVec * size)()
+            self._receive_names = (_SockAddr * size)()
+            self._receive_headers = (_MMsgHdr * size)()
+            # Kept referenced so the buffer's address remains valid for
+            # as long as the receive headers point into it.
+            self._receive_array = (
+                ctypes.c_char * len(self._buffer)).from_buffer(self._buffer)
+            buffer_address = ctypes.addressof(self._receive_array)
+            for index in six.moves.range(size):
+                header = self._send_headers[index].header
+                header.name = ctypes.addressof(self._send_names[index])
+                header.name_length = ctypes.sizeof(_SockAddr)
+                header.iov = ctypes.pointer(self._send_iovecs[index])
+                header.iov_length = 1
+                iovec = self._receive_iovecs[index]
+                iovec.base = buffer_address + index * _MTU
+                iovec.length = _MTU
+                header = self._receive_headers[index].header
+                header.name = ctypes.addressof(self._receive_names[index])
+                header.iov = ctypes.pointer(iovec)
+                header.iov_length = 1
+
+    def send(self, datagrams):
+        """Send datagrams.
+
+        If the socket's send buffer fills up then this waits until it can
+        be written to again, so every datagram is sent before returning.
+
+        :param datagrams: a sequence of ``(data, address)`` tuples where
+            ``data`` is :class:`bytes` and ``address`` is a numeric IPv4
+            ``(host, port)`` address.
+        """
+        if not self.native:
+            for data, address in datagrams:
+                while True:
+                    try:
+                        self.socket.sendto(data, address)
+                    except socket.error as exc:
+                        if exc.errno in {errno.EAGAIN, errno.EWOULDBLOCK}:
+                            _wait_writable(self.socket)
+                            continue
+                        if exc.errno != errno.EINTR:
+                            raise
+                    else:
+                        break
+            return
+        for start in six.moves.range(0, len(datagrams), self.size):
+            chunk = datagrams[start:start + self.size]
+            # The iovecs only hold raw addresses, so the objects they point
+            # into must be kept referenced until sendmmsg has returned.
+            buffers = []
+            for index, (data, address) in enumerate(chunk):
+                self._send_names[index].raw = _encode_address(address)
+                buffer_ = ctypes.c_char_p(data)
+                buffers.append(buffer_)
+                iovec = self._send_iovecs[index]
+                iovec.base = ctypes.cast(buffer_, ctypes.c_void_p).value
+                iovec.length = len(data)
+            sent = 0
+            while sent < len(chunk):
+                result = _LIBC.sendmmsg(
+                    self.socket.fileno(),
+                    ctypes.pointer(self._send_headers[sent]),
+                    len(chunk) - sent, 0)
+                if result < 0:
+                    error = ctypes.get_errno()
+                    if error in {errno.EAGAIN, errno.EWOULDBLOCK}:
+                        _wait_writable(self.socket)
+                    elif error != errno.EINTR:
+                        raise socket.error(error, os.strerror(error))
+                else:
+                    sent += result
+
+    def receive(self):
+        """Receive the datagrams waiting to be read, without blocking.
+
+        At most ``size`` datagrams are received. The returned datagrams
+        are views of the batcher's buffers so are only valid until the
+        next call to :meth:`receive`.
+
+        :returns: a list of ``(data, address)`` tuples where ``data`` is
+            a :class:`memoryview` of the datagram and ``address`` is the
+            ``(host, port)`` it was received from. The list is empty if
+            no datagrams are waiting.
+        """
+        datagrams = []
+        if not self.native:
+            while len(datagrams) < self.size:
+                offset = len(datagrams) * _MTU
+                try:
+                    size, address = self.socket.recvfrom_into(
+                        self._view[offset:offset + _MTU])
+                except socket.error as exc:
+                    if exc.errno in {errno.EAGAIN, errno.EWOULDBLOCK}:
+                        break
+                    # ICMP errors are only reported once so reading
+                    # can continue after them
+                    if exc.errno in {errno.EINTR, errno.ECONNREFUSED,
+                                     errno.ECONNRESET}:
+                        continue
+                    raise
+                datagrams.append(
+                    (self._view[offset:offset + size], address))
+            return datagrams
+        for index in six.moves.range(self.size):
+            self._receive_headers[index].header.name_length = \
+                ctypes.sizeof(_SockAddr)
+        while True:
+            count = _LIBC.recvmmsg(self.socket.fileno(),
+                                   self._receive_headers, self.size,
+                                   _MSG_DONTWAIT, None)
+            if count >= 0:
+                break
+            error = ctypes.get_errno()
+            if error in {errno.EAGAIN, errno.EWOULDBLOCK}:
+                return datagrams
+            elif error not in {errno.EINTR, errno.ECONNREFUSED,
+                               errno.ECONNRESET}:
+                raise socket.error(error, os.strerror(error))
+        for index in six.moves.range(count):
+            offset = index * _MTU
+            datagrams.append((
+                self._view[offset:offset
+                           + self._receive_headers[index].length],
+                _decode_address(self._receive_names[index].raw),
+            ))
+        return datagrams
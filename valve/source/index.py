@@ -0,0 +1,213 @@
+# -*- coding: utf-8 -*-
+
+"""Local indexing of server information.
+
+The master server's filtering isn't reliable, so the servers it returns
+have to be queried individually to check what they're actually running.
+A :class:`ServerIndex` keeps the results of these queries so they can be
+filtered locally, without querying the master server again.
+"""
+
+from __future__ import (absolute_import,
+                        unicode_literals, print_function, division)
+
+import six
+
+from . import util
+
+
+#: The A2S_INFO response fields indexed by default.
+COLUMNS = (
+    "app_id",
+    "map",
+    "game",
+    "folder",
+    "player_count",
+    "max_players",
+    "bot_count",
+    "server_type",
+    "platform",
+    "password_protected",
+    "vac_enabled",
+)
+
+
+def _normalise(column, value):
+    """Convert a column value to the key it's indexed by.
+
+    Server types and platforms have multiple identifiers for the same
+    thing, which also aren't hashable. These are converted to a single
+    canonical integer identifier. Boolean columns are converted to
+    ``0`` or ``1``.
+    """
+    if column == "server_type":
+        if not isinstance(value, util.ServerType):
+            value = util.ServerType(value)
+        return 100 if value.value == 68 else value.value
+    elif column == "platform":
+        if not isinstance(value, util.Platform):
+            value = util.Platform(value)
+        value = value.value
+        return {76: 108, 109: 111}.get(value, value)
+    elif column in {"password_protected", "vac_enabled"}:
+        return int(bool(value))
+    return value
+
+
+def _denormalise(column, key):
+    """Convert an index key back to a value for predicates."""
+    if column == "server_type":
+        return util.ServerType(key)
+    elif column == "platform":
+        return util.Platform(key)
+    return key
+
+
+class ServerIndex(object):
+    """An in-memory index of servers and their A2S_INFO responses.
+
+    Servers are added to the index as their addresses are discovered and
+    updated with their latest A2S_INFO response once they've been queried.
+    Each of the indexed ``columns`` has a separate index mapping every
+    distinct value of the column to the addresses of the servers which
+    have it. Finding servers is therefore a matter of intersecting sets
+    rather than checking each server.
+
+    .. code:: python
+
+        index = ServerIndex()
+        with MasterServerQuerier() as msq:
+            new = list(index.discover(msq.find(gamedir="tf")))
+        for address, result in a2s.scan(new):
+            if not isinstance(result, Exception):
+                index.update(address, result["info"])
+        for address in index.find(map="ctf_2fort", player_count=range(1, 24)):
+            print(address, index.get(address)["map"])
+
+    :param columns: the names of the A2S_INFO fields to index.
+    """
+
+    def __init__(self, columns=COLUMNS):
+        self.columns = tuple(columns)
+        self._records = {}
+        self._indexes = {column: {} for column in self.columns}
+
+    def __len__(self):
+        return len(self._records)
+
+    def __contains__(self, address):
+        return address in self._records
+
+    def __iter__(self):
+        return iter(self._records)
+
+    def add(self, address):
+        """Add a server that hasn't been queried yet.
+
+        :returns: ``True`` if the server wasn't already in the index.
+        """
+        if address in self._records:
+            return False
+        self._records[address] = None
+        return True
+
+    def discover(self, addresses):
+        """Add servers to the index, yielding those which are new.
+
+        :param addresses: an iterable of ``(host, port)`` addresses, such
+            as that returned by
+            :meth:`valve.source.master_server.MasterServerQuerier.find`.
+        """
+        for address in addresses:
+            if self.add(address):
+                yield address
+
+    def _unindex(self, address, record):
+        for column in self.columns:
+            key = _normalise(column, record[column])
+            bucket = self._indexes[column][key]
+            bucket.discard(address)
+            if not bucket:
+                del self._indexes[column][key]
+
+    def update(self, address, info):
+        """Update a server with its latest A2S_INFO response.
+
+        :param address: the ``(host, port)`` address of the server.
+        :param info: the server's A2S_INFO response as returned by
+            :meth:`valve.source.a2s.ServerQuerier.info`, or any other
+            mapping with the indexed columns.
+        """
+        record = {column: info[column] for column in self.columns}
+        previous = self._records.get(address)
+        if previous is not None:
+            self._unindex(address, previous)
+        self._records[address] = record
+        for column in self.columns:
+            key = _normalise(column, record[column])
+            self._indexes[column].setdefault(key, set()).add(address)
+
+    def discard(self, address):
+        """Remove a server from the index, if it's present."""
+        record = self._records.pop(address, None)
+        if record is not None:
+            self._unindex(address, record)
+
+    def get(self, address):
+        """Get the indexed A2S_INFO fields of a server.
+
+        :returns: a dictionary of the indexed columns, or ``None`` if the
+            server hasn't been updated with a response.
+
+        :raises KeyError: if the server isn't in the index.
+        """
+        return self._records[address]
+
+    def _match(self, column, predicate):
+        """Find the addresses matching a predicate for a single column."""
+        if column not in self._indexes:
+            raise ValueError("Column {!r} isn't indexed".format(column))
+        index = self._indexes[column]
+        if callable(predicate):
+            keys = [key for key in index
+                    if predicate(_denormalise(column, key))]
+        elif (isinstance(predicate, (six.text_type, bytes))
+                or not hasattr(predicate, "__iter__")):
+            keys = [_normalise(column, predicate)]
+        else:
+            keys = {_normalise(column, value) for value in predicate}
+        buckets = [index[key] for key in keys if key in index]
+        if len(buckets) == 1:
+            return buckets[0]
+        return set().union(*buckets)
+
+    def find(self, **predicates):
+        """Find servers matching the given predicates.
+
+        Each keyword argument names an indexed column. The value can be:
+
+        * A single value that the column must equal. Server types and
+          platforms can be given as anything accepted by
+          :class:`valve.source.util.ServerType` and
+          :class:`valve.source.util.Platform`.
+        * A collection of values, any of which the column may equal. For
+          example ``player_count=range(1, 24)``.
+        * A callable which is passed each distinct value of the column
+          and returns whether it matches. This is evaluated once per
+          distinct value, not per server.
+
+        Only servers that have been updated with an A2S_INFO response are
+        matched.
+
+        :raises ValueError: if a column isn't indexed.
+
+        :returns: a set of the ``(host, port)`` addresses which match all
+            the predicates.
+        """
+        if not predicates:
+            return {address for address, record
+                    in six.iteritems(self._records) if record is not None}
+        matches = sorted((self._match(column, predicate)
+                          for column, predicate in six.iteritems(predicates)),
+                         key=len)
+        return set(matches[0]).intersection(*matches[1:])
@@ -4,9 +4,23 @@
 from __future__ import (absolute_import,
                         unicode_literals, print_function, division)
 
+import array
+import bisect
+import collections
 import enum
-import itertools
+import heapq
+import io
+import json
+import math
+import os
+import select
+import socket
+import struct
+import sys
+import threading
+import time
 
+import monotonic
 import six
 
 import valve.source
@@ -26,6 +40,55 @@ REGION_REST = 0xFF
 
 MASTER_SERVER_ADDR = ("hl2master.steampowered.com", 27011)
 
+# Maximum number of addresses fetched from a region in advance of them
+# being consumed when querying multiple regions concurrently.
+_PREFETCH = 4096
+
+
+class _Failure(object):
+    """Wraps an exception raised by a thread for re-raising elsewhere."""
+
+    def __init__(self, exc_info):
+        self.exc_info = exc_info
+
+
+class _PageEnd(object):
+    """Marks the end of a page of addresses queued by a thread.
+
+    The checkpoint update for the page is deferred until the marker is
+    taken from the queue, i.e. once every address before it has been
+    consumed.
+    """
+
+    def __init__(self, update, *args):
+        self.update = update
+        self.args = args
+
+    def apply(self):
+        self.update(*self.args)
+
+
+class _QueuedCheckpoint(object):
+    """Proxy for a :class:`Checkpoint` that queues updates as page ends.
+
+    :param checkpoint: the :class:`Checkpoint` to proxy.
+    :param put: a callable which adds a :class:`_PageEnd` to the queue.
+    """
+
+    def __init__(self, checkpoint, put):
+        self._checkpoint = checkpoint
+        self._put = put
+
+    def get(self, region, filter_string):
+        return self._checkpoint.get(region, filter_string)
+
+    def set(self, region, filter_string, cursor):
+        self._put(_PageEnd(
+            self._checkpoint.set, region, filter_string, cursor))
+
+    def discard(self, region, filter_string):
+        self._put(_PageEnd(self._checkpoint.discard, region, filter_string))
+
 
 class Duplicates(enum.Enum):
     """Behaviour for duplicate addresses.
@@ -44,6 +107,530 @@ class Duplicates(enum.Enum):
     STOP = "stop"
 
 
+def _pack_address(address):
+    """Pack a ``(host, port)`` IPv4 address into a 48-bit integer."""
+    host, port = address
+    return (struct.unpack(b"!I", socket.inet_aton(host))[0] << 16) | port
+
+
+def _unpack_address(packed):
+    """Unpack a 48-bit integer into a ``(host, port)`` IPv4 address."""
+    packed = int(packed)
+    return (socket.inet_ntoa(struct.pack(b"!I", packed >> 16)),
+            packed & 0xFFFF)
+
+
+# Typecode for an array of packed addresses. Python 2 doesn't support
+# unsigned long longs in arrays but doubles can represent every 48-bit
+# integer exactly.
+try:
+    array.array(str("Q"))
+except ValueError:
+    _PACKED_TYPECODE = str("d")
+else:
+    _PACKED_TYPECODE = str("Q")
+
+
+class AddressSet(object):
+    """A compact set of IPv4 addresses for deduplication.
+
+    Addresses are stored as packed 48-bit integers in a sorted array,
+    costing eight bytes each, rather than as tuples of strings in a
+    :class:`set`. New addresses are collected in a small buffer which is
+    merged into the array once it grows to a fraction of the array's
+    size, so adding addresses remains cheap.
+
+    This can be passed as the ``duplicates`` argument of
+    :meth:`MasterServerQuerier.find` to deduplicate with the given
+    ``method``. The same set can be used for multiple queries to
+    deduplicate across all of them.
+
+    :param addresses: an iterable of ``(host, port)`` addresses to add.
+    :param method: the :class:`Duplicates` behaviour to use.
+    """
+
+    def __init__(self, addresses=(), method=None):
+        self.method = Duplicates(Duplicates.SKIP if method is None else method)
+        self._array = array.array(_PACKED_TYPECODE)
+        self._buffer = set()
+        for address in addresses:
+            self.add(address)
+
+    def __len__(self):
+        return len(self._array) + len(self._buffer)
+
+    def __contains__(self, address):
+        return self._contains(_pack_address(address))
+
+    def __iter__(self):
+        self._merge()
+        for packed in self._array:
+            yield _unpack_address(packed)
+
+    def _contains(self, packed):
+        if packed in self._buffer:
+            return True
+        index = bisect.bisect_left(self._array, packed)
+        return index < len(self._array) and self._array[index] == packed
+
+    def _merge(self):
+        if self._buffer:
+            self._array = array.array(_PACKED_TYPECODE, heapq.merge(
+                self._array, sorted(self._buffer)))
+            self._buffer.clear()
+
+    def add(self, address):
+        """Add an address to the set."""
+        packed = _pack_address(address)
+        if not self._contains(packed):
+            self._buffer.add(packed)
+            if len(self._buffer) >= max(1024, len(self._array) // 8):
+                self._merge()
+
+
+class AddressBloomFilter(object):
+    """An approximate set of IPv4 addresses of a fixed size.
+
+    A Bloom filter uses a fixed amount of memory, determined by the
+    ``capacity`` and ``error_rate``, regardless of how many addresses are
+    added. However, membership is only approximate: an address that
+    hasn't been added may be reported as present. Once ``capacity``
+    addresses have been added the chance of this is ``error_rate``. No
+    address that has been added will be reported as absent.
+
+    When used with :meth:`MasterServerQuerier.find` this means unique
+    addresses may occasionally be treated as duplicates.
+
+    :param int capacity: the number of addresses expected to be added.
+    :param float error_rate: the false positive rate when at capacity.
+    :param method: the :class:`Duplicates` behaviour to use.
+    """
+
+    def __init__(self, capacity=1000000, error_rate=0.001, method=None):
+        if capacity < 1 or not 0 < error_rate < 1:
+            raise ValueError("Invalid capacity or error rate")
+        self.method = Duplicates(Duplicates.SKIP if method is None else method)
+        self.capacity = capacity
+        self.error_rate = error_rate
+        self._size = int(math.ceil(
+            -capacity * math.log(error_rate) / math.log(2) ** 2))
+        self._hashes = max(1, int(round(
+            self._size / capacity * math.log(2))))
+        self._bits = bytearray((self._size + 7) // 8)
+        self._count = 0
+
+    def __len__(self):
+        """Get the number of addresses that have been added."""
+        return self._count
+
+    def __contains__(self, address):
+        bits = self._bits
+        for index in self._indices(_pack_address(address)):
+            if not bits[index >> 3] & (1 << (index & 7)):
+                return False
+        return True
+
+    def _indices(self, packed):
+        # Double hashing using two rounds of SplitMix64
+        mask = 0xFFFFFFFFFFFFFFFF
+        first = (packed + 0x9E3779B97F4A7C15) & mask
+        first = ((first ^ (first >> 30)) * 0xBF58476D1CE4E5B9) & mask
+        first = ((first ^ (first >> 27)) * 0x94D049BB133111EB) & mask
+        first ^= first >> 31
+        second = (first + 0x9E3779B97F4A7C15) & mask
+        second = ((second ^ (second >> 30)) * 0xBF58476D1CE4E5B9) & mask
+        second = ((second ^ (second >> 27)) * 0x94D049BB133111EB) & mask
+        second ^= second >> 31
+        for i in six.moves.range(self._hashes):
+            yield (first + i * second) % self._size
+
+    def add(self, address):
+        """Add an address to the filter."""
+        bits = self._bits
+        for index in self._indices(_pack_address(address)):
+            bits[index >> 3] |= 1 << (index & 7)
+        self._count += 1
+
+
+def _difference(first, second):
+    """Yield the packed addresses in one sorted array but not another."""
+    second = iter(second)
+    other = next(second, None)
+    for packed in first:
+        while other is not None and other < packed:
+            other = next(second, None)
+        if other != packed:
+            yield _unpack_address(packed)
+
+
+#: The result of :meth:`Snapshot.diff`.
+#:
+#: Both ``added`` and ``removed`` are iterators of ``(host, port)``
+#: addresses in ascending order.
+SnapshotDiff = collections.namedtuple("SnapshotDiff", ["added", "removed"])
+
+
+class Snapshot(object):
+    """An immutable record of the addresses found by a crawl.
+
+    Addresses are stored as packed 48-bit integers in a sorted array, like
+    :class:`AddressSet`. Comparing two snapshots is therefore a linear
+    merge of two sorted arrays, rather than building and hashing sets of
+    tuples. This makes it cheap to find which servers have appeared or
+    disappeared since a previous crawl:
+
+    .. code:: python
+
+        with MasterServerQuerier() as msq:
+            current = Snapshot(msq.find(gamedir="tf"))
+        diff = current.diff(previous)
+        for address, result in a2s.scan(diff.added):
+            ...
+
+    Duplicate addresses are ignored.
+
+    :param addresses: an iterable of ``(host, port)`` addresses.
+    """
+
+    def __init__(self, addresses=()):
+        packed = array.array(_PACKED_TYPECODE, sorted(
+            _pack_address(address) for address in addresses))
+        # Duplicates are adjacent once sorted
+        self._array = array.array(_PACKED_TYPECODE)
+        for index, value in enumerate(packed):
+            if not index or value != packed[index - 1]:
+                self._array.append(value)
+
+    def __len__(self):
+        return len(self._array)
+
+    def __contains__(self, address):
+        packed = _pack_address(address)
+        index = bisect.bisect_left(self._array, packed)
+        return index < len(self._array) and self._array[index] == packed
+
+    def __iter__(self):
+        for packed in self._array:
+            yield _unpack_address(packed)
+
+    def __eq__(self, other):
+        if not isinstance(other, Snapshot):
+            return NotImplemented
+        return self._array == other._array
+
+    def __ne__(self, other):
+        equal = self.__eq__(other)
+        return equal if equal is NotImplemented else not equal
+
+    __hash__ = None
+
+    def diff(self, previous):
+        """Compare the snapshot to the one taken before it.
+
+        The returned iterators are lazy; each consumes both snapshots
+        once, in order.
+
+        :param previous: the previous :class:`Snapshot` or ``None``, in
+            which case every address is considered added.
+
+        :returns: a :data:`SnapshotDiff` of the addresses added since the
+            ``previous`` snapshot and those which have been removed.
+        """
+        if previous is None:
+            previous = Snapshot()
+        return SnapshotDiff(_difference(self._array, previous._array),
+                            _difference(previous._array, self._array))
+
+
+class Checkpoint(object):
+    """Paging cursors for resuming master server queries.
+
+    The master server returns addresses in pages, with each request
+    giving the last address of the previous page as a cursor. A
+    checkpoint records the cursor of the last page that was completely
+    consumed for each region and filter string queried. Passing the same
+    checkpoint to a later :meth:`MasterServerQuerier.find` resumes each
+    query from where it stopped, rather than starting from the first page
+    again. Once a query reaches the end of the address list its cursor
+    is removed.
+
+    If a ``path`` is given the cursors are loaded from the file, if it
+    exists, and are saved to it whenever they change. The file is
+    replaced atomically so it remains valid even if the process is
+    interrupted whilst saving.
+
+    Checkpoints are thread-safe; they can be shared by concurrent
+    region queries.
+
+    :param path: the path of a file to persist the cursors to.
+    """
+
+    def __init__(self, path=None):
+        self.path = path
+        self._lock = threading.Lock()
+        self._cursors = {}
+        if path is not None and os.path.exists(path):
+            self.load()
+
+    def __len__(self):
+        return len(self._cursors)
+
+    def get(self, region, filter_string):
+        """Get the cursor for a query.
+
+        :returns: the ``host:port`` cursor as a string, or ``None`` if
+            there is none for the query.
+        """
+        with self._lock:
+            return self._cursors.get((region, filter_string))
+
+    def set(self, region, filter_string, cursor):
+        """Set the cursor for a query."""
+        with self._lock:
+            self._cursors[(region, filter_string)] = cursor
+            if self.path is not None:
+                self._save()
+
+    def discard(self, region, filter_string):
+        """Remove the cursor for a query, if it has one."""
+        with self._lock:
+            if self._cursors.pop((region, filter_string), None) \
+                    and self.path is not None:
+                self._save()
+
+    def load(self):
+        """Load the cursors from :attr:`path`."""
+        with io.open(self.path, encoding="utf-8") as file_:
+            cursors = json.load(file_)
+        with self._lock:
+            self._cursors = {(region, filter_string): cursor
+                             for region, filter_string, cursor in cursors}
+
+    def save(self):
+        """Save the cursors to :attr:`path`."""
+        with self._lock:
+            self._save()
+
+    def _save(self):
+        cursors = [[region, filter_string, cursor] for
+                   (region, filter_string), cursor in self._cursors.items()]
+        temporary = "{}.tmp".format(self.path)
+        with io.open(temporary, "w", encoding="utf-8") as file_:
+            file_.write(six.text_type(json.dumps(cursors)))
+        if hasattr(os, "replace"):
+            os.replace(temporary, self.path)
+        else:
+            if os.path.exists(self.path):
+                os.remove(self.path)
+            os.rename(temporary, self.path)
+
+
+class Pacer(object):
+    """Adaptive token bucket for pacing master server requests.
+
+    The master server throttles clients that request pages too quickly
+    by simply not responding. A pacer spaces requests out so that on
+    average no more than :attr:`rate` are sent per minute, whilst
+    allowing up to ``burst`` requests to be sent back-to-back after
+    a period of inactivity.
+
+    The rate adapts to the master server's behaviour. Each page received
+    increases it by ``increase`` requests per minute, up to ``maximum``.
+    Each request that times out multiplies it by ``decrease``, down to
+    ``minimum``. This settles on close to the highest rate the master
+    server will tolerate.
+
+    Pacers are thread-safe. A single pacer should be shared by every
+    querier sending requests to the same master server.
+
+    :param float rate: the initial number of requests per minute.
+    :param int burst: the maximum number of requests that can be sent
+        without waiting.
+    :param float minimum: the lowest the rate will be decreased to.
+    :param float maximum: the highest the rate will be increased to. By
+        default there is no limit.
+    :param float increase: the amount the rate is increased by after each
+        successful request. By default this is 5% of the initial rate.
+    :param float decrease: the factor the rate is multiplied by after
+        each failed request.
+
+    :ivar rate: the current number of requests per minute.
+    """
+
+    def __init__(self, rate, burst=1, minimum=1.0,
+                 maximum=None, increase=None, decrease=0.5):
+        if rate <= 0 or burst < 1:
+            raise ValueError("Rate and burst must be positive")
+        self.rate = float(rate)
+        self.burst = burst
+        self.minimum = minimum
+        self.maximum = maximum
+        self.increase = rate * 0.05 if increase is None else increase
+        self.decrease = decrease
+        self._lock = threading.Lock()
+        self._tokens = float(burst)
+        self._updated = monotonic.monotonic()
+
+    def _refill(self):
+        now = monotonic.monotonic()
+        self._tokens = min(self.burst, self._tokens
+                           + (now - self._updated) * self.rate / 60.0)
+        self._updated = now
+
+    def wait(self):
+        """Block until a request can be sent.
+
+        Tokens are reserved in the order this is called so concurrent
+        callers are each given their own slot.
+        """
+        with self._lock:
+            self._refill()
+            self._tokens -= 1
+            delay = -self._tokens * 60.0 / self.rate
+        if delay > 0:
+            time.sleep(delay)
+
+    def success(self):
+        """Record a successful request, increasing the rate."""
+        with self._lock:
+            self._refill()
+            self.rate += self.increase
+            if self.maximum is not None:
+                self.rate = min(self.rate, self.maximum)
+
+    def failure(self):
+        """Record a failed request, decreasing the rate."""
+        with self._lock:
+            self._refill()
+            self.rate = max(self.minimum, self.rate * self.decrease)
+
+
+class _EncodedRequest(object):
+    """A request that has already been encoded."""
+
+    def __init__(self, encoded):
+        self.encoded = encoded
+
+    def encode(self):
+        return self.encoded
+
+
+class MasterFilter(six.text_type):
+    """A compiled master server filter string.
+
+    This takes the same filtering keyword arguments as
+    :meth:`MasterServerQuerier.find` and compiles them into the filter
+    string sent to the master server. The filter can then be passed to
+    :meth:`MasterServerQuerier.find` as ``master_filter`` as many times as
+    needed. As well as avoiding rebuilding the filter string, the encoded
+    requests sent to the master server are cached.
+
+    Additionally, the ``nor`` and ``nand`` operators are supported. These
+    take another :class:`MasterFilter`, or a dictionary of filters. The
+    master server excludes servers that match *any* of the conditions
+    given as ``nor``, or *all* of the conditions given as ``nand``. These
+    can be nested, in which case a nested operator counts as a single
+    condition of the operator containing it.
+
+    .. code:: python
+
+        tf2 = MasterFilter(
+            gamedir="tf",
+            empty=True,
+            nor=MasterFilter(map="ctf_2fort", nand={"full": True,
+                                                    "secure": False}),
+        )
+
+    As this is a string, it can also be used wherever a filter string is
+    expected. Filters must be given as keyword arguments; a filter string
+    can't be compiled into a :class:`MasterFilter`.
+
+    :raises TypeError: if ``nor`` or ``nand`` isn't a :class:`MasterFilter`
+        or dictionary.
+
+    :ivar conditions: the number of conditions in the filter. Operators
+        count as a single condition.
+    """
+
+    def __new__(cls, nor=None, nand=None, **filters):
+        conditions = {}
+        for key, value in six.iteritems(filters):
+            if key in {"secure", "linux", "empty",
+                       "full", "proxy", "noplayers", "white"}:
+                value = int(bool(value))
+            elif key in {"gametype", "gamedata", "gamedataor"}:
+                value = [six.text_type(elt)
+                         for elt in value if six.text_type(elt)]
+                if not value:
+                    continue
+                value = ",".join(value)
+            elif key == "napp":
+                value = int(value)
+            elif key == "type":
+                if not isinstance(value, util.ServerType):
+                    value = util.ServerType(value).char
+                else:
+                    value = value.char
+            conditions[key] = six.text_type(value)
+        for key, nested in [("nor", nor), ("nand", nand)]:
+            if nested is None:
+                continue
+            if not isinstance(nested, MasterFilter):
+                if not isinstance(nested, collections.Mapping):
+                    raise TypeError(
+                        "{} must be a MasterFilter or dictionary, "
+                        "not {!r}".format(key, nested))
+                nested = cls(**nested)
+            if nested.conditions:
+                conditions[key] = "{}{}".format(nested.conditions, nested)
+        # Order doesn't actually matter, but it makes testing easier
+        conditions = sorted(conditions.items(), key=lambda pair: pair[0])
+        filter_string = "\\".join(
+            [part for pair in conditions for part in pair])
+        if filter_string:
+            filter_string = "\\" + filter_string
+        return cls._compiled(filter_string, len(conditions))
+
+    @classmethod
+    def _compiled(cls, filter_string, conditions):
+        """Create a filter from an already compiled filter string."""
+        self = super(MasterFilter, cls).__new__(cls, filter_string)
+        self.conditions = conditions
+        self._encoded = filter_string.encode("utf-8") + b"\x00"
+        self._requests = {}
+        return self
+
+    def __reduce__(self):
+        # The constructor takes filters rather than the filter string so
+        # copies and unpickled filters are created from the string instead.
+        return (_restore_master_filter,
+                (self.__class__, six.text_type(self), self.conditions))
+
+    def encode_request(self, region, address="0.0.0.0:0"):
+        """Encode a master server request using the filter.
+
+        The layout is the same as :class:`messages.MasterServerRequest`.
+        Requests for the first page of each region are cached.
+
+        :param int region: the numeric region identifier.
+        :param address: the ``host:port`` address of the last server
+            returned by the previous request, or ``0.0.0.0:0`` for the
+            first page.
+        """
+        request = self._requests.get((region, address))
+        if request is None:
+            request = (b"\x31" + six.int2byte(region)
+                       + address.encode("ascii") + b"\x00" + self._encoded)
+            if address == "0.0.0.0:0":
+                self._requests[(region, address)] = request
+        return request
+
+
+def _restore_master_filter(cls, filter_string, conditions):
+    """Recreate a :class:`MasterFilter` when it's copied or unpickled."""
+    return cls._compiled(filter_string, conditions)
+
+
 class MasterServerQuerier(valve.source.BaseQuerier):
     """Implements the Source master server query protocol
 
@@ -52,10 +639,30 @@ class MasterServerQuerier(valve.source.BaseQuerier):
     .. note::
         Instantiating this class creates a socket. Be sure to close the
         querier once finished with it. See :class:`valve.source.BaseQuerier`.
+
+    By default a query stops as soon as a request for a page times out.
+    If ``retries`` is given, the request is repeated that many times
+    before giving up, waiting ``backoff`` seconds before the first
+    retry and doubling the wait for each one after.
+
+    Requests are sent as fast as pages are received unless a ``rate`` is
+    given. This can be a :class:`Pacer` or the initial number of requests
+    per minute to create one with.
+
+    :ivar retries: the number of times to retry a page.
+    :ivar backoff: the number of seconds to wait before the first retry.
+    :ivar pacer: the :class:`Pacer` used to pace requests, if any.
     """
 
-    def __init__(self, address=MASTER_SERVER_ADDR, timeout=10.0):
+    def __init__(self, address=MASTER_SERVER_ADDR,
+                 timeout=10.0, retries=0, backoff=1.0, rate=None):
         super(MasterServerQuerier, self).__init__(address, timeout)
+        self.retries = retries
+        self.backoff = backoff
+        if rate is None or isinstance(rate, Pacer):
+            self.pacer = rate
+        else:
+            self.pacer = Pacer(rate)
 
     def __iter__(self):
         """An unfitlered iterator of all Source servers
@@ -73,7 +680,7 @@ class MasterServerQuerier(valve.source.BaseQuerier):
         """
         return self.find(region="all")
 
-    def _query(self, region, filter_string):
+    def _query(self, region, filter_string, checkpoint=None):
         """Issue a request to the master server
 
         Returns a generator which yields ``(host, port)`` addresses as
@@ -94,32 +701,150 @@ class MasterServerQuerier(valve.source.BaseQuerier):
         on the Valve develper wiki:
 
         https://developer.valvesoftware.com/wiki/Master_Server_Query_Protocol#Filter
+
+        If a :class:`Checkpoint` is given then the query starts from its
+        cursor for the region and filter string. The checkpoint is updated
+        once each page of addresses has been completely yielded. A request
+        that times out is retried as configured by :attr:`retries`.
         """
         last_addr = "0.0.0.0:0"
-        first_request = True
-        while first_request or last_addr != "0.0.0.0:0":
-            first_request = False
-            self.request(messages.MasterServerRequest(
-                region=region, address=last_addr, filter=filter_string))
+        if checkpoint is not None:
+            last_addr = checkpoint.get(region, filter_string) or last_addr
+        attempt = 0
+        complete = False
+        while not complete:
+            if self.pacer is not None:
+                self.pacer.wait()
+            if isinstance(filter_string, MasterFilter):
+                self.request(_EncodedRequest(
+                    filter_string.encode_request(region, last_addr)))
+            else:
+                self.request(messages.MasterServerRequest(
+                    region=region, address=last_addr, filter=filter_string))
             try:
                 raw_response = self.get_response()
             except valve.source.NoResponseError:
-                return
+                if self.pacer is not None:
+                    self.pacer.failure()
+                if attempt >= self.retries:
+                    return
+                time.sleep(self.backoff * 2 ** attempt)
+                attempt += 1
+                # A late response to the unanswered request would
+                # otherwise be mistaken for the response to the retry.
+                self._drain()
+                continue
             else:
+                attempt = 0
+                if self.pacer is not None:
+                    self.pacer.success()
                 response = messages.MasterServerResponse.decode(raw_response)
-                for address in response["addresses"]:
-                    last_addr = "{}:{}".format(
-                        address["host"], address["port"])
-                    if not address.is_null:
-                        yield address["host"], address["port"]
+                page = response["addresses"]
+                if not isinstance(page, messages.MSAddressPage):
+                    page = messages.MSAddressPage.from_entries(page)
+                for address in page.addresses():
+                    if address != ("0.0.0.0", 0):
+                        yield address
+                if page:
+                    last_addr = "{}:{}".format(*page.address(len(page) - 1))
+                complete = last_addr == "0.0.0.0:0"
+                if checkpoint is not None:
+                    if complete:
+                        checkpoint.discard(region, filter_string)
+                    else:
+                        checkpoint.set(region, filter_string, last_addr)
+
+    def _drain(self):
+        """Discard any responses that have already been received."""
+        while select.select([self._socket], [], [], 0)[0]:
+            try:
+                self._socket.recv(65536)
+            except socket.error:
+                return
+
+    def _query_concurrently(self, regions, filter_string, checkpoint=None):
+        """Query multiple regions at once.
+
+        Each region is queried from its own thread using its own querier,
+        and therefore socket, so that pages for every region can be
+        requested without waiting on the others. The addresses are merged
+        into a single iterator as they are received, so addresses from
+        different regions will be interleaved.
+
+        Exceptions raised whilst querying a region are re-raised by the
+        returned iterator. Closing the iterator stops all the threads.
 
-    def _deduplicate(self, method, query):
+        Checkpoint updates are queued behind the addresses of their page
+        and only applied once they're dequeued, so the checkpoint never
+        advances past addresses that were fetched but not yet consumed.
+
+        :raises valve.source.QuerierClosedError: if the querier has been
+            closed. The workers use their own queriers so this must be
+            checked before they're started.
+        """
+        if self._socket is None:
+            raise valve.source.QuerierClosedError
+        queue = six.moves.queue.Queue(_PREFETCH)
+        stop = threading.Event()
+        done = object()
+
+        def put(item):
+            while not stop.is_set():
+                try:
+                    queue.put(item, timeout=0.1)
+                except six.moves.queue.Full:
+                    continue
+                return True
+            return False
+
+        if checkpoint is not None:
+            checkpoint = _QueuedCheckpoint(checkpoint, put)
+
+        def worker(region):
+            try:
+                with self.__class__((self.host, self.port), self.timeout,
+                                    self.retries, self.backoff,
+                                    self.pacer) as querier:
+                    for address in querier._query(
+                            region, filter_string, checkpoint):
+                        if not put(address):
+                            return
+            except Exception:
+                put(_Failure(sys.exc_info()))
+            finally:
+                put(done)
+
+        threads = [threading.Thread(target=worker, args=(region,))
+                   for region in regions]
+        for thread in threads:
+            thread.daemon = True
+            thread.start()
+        try:
+            remaining = len(threads)
+            while remaining:
+                item = queue.get()
+                if item is done:
+                    remaining -= 1
+                elif isinstance(item, _Failure):
+                    six.reraise(*item.exc_info)
+                elif isinstance(item, _PageEnd):
+                    item.apply()
+                else:
+                    yield item
+        finally:
+            stop.set()
+
+    def _deduplicate(self, method, query, seen=None):
         """Deduplicate addresses in a :meth:`._query`.
 
         The given ``method`` should be a :class:`Duplicates` object. The
-        ``query`` is an iterator as returned by :meth:`._query`.
+        ``query`` is an iterator as returned by :meth:`._query`. The
+        addresses seen so far are recorded in ``seen`` which should be an
+        :class:`AddressSet` or :class:`AddressBloomFilter`. By default
+        a new :class:`AddressSet` is used.
         """
-        seen = set()
+        if seen is None:
+            seen = AddressSet()
         if method is Duplicates.KEEP:
             for address in query:
                 yield address
@@ -182,7 +907,8 @@ class MasterServerQuerier(valve.source.BaseQuerier):
                 raise ValueError("Invalid region identifier {!r}".format(reg))
         return regions
 
-    def find(self, region="all", duplicates=Duplicates.SKIP, **filters):
+    def find(self, region="all", duplicates=Duplicates.SKIP,
+             checkpoint=None, master_filter=None, **filters):
         """Find servers for a particular region and set of filtering rules
 
         This returns an iterator which yields ``(host, port)`` server
@@ -277,6 +1003,11 @@ class MasterServerQuerier(valve.source.BaseQuerier):
         |            | Only applicable to L4D2 servers.                      |
         +------------+-------------------------------------------------------+
 
+        Alternately, a :class:`MasterFilter` can be given as
+        ``master_filter`` instead of the keyword arguments. This is faster
+        when making the same query repeatedly, and supports the ``nor``
+        and ``nand`` operators.
+
         .. note::
             Your mileage may vary with some of these filters. There's no
             real guarantee that the servers returned by the master server will
@@ -287,6 +1018,22 @@ class MasterServerQuerier(valve.source.BaseQuerier):
         The master server may return duplicate addresses. By default, these
         duplicates are excldued from the iterator returned by this method.
         See :class:`Duplicates` for controller this behaviour.
+
+        The addresses seen are recorded in a compact :class:`AddressSet`.
+        Alternately, an :class:`AddressSet` or :class:`AddressBloomFilter`
+        can be given as ``duplicates``, in which case its ``method`` is
+        used. This allows addresses to be deduplicated across multiple
+        queries, or approximately deduplicated in a fixed amount of memory.
+
+        When multiple regions are given they are queried concurrently,
+        each from a separate socket. The addresses from each region are
+        interleaved in the order they're received.
+
+        A :class:`Checkpoint` can be given as ``checkpoint`` to make the
+        query resumable. If the iterator stops early, because a request
+        timed out or it was simply not exhausted, then finding again with
+        the same checkpoint will continue from the last complete page for
+        each region.
         """
         if isinstance(region, (int, six.text_type)):
             regions = self._map_region(region)
@@ -294,34 +1041,18 @@ class MasterServerQuerier(valve.source.BaseQuerier):
             regions = []
             for reg in region:
                 regions.extend(self._map_region(reg))
-        filter_ = {}
-        for key, value in six.iteritems(filters):
-            if key in {"secure", "linux", "empty",
-                       "full", "proxy", "noplayers", "white"}:
-                value = int(bool(value))
-            elif key in {"gametype", "gamedata", "gamedataor"}:
-                value = [six.text_type(elt)
-                         for elt in value if six.text_type(elt)]
-                if not value:
-                    continue
-                value = ",".join(value)
-            elif key == "napp":
-                value = int(value)
-            elif key == "type":
-                if not isinstance(value, util.ServerType):
-                    value = util.ServerType(value).char
-                else:
-                    value = value.char
-            filter_[key] = six.text_type(value)
-        # Order doesn't actually matter, but it makes testing easier
-        filter_ = sorted(filter_.items(), key=lambda pair: pair[0])
-        filter_string = "\\".join([part for pair in filter_ for part in pair])
-        if filter_string:
-            filter_string = "\\" + filter_string
-        queries = []
-        for region in regions:
-            queries.append(self._query(region, filter_string))
-        query = self._deduplicate(
-            Duplicates(duplicates), itertools.chain.from_iterable(queries))
+        if master_filter is None:
+            master_filter = MasterFilter(**filters)
+        elif filters:
+            raise ValueError("Can't give filters as well as a MasterFilter")
+        if len(regions) == 1:
+            query = self._query(regions[0], master_filter, checkpoint)
+        else:
+            query = self._query_concurrently(
+                regions, master_filter, checkpoint)
+        if isinstance(duplicates, (AddressSet, AddressBloomFilter)):
+            query = self._deduplicate(duplicates.method, query, duplicates)
+        else:
+            query = self._deduplicate(Duplicates(duplicates), query)
         for address in query:
             yield address
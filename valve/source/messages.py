@@ -4,11 +4,18 @@
 from __future__ import (absolute_import,
                         unicode_literals, print_function, division)
 
+import array
 import collections
+import socket
 import struct
 
 import six
 
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
 from . import util
 
 
@@ -42,6 +49,29 @@ def needs_buffer(func):
     return needs_buffer
 
 
+def needs_buffer_from(func):
+    def needs_buffer_from(self, buffer, offset=0, *args, **kwargs):
+        if len(buffer) <= offset:
+            raise BufferExhaustedError
+        return func(self, buffer, offset, *args, **kwargs)
+    return needs_buffer_from
+
+
+def _overrides_decode(class_):
+    """
+        Determines whether a field or message class overrides decode()
+        without also overriding decode_from(). Such classes are decoded
+        with decode() so that their behaviour is preserved.
+    """
+
+    for base in class_.__mro__:
+        if "decode_from" in base.__dict__:
+            return False
+        if "decode" in base.__dict__:
+            return True
+    return False
+
+
 class MessageField(object):
 
     fmt = None
@@ -102,6 +132,22 @@ class MessageField(object):
         except struct.error as exc:
             raise BrokenMessageError(exc)
 
+    def _compile(self):
+        """
+            Returns a (format, convert) tuple describing how to decode
+            the field with struct.unpack_from, or None if it can't be.
+
+            The format includes the byte order prefix. The items
+            unpacked for the field are passed to the convert callable
+            which returns the field's value. Fields which override
+            decode() must also override this if they're to be compiled.
+        """
+
+        if (six.get_unbound_function(type(self).decode)
+                is not six.get_unbound_function(MessageField.decode)):
+            return None
+        return self.format, self.validate if self.validators else None
+
     @needs_buffer
     def decode(self, buffer, values={}):
         """
@@ -132,6 +178,28 @@ class MessageField(object):
         except struct.error as exc:
             raise BrokenMessageError(exc)
 
+    @needs_buffer_from
+    def decode_from(self, buffer, offset=0, values={}):
+        """
+            The same as decode() except the field is decoded from the
+            given offset into the buffer, rather than its start. Rather
+            than copying the remainder of the buffer, the offset of the
+            end of the field is returned along with the decoded value.
+
+            The buffer may be a bytes, bytearray or memoryview. Decoding
+            a message this way is linear in the size of the buffer.
+        """
+
+        field_size = struct.calcsize(self.format)
+        if len(buffer) - offset < field_size:
+            raise BufferExhaustedError
+        try:
+            return (self.validate(
+                struct.unpack_from(self.format, buffer, offset)[0]),
+                offset + field_size)
+        except struct.error as exc:
+            raise BrokenMessageError(exc)
+
 
 class ByteField(MessageField):
     fmt = "B"
@@ -154,6 +222,16 @@ class StringField(MessageField):
         left_overs = buffer[field_size:]
         return field_data.decode("utf8", "ignore"), left_overs
 
+    @needs_buffer_from
+    def decode_from(self, buffer, offset=0, values={}):
+        if isinstance(buffer, memoryview):
+            buffer = buffer.tobytes()
+        terminator = buffer.find(b"\x00", offset)
+        if terminator == -1:
+            raise BufferExhaustedError("No string terminator")
+        return (buffer[offset:terminator].decode("utf8", "ignore"),
+                terminator + 1)
+
 
 class ShortField(MessageField):
     fmt = "h"
@@ -169,21 +247,37 @@ class FloatField(MessageField):
 
 class PlatformField(ByteField):
 
+    def _compile(self):
+        return self.format, lambda byte: util.Platform(self.validate(byte))
+
     @needs_buffer
     def decode(self, buffer, values={}):
         byte, remnant_buffer = super(PlatformField,
                                      self).decode(buffer, values)
         return util.Platform(byte), remnant_buffer
 
+    def decode_from(self, buffer, offset=0, values={}):
+        byte, offset = super(PlatformField,
+                             self).decode_from(buffer, offset, values)
+        return util.Platform(byte), offset
+
 
 class ServerTypeField(ByteField):
 
+    def _compile(self):
+        return self.format, lambda byte: util.ServerType(self.validate(byte))
+
     @needs_buffer
     def decode(self, buffer, values={}):
         byte, remnant_buffer = super(ServerTypeField,
                                      self).decode(buffer, values)
         return util.ServerType(byte), remnant_buffer
 
+    def decode_from(self, buffer, offset=0, values={}):
+        byte, offset = super(ServerTypeField,
+                             self).decode_from(buffer, offset, values)
+        return util.ServerType(byte), offset
+
 
 class MessageArrayField(MessageField):
     """
@@ -245,10 +339,15 @@ class MessageArrayField(MessageField):
         return b"".join(buf)
 
     def decode(self, buffer, values={}):
+        entries, offset = self.decode_from(buffer, 0, values)
+        return entries, buffer[offset:]
+
+    def decode_from(self, buffer, offset=0, values={}):
         entries = []
         count = 0
+        legacy = _overrides_decode(self.element)
         while count < self.count(values):
-            # Set start_buffer to the beginning of the buffer so that in
+            # Set start_offset to the beginning of the entry so that in
             # the case of buffer exhaustion it can return from the
             # start of the entry, not half-way through it.
             #
@@ -267,17 +366,20 @@ class MessageArrayField(MessageField):
             # however ShortField will fail with BufferExhaustedError as
             # there's only one byte left. However, there is enough left
             # for the trailing ByteField. So when ComplexField
-            # propagates ShortField's BufferExhaustedError the buffer will
-            # only have the 00 byte remaining. The exception if caught
-            # and buffer reverted to FF FF FF FF 00. This is passed
-            # to ByteField which consumes one byte and the reamining
+            # propagates ShortField's BufferExhaustedError the offset will
+            # be past the FF FF FF FF bytes. The exception if caught
+            # and offset reverted to the start of FF FF FF FF 00. This is
+            # passed to ByteField which consumes one byte and the reamining
             # FF FF FF 00 bytes and stored as message payload.
             #
             # This is very much an edge case. :/
-            start_buffer = buffer
+            start_offset = offset
             try:
-                entry = self.element.decode(buffer)
-                buffer = entry.payload
+                if legacy:
+                    entry = self.element.decode(buffer[offset:])
+                    offset = len(buffer) - len(entry.payload)
+                else:
+                    entry, offset = self.element.decode_from(buffer, offset)
                 entries.append(entry)
                 count += 1
             except (BufferExhaustedError, BrokenMessageError) as exc:
@@ -285,9 +387,9 @@ class MessageArrayField(MessageField):
                 # buffer is reached.
                 if count < self.count.minimum:
                     raise BrokenMessageError(exc)
-                buffer = start_buffer
+                offset = start_offset
                 break
-        return entries, buffer
+        return entries, offset
 
     @staticmethod
     def value_of(name):
@@ -368,12 +470,98 @@ class MessageDictField(MessageArrayField):
         MessageArrayField.__init__(self, name, element, count)
 
     def decode(self, buffer, values={}):
-        entries, buffer = MessageArrayField.decode(self, buffer, values)
+        entries, offset = self.decode_from(buffer, 0, values)
+        return entries, buffer[offset:]
+
+    def decode_from(self, buffer, offset=0, values={}):
+        entries, offset = MessageArrayField.decode_from(
+            self, buffer, offset, values)
         entries_dict = {}
         for entry in entries:
             entries_dict[entry[
                 self.key_field.name]] = entry[self.value_field.name]
-        return entries_dict, buffer
+        return entries_dict, offset
+
+
+class _StructRun(object):
+    """
+        A run of consecutive fields that are decoded together by a
+        single precompiled struct.
+
+        Each field is a (field, count, convert) tuple where count is the
+        number of items unpacked for the field.
+    """
+
+    def __init__(self, byte_order):
+        self.byte_order = byte_order
+        self.formats = []
+        self.fields = []
+        self.struct = None
+
+    def add(self, field, fmt, convert):
+        fmt = str(fmt)
+        count = len(struct.unpack(fmt, b"\x00" * struct.calcsize(fmt)))
+        self.formats.append(fmt[1:])
+        self.fields.append((field, count, convert))
+
+    def compile(self):
+        self.struct = struct.Struct(str(self.byte_order + "".join(self.formats)))
+        return self
+
+    def decode(self, buffer, offset, values):
+        """
+            Decodes the fields from the buffer at the given offset into
+            values. Returns the offset after the fields or None if the
+            buffer is too short.
+        """
+
+        if len(buffer) - offset < self.struct.size:
+            return None
+        try:
+            items = self.struct.unpack_from(buffer, offset)
+        except struct.error as exc:
+            raise BrokenMessageError(exc)
+        index = 0
+        for field, count, convert in self.fields:
+            if count == 1:
+                value = items[index]
+                if convert is not None:
+                    value = convert(value)
+            else:
+                value = convert(*items[index:index + count])
+            values[field.name] = value
+            index += count
+        return offset + self.struct.size
+
+
+def _compile_fields(fields):
+    """
+        Compiles a sequence of fields into a list of decoding steps.
+        Consecutive fields that can be decoded by struct and share the
+        same byte order are merged into a single _StructRun. All other
+        fields are given as a (field, legacy) tuple where legacy is
+        whether the field must be decoded with decode() rather than
+        decode_from().
+    """
+
+    steps = []
+    run = None
+    for field in fields:
+        compiled = field._compile()
+        if compiled is not None:
+            fmt, convert = compiled
+            if isinstance(fmt, bytes):
+                fmt = fmt.decode("ascii")
+            if fmt[:1] in ("<", ">", "!", "="):
+                if run is None or run.byte_order != fmt[0]:
+                    run = _StructRun(fmt[0])
+                    steps.append(run)
+                run.add(field, fmt, convert)
+                continue
+        run = None
+        steps.append(field)
+    return [step.compile() if isinstance(step, _StructRun)
+            else (step, _overrides_decode(type(step))) for step in steps]
 
 
 class Message(collections.Mapping):
@@ -407,13 +595,54 @@ class Message(collections.Mapping):
             buf.append(field.encode(values.get(field.name, None), values))
         return b"".join(buf)
 
+    @classmethod
+    def _decoder(cls):
+        # The decoding steps are compiled on first use and cached
+        # against the class' fields in case they are replaced.
+        compiled = cls.__dict__.get("_compiled_fields")
+        if compiled is None or compiled[0] is not cls.fields:
+            compiled = (cls.fields, _compile_fields(cls.fields))
+            cls._compiled_fields = compiled
+        return compiled[1]
+
     @classmethod
     def decode(cls, packet):
-        buffer = packet
+        message, offset = cls.decode_from(packet)
+        message.payload = packet[offset:]
+        return message
+
+    @classmethod
+    def decode_from(cls, buffer, offset=0):
+        """
+            Decodes a message from the given offset into the buffer.
+            Returns the message, without a payload, and the offset of
+            the end of the message in the buffer.
+        """
+
+        if isinstance(buffer, memoryview):
+            buffer = buffer.tobytes()
         values = {}
-        for field in cls.fields:
-            values[field.name], buffer = field.decode(buffer, values)
-        return cls(buffer, **values)
+        for step in cls._decoder():
+            if isinstance(step, _StructRun):
+                end = step.decode(buffer, offset, values)
+                if end is not None:
+                    offset = end
+                    continue
+                # Not enough left for the whole run, so fall back to
+                # decoding each field so the same error is raised.
+                for field, _, _ in step.fields:
+                    values[field.name], offset = \
+                        field.decode_from(buffer, offset, values)
+            else:
+                field, legacy = step
+                if legacy:
+                    values[field.name], left_overs = \
+                        field.decode(buffer[offset:], values)
+                    offset = len(buffer) - len(left_overs)
+                else:
+                    values[field.name], offset = \
+                        field.decode_from(buffer, offset, values)
+        return cls(None, **values), offset
 
 
 class Header(Message):
@@ -434,10 +663,18 @@ class Fragment(Message):
 
     @property
     def is_compressed(self):
-        return bool(self["message_id"] & 2**(2*8))
+        # Compression is flagged by the most significant bit of the
+        # message ID which, as the field is signed, makes it negative.
+        return self["message_id"] < 0
 
 
-# TODO: FragmentCompressionData
+class FragmentCompressionData(Message):
+    """Prefixed to the payload of the first fragment when compressed."""
+
+    fields = (
+        LongField("decompressed_size"),
+        LongField("crc32"),
+    )
 
 
 class InfoRequest(Message):
@@ -447,6 +684,17 @@ class InfoRequest(Message):
         StringField("payload", True, "Source Engine Query")
     )
 
+    def encode(self, **field_values):
+        # Newer servers respond to A2S_INFO with a challenge which must
+        # be appended to the repeated request. A challenge of -1 is
+        # treated the same as no challenge, just as it requests a new
+        # challenge for A2S_PLAYER and A2S_RULES.
+        challenge = dict(self.values, **field_values).get("challenge", -1)
+        encoded = super(InfoRequest, self).encode(**field_values)
+        if challenge == -1:
+            return encoded
+        return encoded + LongField("challenge").encode(challenge)
+
 
 class InfoResponse(Message):
 
@@ -527,16 +775,18 @@ class RulesResponse(Message):
     )
 
     @classmethod
-    def decode(cls, packet):
+    def decode_from(cls, buffer, offset=0):
         # A2S_RESPONSE misteriously seems to add a FF FF FF FF
         # long to the beginning of the response which isn't
         # mentioned on the wiki.
         #
         # Behaviour witnessed with TF2 server 94.23.226.200:2045
         # As of 2015-11-22, Quake Live servers on steam do not
-        if packet.startswith(b'\xff\xff\xff\xff'):
-            packet = packet[4:]
-        return super(cls, RulesResponse).decode(packet)
+        if isinstance(buffer, memoryview):
+            buffer = buffer.tobytes()
+        if buffer.startswith(b'\xff\xff\xff\xff', offset):
+            offset += 4
+        return super(RulesResponse, cls).decode_from(buffer, offset)
 
 # For Master Server
 class MSAddressEntryPortField(MessageField):
@@ -545,6 +795,10 @@ class MSAddressEntryPortField(MessageField):
 
 class MSAddressEntryIPField(MessageField):
 
+    def _compile(self):
+        return b"!BBBB", lambda *octets: ".".join(
+            six.text_type(octet) for octet in octets)
+
     @needs_buffer
     def decode(self, buffer, values={}):
         if len(buffer) < 4:
@@ -554,6 +808,133 @@ class MSAddressEntryIPField(MessageField):
         return (".".join(six.text_type(b) for b in
                 struct.unpack(b"<BBBB", field_data)), left_overs)
 
+    @needs_buffer_from
+    def decode_from(self, buffer, offset=0, values={}):
+        if len(buffer) - offset < 4:
+            raise BufferExhaustedError
+        return (".".join(six.text_type(b) for b in
+                struct.unpack_from(b"<BBBB", buffer, offset)), offset + 4)
+
+
+# Typecode for an array of unsigned integers of at least 32 bits
+_UINT32 = "I" if array.array("I").itemsize >= 4 else "L"
+
+_MS_ADDRESS = struct.Struct(b"!BBBBH")
+
+
+class MSAddressPage(collections.Sequence):
+    """
+        A page of addresses returned by the master server.
+
+        The page keeps the raw six byte address entries as sent by the
+        master server rather than decoding each into an MSAddressEntry.
+        Host strings are only formatted as addresses are iterated over
+        by addresses(). The hosts and ports can also be accessed as
+        compact arrays of integers, or as a NumPy structured array if
+        NumPy is installed.
+
+        For compatibility with MessageArrayField, indexing the page
+        gives MSAddressEntry messages.
+    """
+
+    def __init__(self, data=b""):
+        if not isinstance(data, bytes):
+            data = memoryview(data).tobytes()
+        self.data = data[:len(data) - len(data) % _MS_ADDRESS.size]
+        self._hosts = None
+        self._ports = None
+
+    @classmethod
+    def from_entries(cls, entries):
+        """
+            Creates a page from an iterable of MSAddressEntry messages
+            or anything else with 'host' and 'port' items.
+        """
+
+        return cls(b"".join(
+            socket.inet_aton(entry["host"])
+            + struct.pack(b"!H", entry["port"]) for entry in entries))
+
+    def __len__(self):
+        return len(self.data) // _MS_ADDRESS.size
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            return [self[i] for i in six.moves.range(*index.indices(len(self)))]
+        if index < 0:
+            index += len(self)
+        if not 0 <= index < len(self):
+            raise IndexError("Address index out of range")
+        host, port = self.address(index)
+        return MSAddressEntry(host=host, port=port)
+
+    def _unpack(self):
+        items = struct.unpack(
+            str("!" + "IH" * len(self)), self.data)
+        self._hosts = array.array(_UINT32, items[0::2])
+        self._ports = array.array(str("H"), items[1::2])
+
+    @property
+    def hosts(self):
+        """An array of the IPv4 addresses as integers."""
+        if self._hosts is None:
+            self._unpack()
+        return self._hosts
+
+    @property
+    def ports(self):
+        """An array of the port numbers."""
+        if self._ports is None:
+            self._unpack()
+        return self._ports
+
+    def address(self, index):
+        """Gets a (host, port) tuple for the address at the given index."""
+        octets = _MS_ADDRESS.unpack_from(self.data, index * _MS_ADDRESS.size)
+        return "{}.{}.{}.{}".format(*octets[:4]), octets[4]
+
+    def addresses(self):
+        """Iterates over the addresses as (host, port) tuples."""
+        for offset in six.moves.range(0, len(self.data), _MS_ADDRESS.size):
+            octets = _MS_ADDRESS.unpack_from(self.data, offset)
+            yield "{}.{}.{}.{}".format(*octets[:4]), octets[4]
+
+    def to_numpy(self):
+        """
+            Gets the addresses as a NumPy structured array with 'host'
+            and 'port' fields. Raises ImportError if NumPy isn't
+            installed.
+        """
+
+        if numpy is None:
+            raise ImportError("NumPy is required")
+        return numpy.frombuffer(self.data, dtype=numpy.dtype([
+            (str("host"), str(">u4")), (str("port"), str(">u2"))]))
+
+    def encode(self):
+        return self.data
+
+
+class MSAddressArrayField(MessageField):
+    """
+        Decodes all the remaining complete addresses in a master server
+        response into an MSAddressPage in a single pass.
+    """
+
+    def encode(self, page, values={}):
+        if not isinstance(page, MSAddressPage):
+            page = MSAddressPage.from_entries(page)
+        return page.encode()
+
+    def decode(self, buffer, values={}):
+        page, offset = self.decode_from(buffer, 0, values)
+        return page, buffer[offset:]
+
+    def decode_from(self, buffer, offset=0, values={}):
+        size = len(buffer) - offset
+        end = offset + size - size % _MS_ADDRESS.size
+        return MSAddressPage(buffer[offset:end]), end
+
 
 class MasterServerRequest(Message):
 
@@ -584,5 +965,5 @@ class MasterServerResponse(Message):
         # and can be ignored.
         MSAddressEntryIPField("start_host"),
         MSAddressEntryPortField("start_port"),
-        MessageArrayField("addresses", MSAddressEntry, MessageArrayField.all())
+        MSAddressArrayField("addresses"),
     )
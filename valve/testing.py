@@ -1,8 +1,10 @@
 """Utilities for testing."""
 
+import collections
 import copy
 import functools
 import select
+import threading
 
 import six.moves.socketserver as socketserver
 
@@ -181,3 +183,51 @@ class TestRCONServer(socketserver.TCPServer):
             configured for the server.
         """
         return copy.deepcopy(self._expectations)
+
+
+class _TestA2SHandler(socketserver.BaseRequestHandler):
+    """Request handler for :class:`TestA2SServer`."""
+
+    def handle(self):
+        """Respond to a single datagram.
+
+        The received datagram is recorded by the server. If any responses
+        have been configured for it then they're sent back to the client
+        in order. Datagrams with no configured responses are ignored,
+        mimicking an unresponsive server.
+        """
+        data, socket_ = self.request
+        with self.server.lock:
+            self.server.received.append((self.client_address, data))
+            responses = list(self.server.responses.get(data, ()))
+        for response in responses:
+            socket_.sendto(response, self.client_address)
+
+
+class TestA2SServer(socketserver.UDPServer):
+    """Stub A2S server for testing.
+
+    Unlike :class:`TestRCONServer` requests aren't expected in any
+    particular order. Instead, each raw request datagram is mapped to
+    zero or more raw response datagrams via :meth:`respond`. Every
+    datagram the server receives is recorded in :attr:`received` as
+    a tuple of the client address and the datagram itself.
+
+    :param address: the address the server should bind to. By default it
+        will use a random port on the loopback interface.
+    """
+
+    def __init__(self, address=("127.0.0.1", 0)):
+        socketserver.UDPServer.__init__(self, address, _TestA2SHandler)
+        self.lock = threading.Lock()
+        self.responses = collections.defaultdict(list)
+        self.received = []
+
+    def respond(self, request, *responses):
+        """Respond to a request with one or more datagrams.
+
+        :param bytes request: the exact request datagram to respond to.
+        :param bytes responses: the datagrams to send back to the client.
+        """
+        with self.lock:
+            self.responses[request].extend(responses)